@@ -25,6 +25,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "django_filters",
@@ -36,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "library.metrics.RequestMetricsMiddleware",
+    "library.routers.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -101,6 +104,45 @@ DATABASES = {
     }
 }
 
+# реплики основной базы для чтения (library.routers): DATABASE_REPLICA_HOSTS - адреса "хост[:порт]" через запятую,
+# остальные параметры подключения - как у default. В тестах реплики - зеркала default.
+REPLICA_DATABASES = []
+for number, address in enumerate(
+    filter(None, os.getenv("DATABASE_REPLICA_HOSTS", "").split(",")), start=1
+):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append(f"replica{number}")
+DATABASE_ROUTERS = ["library.routers.ReplicaRouter"]
+# время, в течение которого клиент после изменения данных читает основную базу, сек.
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", 5))
+
+# кеш (ответы каталога, роли пользователей); без CACHE_REDIS_URL - локальный кеш процесса
+if os.getenv("CACHE_REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("CACHE_REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# время хранения ответов каталога (книги и авторы) в кеше, сек.
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", 300))
+
+# конфигурация полнотекстового поиска PostgreSQL для каталога
+CATALOG_SEARCH_CONFIG = os.getenv("CATALOG_SEARCH_CONFIG", "russian")
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -139,7 +181,7 @@ EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -148,6 +190,13 @@ REST_FRAMEWORK = {
     "DATE_FORMAT": "%d-%m-%Y",
 }
 
+# время хранения ролей пользователя в общем кеше, сек. (0 - роли вычисляются заново в каждом запросе)
+ROLES_CACHE_TIMEOUT = int(os.getenv("ROLES_CACHE_TIMEOUT", 0))
+
+# доля запросов, профилируемых library.metrics (0 - выключено), и токен доступа к метрикам
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv("REQUEST_METRICS_SAMPLE_RATE", 1))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -164,9 +213,21 @@ CELERY_BEAT_SCHEDULE = {
         "task": "library.tasks.send_mail_return_books",
         "schedule": timedelta(minutes=1),
     },
+    # Пересчет статистики движения книг для отчетов
+    "circulation_statistics": {
+        "task": "library.tasks.update_circulation_statistics",
+        "schedule": timedelta(minutes=5),
+    },
+    # Очистка журнала напоминаний о возврате за прошедшие дни
+    "prune_reminders": {
+        "task": "library.tasks.prune_reminders",
+        "schedule": timedelta(hours=1),
+    },
 }
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 60 * 60
+# допустимое время выполнения задачи, которой нет в расписании beat, сек. (library.metrics)
+TASK_SLOW_SECONDS = float(os.getenv("TASK_SLOW_SECONDS", 300))
 
 CORS_ALLOWED_ORIGINS = [
     "https://read-only.example.com",
@@ -186,3 +247,10 @@ EMAIL_USE_SSL = os.getenv("EMAIL_USE_SSL", False) == "True"
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_URL = os.getenv("TELEGRAM_URL")
+TELEGRAM_MAX_WORKERS = int(os.getenv("TELEGRAM_MAX_WORKERS", 8))
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", 5))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", 10))
+# ограничения Телеграма: сообщений в секунду всего и интервал между сообщениями в один чат (сек.)
+TELEGRAM_RATE_LIMIT = float(os.getenv("TELEGRAM_RATE_LIMIT", 30))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", 1))
+TELEGRAM_RETRIES = int(os.getenv("TELEGRAM_RETRIES", 3))
@@ -0,0 +1,73 @@
+# Асинхронные представления чтения (config.asgi). DRF выполняет представления только синхронно, поэтому
+# AsyncReadMixin заменяет диспетчеризацию запроса асинхронной: аутентификация, права, фильтры и сериализаторы
+# DRF остаются теми же, что и в синхронных представлениях, а страница и объект выбираются асинхронным
+# интерфейсом ORM (acount, aget, async for). Под ASGI такой запрос не занимает поток на все время обработки.
+# Шаги, которые могут обратиться к БД синхронно (загрузка пользователя и его ролей при проверке прав,
+# проверка значений фильтров), выполняются через sync_to_async.
+
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework.response import Response
+
+
+class AsyncReadMixin:
+    """Асинхронный GET для GenericAPIView: список (без параметра lookup в URL) или объект."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def get(self, request, *args, **kwargs):
+        if (self.lookup_url_kwarg or self.lookup_field) in kwargs:
+            return await self.aretrieve(request, *args, **kwargs)
+        return await self.alist(request, *args, **kwargs)
+
+    async def afilter_queryset(self):
+        return await sync_to_async(lambda: self.filter_queryset(self.get_queryset()))()
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset()
+        page = None
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is None:
+            objects = [obj async for obj in queryset]
+            return Response(self.get_serializer(objects, many=True).data)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    async def aget_object(self):
+        """Как GenericAPIView.get_object: объект по параметру URL или 404, затем проверка прав на объект."""
+        queryset = await self.afilter_queryset()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (queryset.model.DoesNotExist, ValidationError, TypeError, ValueError):
+            raise Http404
+        await sync_to_async(self.check_object_permissions)(self.request, obj)
+        return obj
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(await self.aget_object()).data)
@@ -0,0 +1,180 @@
+# Кеш ответов каталога (книги и авторы). Чтение каталога - основная нагрузка на API, а меняется каталог
+# только при операциях по библиотеке (счетчики книг) и редактировании книг и авторов.
+# Ответ на retrieve хранится под ключом с версией объекта, при изменении объекта версия удаляется и при следующем
+# чтении создается новая. Запрос, прочитавший объект до фиксации изменения, сохраняет ответ под старой версией,
+# которая больше не читается. Версия - время создания в наносекундах, поэтому вытесненная из кеша версия
+# не совпадет с версией старых ответов.
+# Ответы на list (страницы, фильтры, поиск) хранятся под ключом с номером поколения списка: перебрать все варианты
+# запроса нельзя, поэтому при изменении любой книги (автора) номер поколения увеличивается и старые ответы
+# перестают использоваться, а затем вытесняются по времени хранения.
+# Счетчики попаданий и промахов хранятся в том же кеше и доступны библиотекарю (CatalogCacheStatsApiView).
+# AsyncCatalogCacheMixin - то же кеширование для асинхронных представлений (library.asyncviews).
+
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+CATALOG_RESOURCES = ("books", "authors")
+
+
+def generation_key(resource):
+    return f"catalog:{resource}:generation"
+
+
+def version_key(resource, pk):
+    return f"catalog:{resource}:version:{pk}"
+
+
+def detail_key(resource, pk):
+    """Ключ ответа retrieve: объект и его текущая версия."""
+    version = cache.get_or_set(version_key(resource, pk), time.time_ns, timeout=None)
+    return f"catalog:{resource}:detail:{pk}:{version}"
+
+
+async def adetail_key(resource, pk):
+    version = await cache.aget_or_set(
+        version_key(resource, pk), time.time_ns, timeout=None
+    )
+    return f"catalog:{resource}:detail:{pk}:{version}"
+
+
+def stats_key(resource, result):
+    return f"catalog:{resource}:stats:{result}"
+
+
+def list_key(resource, request):
+    """Ключ страницы списка: поколение списка и полный адрес запроса (страница, фильтры, поиск, сортировка)."""
+    generation = cache.get_or_set(generation_key(resource), 1, timeout=None)
+    uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"catalog:{resource}:list:{generation}:{uri}"
+
+
+async def alist_key(resource, request):
+    generation = await cache.aget_or_set(generation_key(resource), 1, timeout=None)
+    uri = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f"catalog:{resource}:list:{generation}:{uri}"
+
+
+def count(resource, result):
+    """Увеличение счетчика попаданий (hit) или промахов (miss) кеша каталога."""
+    key = stats_key(resource, result)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # счетчика еще нет (или он вытеснен)
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def catalog_cache_stats():
+    """Счетчики попаданий и промахов кеша каталога по ресурсам."""
+    keys = [
+        stats_key(resource, result)
+        for resource in CATALOG_RESOURCES
+        for result in ("hit", "miss")
+    ]
+    values = cache.get_many(keys)
+    stats = {}
+    for resource in CATALOG_RESOURCES:
+        hit = values.get(stats_key(resource, "hit"), 0)
+        miss = values.get(stats_key(resource, "miss"), 0)
+        stats[resource] = {
+            "hit": hit,
+            "miss": miss,
+            "hit_ratio": round(hit / (hit + miss), 4) if hit + miss else None,
+        }
+    return stats
+
+
+def invalidate_catalog(resource, pks=()):
+    """Сброс кеша каталога после фиксации транзакции: версии объектов pks (их ответы retrieve) и все страницы
+    списка.
+    До фиксации параллельный запрос может снова закешировать старые данные, поэтому сброс откладывается.
+    """
+    pks = list(pks)
+
+    def invalidate():
+        if pks:
+            cache.delete_many([version_key(resource, pk) for pk in pks])
+        try:
+            cache.incr(generation_key(resource))
+        except ValueError:
+            # поколение еще не создано - закешированных страниц списка нет
+            pass
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_books(pks=()):
+    invalidate_catalog("books", pks)
+
+
+def invalidate_authors(pks=(), book_pks=()):
+    """Имя автора выводится в книгах, поэтому вместе с автором сбрасываются и его книги."""
+    invalidate_catalog("authors", pks)
+    invalidate_books(book_pks)
+
+
+class CatalogCacheMixin:
+    """Кеширование ответов list и retrieve набора представлений каталога.
+    Права доступа проверяются до обращения к кешу, ответ не зависит от пользователя."""
+
+    cache_resource = None
+
+    def cached_response(self, key, get_response):
+        data = cache.get(key)
+        if data is not None:
+            count(self.cache_resource, "hit")
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+        count(self.cache_resource, "miss")
+        response = get_response()
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            list_key(self.cache_resource, request),
+            lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            detail_key(
+                self.cache_resource, kwargs[self.lookup_url_kwarg or self.lookup_field]
+            ),
+            lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs),
+        )
+
+
+class AsyncCatalogCacheMixin:
+    """Кеширование ответов асинхронного GET (список или объект) представления каталога, как в CatalogCacheMixin."""
+
+    cache_resource = None
+
+    async def get(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in kwargs:
+            key = await adetail_key(self.cache_resource, kwargs[lookup_url_kwarg])
+        else:
+            key = await alist_key(self.cache_resource, request)
+        data = await cache.aget(key)
+        if data is not None:
+            await sync_to_async(count)(self.cache_resource, "hit")
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+        await sync_to_async(count)(self.cache_resource, "miss")
+        response = await super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            await cache.aset(key, response.data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        response["X-Cache"] = "MISS"
+        return response
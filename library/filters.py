@@ -0,0 +1,18 @@
+from django_filters import rest_framework as filters
+
+from library.models import Books
+
+
+class BooksFilter(filters.FilterSet):
+    """Фильтры каталога книг. available=true - книги, которые можно выдать (есть в наличии)."""
+
+    available = filters.BooleanFilter(method="filter_available", label="в наличии")
+
+    class Meta:
+        model = Books
+        fields = ("author", "genre", "name", "barcode")
+
+    def filter_available(self, queryset, name, value):
+        if value:
+            return queryset.filter(quantity_available__gt=0)
+        return queryset.filter(quantity_available__lte=0)
@@ -0,0 +1,235 @@
+# Нагрузочный замер основных точек API тестовым клиентом Django (без сетевого сервера, но с полной обработкой
+# запроса: middleware, аутентификация JWT, права, сериализаторы, запросы к БД).
+# Для каждой точки замеряются задержки (p50, p95, p99, среднее), пропускная способность (запросов в секунду
+# последовательного клиента), количество запросов к БД на запрос и количество ответов с ошибкой.
+# Отчет сохраняется в JSON (--output) для сравнения между версиями, --compare выводит изменение p95
+# относительно ранее сохраненного отчета.
+# Все запросы выполняются в транзакции, которая в конце откатывается, поэтому данные в базе не меняются
+# (кеш каталога после отката сбрасывается). Данные для замера создает generate_library.
+
+import json
+import platform
+import random
+import time
+from datetime import datetime, timezone
+from statistics import mean, quantiles
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from library.cache import invalidate_authors
+from library.models import Books, Lending
+from users.models import Users
+from users.permissions import LIBRARIAN_GROUP
+
+OPERATIONS = (
+    "issuance",
+    "return",
+    "issuance",
+    "loss",
+    "write_off",
+    "arrival",
+    "inventory",
+)
+
+
+def latency_summary(durations, statuses):
+    """Количество запросов и ответов с ошибкой, перцентили и среднее задержек (durations - в секундах)."""
+    durations = [duration * 1000 for duration in durations]
+    cuts = quantiles(durations, n=100, method="inclusive")
+    return {
+        "requests": len(durations),
+        "errors": sum(status >= 400 for status in statuses),
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+        "mean_ms": round(mean(durations), 3),
+    }
+
+
+class Rollback(Exception):
+    """Исключение для отката транзакции замера."""
+
+
+class Command(BaseCommand):
+    help = "Замер задержек, пропускной способности и запросов к БД основных точек API."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=200,
+            help="количество запросов к каждой точке (циклов операций для lending/create/)",
+        )
+        parser.add_argument(
+            "--password",
+            default="reader",
+            help="пароль библиотекаря и читателей (generate_library --password)",
+        )
+        parser.add_argument("--output", help="файл отчета JSON")
+        parser.add_argument("--compare", help="отчет JSON предыдущего замера")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 2:
+            raise CommandError("Для расчета перцентилей нужно не меньше двух запросов.")
+        self.random = random.Random(options["seed"])
+        self.iterations = options["iterations"]
+        self.password = options["password"]
+        self.client = Client()
+        self.results = {}
+        self.librarian = (
+            Users.objects.filter(groups__name=LIBRARIAN_GROUP).order_by("pk").first()
+        )
+        self.readers = list(
+            Users.objects.exclude(groups__name=LIBRARIAN_GROUP)
+            .order_by("pk")
+            .values_list("pk", "email")[:1000]
+        )
+        if self.librarian is None or not self.readers:
+            raise CommandError(
+                "Нет библиотекаря или читателей, заполните базу командой generate_library."
+            )
+        dataset = {
+            "readers": Users.objects.count(),
+            "books": Books.objects.count(),
+            "lending": Lending.objects.count(),
+        }
+
+        try:
+            with transaction.atomic():
+                token = self.login(self.librarian.email)
+                self.auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+                self.bench_login()
+                self.bench_lending_create()
+                self.bench_list("lending_list", reverse("library:lending_list"))
+                self.bench_list("books_list", reverse("books-list"))
+                raise Rollback
+        except Rollback:
+            pass
+        # ответы каталога, закешированные внутри отмененной транзакции, больше не используются
+        invalidate_authors()
+
+        report = {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "iterations": self.iterations,
+            "dataset": dataset,
+            "endpoints": {
+                name: self.summary(samples) for name, samples in self.results.items()
+            },
+        }
+        previous = None
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as file:
+                previous = json.load(file)["endpoints"]
+        self.print_report(report["endpoints"], previous)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def request(self, name, method, url, data=None, **extra):
+        """Запрос к API с замером времени и запросов к БД. Возвращает ответ."""
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, data, **extra)
+            duration = time.perf_counter() - started
+        self.results.setdefault(name, []).append(
+            (duration, len(queries), response.status_code)
+        )
+        return response
+
+    def login(self, email):
+        response = self.client.post(
+            reverse("users:login"), {"email": email, "password": self.password}
+        )
+        if response.status_code != 200:
+            raise CommandError(f"Не удалось войти как {email}: {response.content!r}")
+        return response.json()["access"]
+
+    def bench_login(self):
+        for _ in range(self.iterations):
+            _, email = self.random.choice(self.readers)
+            self.request(
+                "login",
+                "post",
+                reverse("users:login"),
+                {"email": email, "password": self.password},
+            )
+
+    def bench_lending_create(self):
+        """Циклы операций по одной книге: выдача, возврат, выдача, утеря, списание, поступление,
+        инвентаризация. Количество книг в библиотеке после цикла не меняется."""
+        url = reverse("library:lending_create")
+        books = list(
+            Books.objects.filter(quantity_available__gte=2)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:1000]
+        )
+        if not books:
+            raise CommandError("Нет книг, доступных для выдачи.")
+        for _ in range(self.iterations):
+            book = self.random.choice(books)
+            reader = self.free_reader(book)
+            for operation in OPERATIONS:
+                self.request(
+                    f"lending_create:{operation}",
+                    "post",
+                    url,
+                    {
+                        "user": reader,
+                        "book": book,
+                        "operation": operation,
+                        "arrival_quantity": 1,
+                        "issued_quantity": 0,
+                    },
+                    **self.auth,
+                )
+
+    def free_reader(self, book):
+        """Читатель, у которого нет невозвращенной книги book."""
+        while True:
+            reader, _ = self.random.choice(self.readers)
+            if not Lending.objects.filter(
+                user_id=reader, book_id=book, operation="issuance", closing__isnull=True
+            ).exists():
+                return reader
+
+    def bench_list(self, name, url):
+        """Случайные страницы списка (количество страниц - по ответу на первую страницу)."""
+        first = self.request(name, "get", url, **self.auth).json()
+        pages = -(-first["count"] // max(len(first["results"]), 1)) or 1
+        for _ in range(self.iterations - 1):
+            self.request(
+                name, "get", url, {"page": self.random.randint(1, pages)}, **self.auth
+            )
+
+    @staticmethod
+    def summary(samples):
+        durations = [duration for duration, _, _ in samples]
+        return {
+            **latency_summary(durations, [status for _, _, status in samples]),
+            "throughput_rps": round(len(durations) / sum(durations), 1),
+            "queries_per_request": round(mean(queries for _, queries, _ in samples), 2),
+        }
+
+    def print_report(self, endpoints, previous):
+        self.stdout.write(
+            f"{'точка':<26} {'запросов':>8} {'ошибок':>6} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} "
+            f"{'запр./с':>8} {'SQL':>6}" + (f" {'p95 было':>9}" if previous else "")
+        )
+        for name, result in endpoints.items():
+            line = (
+                f"{name:<26} {result['requests']:>8} {result['errors']:>6} {result['p50_ms']:>9.2f} "
+                f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['throughput_rps']:>8.1f} "
+                f"{result['queries_per_request']:>6.1f}"
+            )
+            if previous and name in previous:
+                line += f" {previous[name]['p95_ms']:>9.2f}"
+            self.stdout.write(line)
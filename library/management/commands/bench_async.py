@@ -0,0 +1,276 @@
+# Сравнение асинхронных представлений чтения (library.asyncviews, путь ASGI) с синхронными (путь WSGI)
+# под нагрузкой одновременных медленных клиентов (например, читатели с мобильных устройств в плохой сети).
+# Путь WSGI: запросы обрабатывает пул из --threads потоков (как потоки синхронного сервера), медленный клиент
+# занимает поток на время передачи ответа (--delay). Путь ASGI: запросы обрабатываются в одном цикле событий,
+# передача ответа медленному клиенту - ожидание без потока. Синхронные части запроса (аутентификация, права,
+# фильтры, запросы ORM) Django выполняет в потоке sync_to_async, как и сервер ASGI (ThreadSensitiveContext на
+# запрос). Соединение с БД закрывается после каждого запроса на обоих путях (CONN_MAX_AGE = 0).
+# Оба пути выполняют один и тот же набор запросов (страницы списков и объекты книг, авторов и журнала),
+# для каждой точки замеряются задержки, видимые клиенту (с ожиданием в очереди), для пути - пропускная
+# способность и наибольшее количество потоков процесса. Отчет сохраняется в JSON (--output).
+# Запросы только читают данные, кеш каталога сбрасывается перед каждым путем. Данные создает generate_library.
+
+import asyncio
+import json
+import platform
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.management import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from library.cache import invalidate_authors
+from library.management.commands.bench_api import latency_summary
+from library.models import Authors, Books, Lending
+from users.models import Users
+from users.permissions import LIBRARIAN_GROUP
+
+# точка замера: (имя URL синхронного представления, имя URL асинхронного представления)
+ENDPOINTS = {
+    "books_list": ("books-list", "library:async_books_list"),
+    "books_retrieve": ("books-detail", "library:async_books_retrieve"),
+    "authors_list": ("authors-list", "library:async_authors_list"),
+    "authors_retrieve": ("authors-detail", "library:async_authors_retrieve"),
+    "lending_list": ("library:lending_list", "library:async_lending_list"),
+    "lending_retrieve": ("library:lending_retrieve", "library:async_lending_retrieve"),
+}
+PAGE_SIZE = 5  # размер страницы списков по умолчанию (library.paginations)
+MAX_PAGE = 200  # номера страниц выбираются из первых MAX_PAGE страниц
+
+
+class ThreadsMonitor:
+    """Наибольшее количество потоков процесса за время замера (сверх потоков до начала замера)."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.baseline = threading.active_count()
+        self.peak = self.baseline
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    @property
+    def threads(self):
+        return self.peak - self.baseline - 1  # без потока самого монитора
+
+
+class Command(BaseCommand):
+    help = "Сравнение асинхронных (ASGI) и синхронных (WSGI) представлений чтения при одновременных клиентах."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=500, help="количество запросов на путь"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=50,
+            help="количество одновременных клиентов",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="количество потоков синхронного сервера (путь WSGI)",
+        )
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=50,
+            help="время передачи ответа медленному клиенту, мс",
+        )
+        parser.add_argument(
+            "--password",
+            default="reader",
+            help="пароль библиотекаря (generate_library --password)",
+        )
+        parser.add_argument("--output", help="файл отчета JSON")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options["requests"] < 2:
+            raise CommandError("Для расчета перцентилей нужно не меньше двух запросов.")
+        self.concurrency = options["concurrency"]
+        self.delay = options["delay"] / 1000
+        librarian = (
+            Users.objects.filter(groups__name=LIBRARIAN_GROUP).order_by("pk").first()
+        )
+        if librarian is None:
+            raise CommandError(
+                "Нет библиотекаря, заполните базу командой generate_library."
+            )
+        response = Client().post(
+            reverse("users:login"),
+            {"email": librarian.email, "password": options["password"]},
+        )
+        if response.status_code != 200:
+            raise CommandError(
+                f"Не удалось войти как {librarian.email}: {response.content!r}"
+            )
+        self.headers = {"Authorization": f"Bearer {response.json()['access']}"}
+        plan = self.plan(random.Random(options["seed"]), options["requests"])
+        dataset = {
+            "books": Books.objects.count(),
+            "authors": Authors.objects.count(),
+            "lending": Lending.objects.count(),
+        }
+        close_old_connections()
+
+        self.threads = options["threads"]
+        report = {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "requests": len(plan),
+            "concurrency": self.concurrency,
+            "threads": self.threads,
+            "delay_ms": options["delay"],
+            "dataset": dataset,
+            "paths": {
+                "wsgi": self.bench(plan, self.wsgi_server),
+                "asgi": self.bench(plan, self.asgi_server),
+            },
+        }
+        self.print_report(report["paths"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def plan(self, rng, count):
+        """Запросы замера: (точка, параметры URL, строка запроса) по всем точкам поровну."""
+        pages = {
+            "books_list": Books.objects.count(),
+            "authors_list": Authors.objects.count(),
+            "lending_list": Lending.objects.count(),
+        }
+        pks = {
+            "books_retrieve": list(
+                Books.objects.order_by("-pk").values_list("pk", flat=True)[:1000]
+            ),
+            "authors_retrieve": list(
+                Authors.objects.order_by("-pk").values_list("pk", flat=True)[:1000]
+            ),
+            "lending_retrieve": list(
+                Lending.objects.order_by("-pk").values_list("pk", flat=True)[:1000]
+            ),
+        }
+        if not all(pks.values()):
+            raise CommandError(
+                "Нет книг, авторов или операций, заполните базу командой generate_library."
+            )
+        names = list(ENDPOINTS)
+        plan = []
+        for number in range(count):
+            name = names[number % len(names)]
+            if name in pages:
+                last = min(-(-pages[name] // PAGE_SIZE), MAX_PAGE) or 1
+                plan.append((name, (), f"?page={rng.randint(1, last)}"))
+            else:
+                plan.append((name, (rng.choice(pks[name]),), ""))
+        rng.shuffle(plan)
+        return plan
+
+    def bench(self, plan, server):
+        """Замер одного пути: клиенты (не больше --concurrency одновременно) выполняют запросы plan."""
+        # ответы каталога, закешированные другим путем, не используются
+        invalidate_authors()
+        samples = {}
+
+        async def client(request, semaphore):
+            async with semaphore:
+                started = time.perf_counter()
+                status = await server(request)
+                samples.setdefault(request[0], []).append(
+                    (time.perf_counter() - started, status)
+                )
+
+        async def run():
+            semaphore = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*(client(request, semaphore) for request in plan))
+
+        self.async_client = AsyncClient()
+        self.local = threading.local()
+        with ThreadPoolExecutor(self.threads) as self.pool, ThreadsMonitor() as monitor:
+            started = time.perf_counter()
+            asyncio.run(run())
+            duration = time.perf_counter() - started
+        return {
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(plan) / duration, 1),
+            "peak_threads": monitor.threads,
+            "endpoints": {
+                name: latency_summary(
+                    [duration for duration, _ in samples[name]],
+                    [status for _, status in samples[name]],
+                )
+                for name in ENDPOINTS
+            },
+        }
+
+    def url(self, request, is_async):
+        name, args, query = request
+        return reverse(ENDPOINTS[name][is_async], args=args) + query
+
+    async def wsgi_server(self, request):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, self.wsgi_request, request)
+
+    def wsgi_request(self, request):
+        """Запрос к синхронному представлению в потоке сервера, поток занят и передачей ответа."""
+        if not hasattr(self.local, "client"):
+            self.local.client = Client()
+        try:
+            response = self.local.client.get(
+                self.url(request, False), headers=self.headers
+            )
+            time.sleep(self.delay)
+            return response.status_code
+        finally:
+            close_old_connections()
+
+    async def asgi_server(self, request):
+        """Запрос к асинхронному представлению, передача ответа клиенту - ожидание в цикле событий."""
+        async with ThreadSensitiveContext():
+            try:
+                response = await self.async_client.get(
+                    self.url(request, True), headers=self.headers
+                )
+            finally:
+                await sync_to_async(close_old_connections)()
+        await asyncio.sleep(self.delay)
+        return response.status_code
+
+    def print_report(self, paths):
+        self.stdout.write(
+            f"{'путь':<5} {'точка':<18} {'запросов':>8} {'ошибок':>6} {'p50, мс':>9} {'p95, мс':>9} "
+            f"{'p99, мс':>9}"
+        )
+        for path, result in paths.items():
+            for name, endpoint in result["endpoints"].items():
+                self.stdout.write(
+                    f"{path:<5} {name:<18} {endpoint['requests']:>8} {endpoint['errors']:>6} "
+                    f"{endpoint['p50_ms']:>9.2f} {endpoint['p95_ms']:>9.2f} {endpoint['p99_ms']:>9.2f}"
+                )
+            self.stdout.write(
+                f"{path:<5} всего: {result['throughput_rps']:.1f} запр./с, "
+                f"потоков: {result['peak_threads']}, {result['duration_s']:.2f} с"
+            )
@@ -0,0 +1,173 @@
+# Замер времени основных выборок из журнала операций (Lending) на журналах разного размера с индексами
+# и без них. Журнал заполняется на стороне БД (generate_series) внутри транзакции, которая в конце откатывается,
+# поэтому данные в базе не меняются. Индексы на время замера удаляются (DROP INDEX блокирует таблицу до отката),
+# запускать команду следует на отдельной (копии) базы данных, а не на рабочей.
+
+import random
+import time
+from statistics import median
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from library.models import Authors, Books, Lending
+from users.models import Users
+
+
+class Rollback(Exception):
+    """Исключение для отката транзакции замера."""
+
+
+class Command(BaseCommand):
+    help = "Замер выборок из журнала операций на журналах от 10 тыс. до 10 млн. строк с индексами и без них."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            nargs="+",
+            type=int,
+            default=[10_000, 100_000, 1_000_000, 10_000_000],
+            help="размеры журнала операций",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="количество повторов выборки"
+        )
+        parser.add_argument(
+            "--readers", type=int, default=10_000, help="количество читателей"
+        )
+        parser.add_argument("--books", type=int, default=2_000, help="количество книг")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'строк':>10} {'выборка':<20} {'с индексами, мс':>16} {'без индексов, мс':>17}"
+        )
+        try:
+            with transaction.atomic():
+                users, books = self.create_catalog(options["readers"], options["books"])
+                size = 0
+                for new_size in sorted(options["sizes"]):
+                    self.fill_journal(users, books, size, new_size)
+                    size = new_size
+                    with_indexes = self.measure(users, books, size, options["repeat"])
+                    without_indexes = self.measure_without_indexes(
+                        users, books, size, options["repeat"]
+                    )
+                    for lookup, duration in with_indexes.items():
+                        self.stdout.write(
+                            f"{size:>10} {lookup:<20} {duration:>16.3f} {without_indexes[lookup]:>17.3f}"
+                        )
+                raise Rollback
+        except Rollback:
+            pass
+
+    @staticmethod
+    def create_catalog(readers, books):
+        """Создаем читателей, автора и книги для журнала операций."""
+        users = Users.objects.bulk_create(
+            Users(email=f"bench{number}@bench.local", password="")
+            for number in range(readers)
+        )
+        author = Authors.objects.create(author="bench author")
+        books = Books.objects.bulk_create(
+            Books(name=f"bench book {number}", author=author) for number in range(books)
+        )
+        return [user.pk for user in users], [book.pk for book in books]
+
+    @staticmethod
+    def fill_journal(users, books, start, stop):
+        """Дополняем журнал операций до stop строк. Половина строк - выдачи (из них 1% не возвращен),
+        половина - возвраты, даты равномерно распределены за десять лет. Возвращенная выдача ссылается на
+        следующую за ней операцию возврата."""
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT coalesce(max(id), 0) FROM {Lending._meta.db_table}")
+            last_id = cursor.fetchone()[0]
+            cursor.execute(
+                f"""
+                INSERT INTO {Lending._meta.db_table} (
+                    user_id, book_id, operation, date_event,
+                    is_return, is_loss, is_write_off, arrival_quantity, issued_quantity
+                )
+                SELECT
+                    (%(users)s::bigint[])[1 + (g * 7919) %% %(users_count)s],
+                    (%(books)s::bigint[])[1 + (g * 104729) %% %(books_count)s],
+                    CASE WHEN g %% 2 = 0 THEN 'issuance' ELSE 'return' END,
+                    current_date - (g %% 3650)::integer,
+                    g %% 2 = 0 AND g %% 100 <> 0, false, false, 0, 0
+                FROM generate_series(%(start)s::bigint + 1, %(stop)s::bigint) AS g
+                """,
+                {
+                    "users": users,
+                    "users_count": len(users),
+                    "books": books,
+                    "books_count": len(books),
+                    "start": start,
+                    "stop": stop,
+                },
+            )
+            cursor.execute(
+                f"""
+                UPDATE {Lending._meta.db_table} SET closing_id = id + 1
+                WHERE id > %s AND operation = 'issuance' AND is_return
+                """,
+                [last_id],
+            )
+            cursor.execute(f"ANALYZE {Lending._meta.db_table}")
+
+    @staticmethod
+    def measure(users, books, size, repeat):
+        """Медиана времени выборок в миллисекундах."""
+        lookups = {
+            # проверка повторной выдачи, поиск выдачи при возврате и утере
+            "open_issuance": lambda: Lending.objects.filter(
+                user_id=random.choice(users),
+                operation="issuance",
+                book_id=random.choice(books),
+                closing__isnull=True,
+            ).exists(),
+            # невозвращенные выдачи для напоминаний о возврате
+            "open_issuances_all": lambda: Lending.objects.filter(
+                operation="issuance", closing__isnull=True
+            ).count(),
+            # операция вместе с закрытой ею выдачей при удалении возврата
+            "closing_operation": lambda: Lending.objects.select_related(
+                "closed_issuance"
+            )
+            .filter(pk__gte=random.randint(1, size))
+            .first(),
+        }
+        durations = {}
+        for lookup, query in lookups.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                query()
+                timings.append((time.perf_counter() - started) * 1000)
+            durations[lookup] = median(timings)
+        return durations
+
+    def measure_without_indexes(self, users, books, size, repeat):
+        """Замер после удаления индексов журнала (удаление откатывается вместе с точкой сохранения).
+        Удаляется и ограничение уникальности closing (OneToOneField): его индекс используется выборкой
+        closing_operation."""
+        table = Lending._meta.db_table
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in Lending._meta.indexes:
+                        cursor.execute(f"DROP INDEX {index.name}")
+                    # отложенные проверки внешних ключей после заполнения журнала не дают изменить таблицу
+                    cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+                    closing = [Lending._meta.get_field("closing").column]
+                    constraints = connection.introspection.get_constraints(
+                        cursor, table
+                    )
+                    for name, constraint in constraints.items():
+                        if constraint["unique"] and constraint["columns"] == closing:
+                            cursor.execute(
+                                f"ALTER TABLE {table} DROP CONSTRAINT {name}"
+                            )
+                    cursor.execute(f"ANALYZE {table}")
+                durations = self.measure(users, books, size, repeat)
+                raise Rollback
+        except Rollback:
+            return durations
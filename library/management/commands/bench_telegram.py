@@ -0,0 +1,57 @@
+# Замер рассылки сообщений в Телеграм на локальной заглушке Telegram Bot API (library.stubs.TelegramStub):
+# последовательная отправка отдельными запросами без переиспользования соединений против TelegramClient.
+
+import time
+
+import requests
+from django.core.management import BaseCommand
+
+from library.services import TelegramClient
+from library.stubs import TelegramStub
+
+
+class Command(BaseCommand):
+    help = "Замер рассылки сообщений в Телеграм на локальной заглушке Telegram Bot API."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--messages", type=int, default=200, help="количество сообщений"
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.05,
+            help="время ответа заглушки, сек.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=8, help="количество потоков клиента"
+        )
+
+    def handle(self, *args, **options):
+        messages = [
+            (str(chat), f"Сообщение {chat}") for chat in range(options["messages"])
+        ]
+        with TelegramStub(latency=options["latency"]) as stub:
+            started = time.perf_counter()
+            for chat_id, message in messages:
+                requests.get(
+                    f"{stub.url}TOKEN/sendMessage",
+                    params={"text": message, "chat_id": chat_id},
+                )
+            self.report("requests.get", len(messages), started)
+
+            client = TelegramClient(
+                base_url=stub.url,
+                token="TOKEN",
+                max_workers=options["workers"],
+                rate_limit=10_000,
+            )
+            started = time.perf_counter()
+            client.send_messages(messages)
+            self.report("TelegramClient", len(messages), started)
+
+    def report(self, name, count, started):
+        duration = time.perf_counter() - started
+        self.stdout.write(
+            f"{name:<16} {count} сообщений за {duration:.2f} с ({count / duration:.1f} в секунду)"
+        )
@@ -0,0 +1,215 @@
+# Заполнение базы данных синтетическими данными для нагрузочного тестирования (bench_api): читатели, авторы,
+# книги и история операций по библиотеке за несколько лет.
+# История каждой книги моделируется по дням: инвентаризация в начале периода, выдачи свободных экземпляров
+# читателям, которые еще не держат эту книгу, возвраты через одну-восемь недель, редкие утери, списания
+# и поступления. Невозвращенные к концу периода выдачи остаются открытыми. Счетчики книг вычисляются по той же
+# истории, поэтому сверка (reconcile_books) расхождений не находит.
+# Данные записываются пачками книг в отдельных транзакциях (bulk_create), id операций берутся из
+# последовательности заранее, чтобы связать выдачу с закрывшей ее операцией до записи.
+# Генератор детерминирован: с тем же --seed на пустой базе создаются те же данные.
+
+import heapq
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from library.cache import invalidate_authors
+from library.models import Authors, Books, Lending
+from library.search import update_search_vectors
+from library.services import reserve_ids
+from library.statistics import record_circulation_changes
+from users.models import Users
+from users.permissions import LIBRARIAN_GROUP
+
+GENRES = [genre for genre, _ in Books.GENRE]
+WORDS = (
+    "остров звезда море путь тайна город ветер сад дорога берег капитан лес "
+    "зима ночь огонь песня край мир дом река небо странник время память"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Заполнение базы синтетическими читателями, авторами, книгами и историей операций."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--readers", type=int, default=10_000, help="количество читателей"
+        )
+        parser.add_argument(
+            "--authors", type=int, default=1_000, help="количество авторов"
+        )
+        parser.add_argument("--books", type=int, default=20_000, help="количество книг")
+        parser.add_argument(
+            "--years", type=int, default=5, help="продолжительность истории, лет"
+        )
+        parser.add_argument(
+            "--issuances",
+            type=float,
+            default=0.05,
+            help="вероятность выдачи свободного экземпляра книги за день",
+        )
+        parser.add_argument(
+            "--prefix",
+            default="gen",
+            help="префикс e-mail читателей, имен авторов и названий книг",
+        )
+        parser.add_argument(
+            "--password",
+            default="reader",
+            help="пароль читателей и библиотекаря (<prefix>-librarian@example.com)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="количество книг, история которых записывается в одной транзакции",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.random = random.Random(options["seed"])
+        self.prefix = options["prefix"]
+        self.issuance_rate = options["issuances"]
+        self.today = date.today()
+        self.start = self.today - timedelta(days=365 * options["years"])
+
+        password = make_password(options["password"])  # хеш один на всех читателей
+        librarian = Users.objects.create(
+            email=f"{self.prefix}-librarian@example.com",
+            password=password,
+            reader_name="Библиотекарь",
+            is_staff=True,
+        )
+        Group.objects.get_or_create(name=LIBRARIAN_GROUP)[0].user_set.add(librarian)
+        self.librarian_id = librarian.pk
+        self.readers = [
+            user.pk
+            for user in Users.objects.bulk_create(
+                (
+                    Users(
+                        email=f"{self.prefix}{number}@example.com",
+                        password=password,
+                        reader_name=f"Читатель {number}",
+                    )
+                    for number in range(options["readers"])
+                ),
+                batch_size=options["batch_size"],
+            )
+        ]
+        authors = [
+            author.pk
+            for author in Authors.objects.bulk_create(
+                (
+                    Authors(author=f"{self.prefix} автор {number}")
+                    for number in range(options["authors"])
+                ),
+                batch_size=options["batch_size"],
+            )
+        ]
+
+        lendings_count = 0
+        for first in range(0, options["books"], options["batch_size"]):
+            numbers = range(first, min(first + options["batch_size"], options["books"]))
+            with transaction.atomic():
+                lendings_count += self.create_books(numbers, authors)
+            self.stdout.write(
+                f"Книг: {numbers.stop}, операций: {lendings_count}", ending="\r"
+            )
+        invalidate_authors()
+        self.stdout.write(
+            f"Создано читателей: {len(self.readers)}, авторов: {len(authors)}, книг: {options['books']}, "
+            f"операций: {lendings_count} за {time.monotonic() - started:.1f} с."
+        )
+
+    def create_books(self, numbers, authors):
+        """Книги с номерами numbers и их история. Возвращает количество созданных операций."""
+        books = Books.objects.bulk_create(
+            Books(
+                name=f"{self.prefix} книга {number}: {' '.join(self.random.sample(WORDS, 3))}",
+                author_id=self.random.choice(authors),
+                genre=self.random.choice(GENRES),
+                annotation=" ".join(self.random.choices(WORDS, k=12)),
+                quantity_all=0,
+                quantity_lending=0,
+                amount_lending=0,
+            )
+            for number in numbers
+        )
+        histories = [self.history(book) for book in books]
+        lendings = [lending for history in histories for lending in history]
+        # id нужны до записи: выдача ссылается на закрывшую ее операцию (closing)
+        for lending, pk in zip(lendings, reserve_ids(Lending, len(lendings))):
+            lending.pk = pk
+        Lending.objects.bulk_create(lendings)
+        record_circulation_changes(lendings)  # bulk_create не вызывает сигналы модели
+        Books.objects.bulk_update(
+            books, ["quantity_all", "quantity_lending", "amount_lending"]
+        )
+        update_search_vectors(Books.objects.filter(pk__in=[book.pk for book in books]))
+        return len(lendings)
+
+    def operation(self, book, day, operation, user_id=None, **fields):
+        return Lending(
+            user_id=user_id or self.librarian_id,
+            book_id=book.pk,
+            operation=operation,
+            date_event=day,
+            **fields,
+        )
+
+    def history(self, book):
+        """История операций книги по дням периода, счетчики книги изменяются вместе с историей."""
+        copies = self.random.randint(1, 8)
+        lendings = [
+            self.operation(book, self.start, "inventory", arrival_quantity=copies)
+        ]
+        book.quantity_all = copies
+        due = []  # (дата возврата, номер выдачи, выдача) невозвращенных книг
+        holders = set()
+        day = self.start
+        while day <= self.today:
+            while due and due[0][0] <= day:
+                _, _, issuance = heapq.heappop(due)
+                lost = self.random.random() < 0.01
+                # утерю, как и в API, проводит библиотекарь
+                closing = (
+                    self.operation(book, day, "loss")
+                    if lost
+                    else self.operation(book, day, "return", issuance.user_id)
+                )
+                issuance.closing = closing
+                issuance.is_return, issuance.is_loss = not lost, lost
+                holders.discard(issuance.user_id)
+                book.quantity_lending -= 1
+                if lost:
+                    book.quantity_all -= 1
+                    book.amount_lending -= 1
+                lendings.append(closing)
+            available = book.quantity_all - book.quantity_lending
+            if available and self.random.random() < self.issuance_rate * available:
+                reader = self.random.choice(self.readers)
+                if reader not in holders:
+                    issuance = self.operation(book, day, "issuance", reader)
+                    holders.add(reader)
+                    book.quantity_lending += 1
+                    book.amount_lending += 1
+                    returned = day + timedelta(days=self.random.randint(7, 56))
+                    heapq.heappush(due, (returned, len(lendings), issuance))
+                    lendings.append(issuance)
+            elif available and self.random.random() < 0.0005:
+                lendings.append(self.operation(book, day, "write_off"))
+                book.quantity_all -= 1
+            elif self.random.random() < 0.001:
+                quantity = self.random.randint(1, 3)
+                lendings.append(
+                    self.operation(book, day, "arrival", arrival_quantity=quantity)
+                )
+                book.quantity_all += quantity
+            day += timedelta(days=1)
+        return lendings
@@ -0,0 +1,288 @@
+# Загрузка каталога (авторы, книги и начальные остатки книг) из файла CSV или NDJSON (JSON, объект на строке).
+# Файл читается построчно, поэтому размер файла не ограничен памятью: в памяти держатся только авторы
+# (имя -> id, повторяющиеся в файле авторы создаются один раз) и текущая пачка книг.
+# Каждая пачка записывается в своей транзакции: авторы - bulk_create, книги и операции инвентаризации
+# (начальные остатки) - командой PostgreSQL COPY, на других СУБД или с --no-copy - bulk_create.
+# id книг и операций для COPY берутся из их последовательностей (nextval), поэтому после загрузки
+# последовательности согласованы с таблицами и параллельная работа API с каталогом не нарушается.
+# Остатки проводятся через журнал операций (инвентаризация от имени библиотекаря), как при вводе через API,
+# поэтому сверка счетчиков (reconcile_books) и статистика выдачи (library.statistics) учитывают загруженные книги.
+# Книги с названиями, уже зарегистрированными в библиотеке, и строки с ошибками пропускаются.
+#
+# Поля строки: name, author - обязательные, genre (по умолчанию story), annotation, barcode,
+# quantity - количество экземпляров, issued - из них выдано читателям (по умолчанию 0).
+
+import csv
+import json
+import time
+from datetime import date
+from io import StringIO
+from itertools import islice
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from library.cache import invalidate_books
+from library.models import Authors, Books, Lending
+from library.search import update_search_vectors
+from library.services import reserve_ids
+from library.statistics import record_circulation_changes
+from users.models import Users
+from users.permissions import LIBRARIAN_GROUP
+
+GENRES = {genre for genre, _ in Books.GENRE}
+NAME_LENGTH = Books._meta.get_field("name").max_length
+AUTHOR_LENGTH = Authors._meta.get_field("author").max_length
+BOOK_COLUMNS = (
+    "id",
+    "name",
+    "author_id",
+    "genre",
+    "annotation",
+    "barcode",
+    "quantity_all",
+    "quantity_lending",
+    "amount_lending",
+)
+LENDING_COLUMNS = (
+    "id",
+    "user_id",
+    "book_id",
+    "operation",
+    "date_event",
+    "is_return",
+    "is_loss",
+    "is_write_off",
+    "arrival_quantity",
+    "issued_quantity",
+)
+
+
+class Command(BaseCommand):
+    help = "Загрузка авторов, книг и начальных остатков книг из файла CSV или NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="файл каталога")
+        parser.add_argument(
+            "--format",
+            choices=("csv", "ndjson"),
+            help="формат файла (по умолчанию по расширению: .csv - CSV, иначе NDJSON)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="количество книг, записываемых в одной транзакции",
+        )
+        parser.add_argument(
+            "--librarian",
+            help="e-mail библиотекаря, от имени которого проводятся остатки (по умолчанию первый библиотекарь)",
+        )
+        parser.add_argument(
+            "--date",
+            type=date.fromisoformat,
+            default=None,
+            help="дата операций инвентаризации, ГГГГ-ММ-ДД (по умолчанию сегодня)",
+        )
+        parser.add_argument(
+            "--no-copy",
+            action="store_true",
+            help="записывать книги bulk_create, а не COPY",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        self.date_event = options["date"] or date.today()
+        self.use_copy = connection.vendor == "postgresql" and not options["no_copy"]
+        self.librarian_email = options["librarian"]
+        self.librarian_id = None
+        self.authors = dict(Authors.objects.values_list("author", "pk"))
+        self.created = {"books": 0, "authors": 0, "stock": 0}
+        self.skipped = 0
+
+        fmt = options["format"] or (
+            "csv" if options["path"].lower().endswith(".csv") else "ndjson"
+        )
+        started = time.monotonic()
+        read = 0
+        with open(options["path"], encoding="utf-8", newline="") as file:
+            rows = self.read_rows(file, fmt)
+            while batch := list(islice(rows, options["batch_size"])):
+                read += len(batch)
+                self.load_batch(batch)
+                if self.verbosity > 1:
+                    self.stdout.write(
+                        f"Прочитано строк: {read}, {self.rate(read, started)} строк/с"
+                    )
+        if self.created["books"]:
+            invalidate_books()
+        self.stdout.write(
+            f"Загружено книг: {self.created['books']}, авторов: {self.created['authors']}, "
+            f"операций инвентаризации: {self.created['stock']}, пропущено строк: {self.skipped}. "
+            f"Строк: {read} за {time.monotonic() - started:.1f} с ({self.rate(read, started)} строк/с)."
+        )
+
+    @staticmethod
+    def rate(rows, started):
+        return round(rows / max(time.monotonic() - started, 1e-6))
+
+    def read_rows(self, file, fmt):
+        """Строки файла в виде пар (номер строки, словарь полей)."""
+        if fmt == "csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            if not isinstance(row, dict):
+                self.skip(number, "строка не является объектом JSON")
+                continue
+            yield number, row
+
+    def skip(self, number, reason):
+        self.skipped += 1
+        self.stderr.write(f"Строка {number} пропущена: {reason}.")
+
+    def parse(self, number, row):
+        """Проверка и приведение полей строки. Возвращает словарь полей книги или None для строки с ошибкой."""
+        name = str(row.get("name") or "").strip()
+        author = str(row.get("author") or "").strip()
+        genre = str(row.get("genre") or "story").strip()
+        if not name or not author:
+            return self.skip(number, "не заполнено название книги или автор")
+        if len(name) > NAME_LENGTH or len(author) > AUTHOR_LENGTH:
+            return self.skip(number, "слишком длинное название книги или имя автора")
+        if genre not in GENRES:
+            return self.skip(number, f"неизвестный жанр '{genre}'")
+        try:
+            barcode = (
+                int(row["barcode"]) if row.get("barcode") not in (None, "") else None
+            )
+            quantity = int(row.get("quantity") or 0)
+            issued = int(row.get("issued") or 0)
+        except (TypeError, ValueError):
+            return self.skip(number, "штрихкод и количества должны быть целыми числами")
+        if (barcode is not None and barcode < 0) or not 0 <= issued <= quantity:
+            return self.skip(
+                number, "отрицательное значение или выдано больше, чем есть"
+            )
+        return {
+            "number": number,
+            "name": name,
+            "author": author,
+            "genre": genre,
+            "annotation": row.get("annotation") or None,
+            "barcode": barcode,
+            "quantity": quantity,
+            "issued": issued,
+        }
+
+    def load_batch(self, batch):
+        books = {}
+        for number, row in batch:
+            book = self.parse(number, row)
+            if book is None:
+                continue
+            if book["name"] in books:
+                self.skip(number, f"книга '{book['name']}' повторяется в файле")
+                continue
+            books[book["name"]] = book
+        with transaction.atomic():
+            for name in Books.objects.filter(name__in=books).values_list(
+                "name", flat=True
+            ):
+                self.skip(
+                    books.pop(name)["number"],
+                    f"книга '{name}' уже зарегистрирована в библиотеке",
+                )
+            if not books:
+                return
+            self.create_authors({book["author"] for book in books.values()})
+            new_books = [
+                Books(
+                    name=book["name"],
+                    author_id=self.authors[book["author"]],
+                    genre=book["genre"],
+                    annotation=book["annotation"],
+                    barcode=book["barcode"],
+                    quantity_all=book["quantity"],
+                    quantity_lending=book["issued"],
+                    amount_lending=0,
+                )
+                for book in books.values()
+            ]
+            self.save(Books, new_books, BOOK_COLUMNS)
+            lendings = [
+                Lending(
+                    user_id=self.get_librarian_id(),
+                    book_id=new_book.pk,
+                    operation="inventory",
+                    date_event=self.date_event,
+                    arrival_quantity=new_book.quantity_all,
+                    issued_quantity=new_book.quantity_lending,
+                )
+                for new_book in new_books
+                if new_book.quantity_all
+            ]
+            self.save(Lending, lendings, LENDING_COLUMNS)
+            record_circulation_changes(lendings)
+            update_search_vectors(
+                Books.objects.filter(pk__in=[new_book.pk for new_book in new_books])
+            )
+        self.created["books"] += len(new_books)
+        self.created["stock"] += len(lendings)
+
+    def create_authors(self, names):
+        """Создание авторов, которых еще нет в библиотеке (один INSERT на пачку)."""
+        new_authors = Authors.objects.bulk_create(
+            Authors(author=name) for name in names if name not in self.authors
+        )
+        for author in new_authors:
+            self.authors[author.author] = author.pk
+        self.created["authors"] += len(new_authors)
+
+    def get_librarian_id(self):
+        if self.librarian_id is None:
+            librarians = Users.objects.filter(groups__name=LIBRARIAN_GROUP)
+            if self.librarian_email:
+                librarians = librarians.filter(email=self.librarian_email)
+            self.librarian_id = (
+                librarians.order_by("pk").values_list("pk", flat=True).first()
+            )
+            if self.librarian_id is None:
+                raise CommandError(
+                    "Библиотекарь, от имени которого проводятся остатки, не найден."
+                )
+        return self.librarian_id
+
+    def save(self, model, objects, columns):
+        """Запись объектов: COPY с id из последовательности таблицы или bulk_create."""
+        if not objects:
+            return
+        if not self.use_copy:
+            model.objects.bulk_create(objects)
+            return
+        table = model._meta.db_table
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        for obj, pk in zip(objects, reserve_ids(model, len(objects))):
+            obj.pk = pk
+            # пустое значение без кавычек COPY записывает как NULL
+            writer.writerow(
+                [
+                    "" if value is None else value
+                    for value in (getattr(obj, column) for column in columns)
+                ]
+            )
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
@@ -0,0 +1,166 @@
+# Сверка счетчиков книг (quantity_all, quantity_lending, amount_lending) с журналом операций (Lending).
+# Журнал - источник истины, счетчики - производные от него значения:
+#   quantity_all = поступило (arrival, inventory) - списано (write_off) - утеряно (loss)
+#   quantity_lending = выдано при инвентаризации + выдано (issuance) - возвращено (return) - утеряно (loss)
+#   amount_lending = выдано (issuance) - утеряно (loss)
+# Книги обрабатываются пачками по диапазонам id, для каждой пачки журнал агрегируется на стороне БД одним запросом,
+# который возвращает только книги с расхождениями, поэтому строки журнала в память не загружаются.
+# Пачки обрабатываются параллельно в нескольких потоках (у каждого потока свое соединение с БД).
+# При исправлении (--fix) книги пачки блокируются до пересчета, а операции по библиотеке блокируют книгу до
+# изменения журнала, поэтому пересчет видит журнал вместе со всеми завершенными операциями по этим книгам.
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from library.cache import invalidate_books
+from library.models import Books
+
+COUNTERS = ("quantity_all", "quantity_lending", "amount_lending")
+
+
+def operations(operation):
+    return Count("lending_book", filter=Q(lending_book__operation=operation))
+
+
+def journal_counters():
+    """Выражения счетчиков книги по журналу операций (для annotate по Books)."""
+    arrived = Coalesce(
+        Sum(
+            "lending_book__arrival_quantity",
+            filter=Q(lending_book__operation__in=("arrival", "inventory")),
+        ),
+        Value(0),
+    )
+    issued = Coalesce(
+        Sum(
+            "lending_book__issued_quantity",
+            filter=Q(lending_book__operation="inventory"),
+        ),
+        Value(0),
+    )
+    return {
+        "journal_quantity_all": arrived - operations("write_off") - operations("loss"),
+        "journal_quantity_lending": issued
+        + operations("issuance")
+        - operations("return")
+        - operations("loss"),
+        "journal_amount_lending": operations("issuance") - operations("loss"),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверка счетчиков книг с журналом операций и, с --fix, исправление расхождений."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000, help="количество книг в пачке"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="количество потоков (1 - пачки обрабатываются последовательно в текущем соединении)",
+        )
+        parser.add_argument(
+            "--fix", action="store_true", help="исправить счетчики по журналу"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="количество книг в одном UPDATE при исправлении",
+        )
+
+    def handle(self, *args, **options):
+        self.fix = options["fix"]
+        self.batch_size = options["batch_size"]
+        bounds = Books.objects.aggregate(first=Min("pk"), last=Max("pk"))
+        if bounds["first"] is None:
+            self.stdout.write("Книг нет.")
+            return
+        chunk_size = options["chunk_size"]
+        ranges = [
+            (first, first + chunk_size - 1)
+            for first in range(bounds["first"], bounds["last"] + 1, chunk_size)
+        ]
+        if options["workers"] == 1:
+            results = map(self.reconcile_chunk, ranges)
+        else:
+            executor = ThreadPoolExecutor(max_workers=options["workers"])
+            results = executor.map(self.reconcile_in_thread, ranges)
+
+        found = fixed = 0
+        for discrepancies, chunk_fixed in results:
+            found += len(discrepancies)
+            fixed += chunk_fixed
+            for book in discrepancies:
+                self.report(book)
+        if options["workers"] != 1:
+            executor.shutdown()
+        summary = f"Книг с расхождениями: {found}."
+        if self.fix:
+            summary += f" Исправлено: {fixed}."
+        self.stdout.write(summary)
+
+    def reconcile_in_thread(self, bounds):
+        try:
+            return self.reconcile_chunk(bounds)
+        finally:
+            connection.close()  # соединение потока пула
+
+    def reconcile_chunk(self, bounds):
+        """Расхождения счетчиков книг с id из диапазона bounds, при --fix - исправление.
+        Возвращает книги с расхождениями (с атрибутами journal_*) и количество исправленных книг.
+        """
+        books = Books.objects.filter(pk__range=bounds)
+        if not self.fix:
+            return list(self.discrepancies(books)), 0
+        with transaction.atomic():
+            list(books.select_for_update().order_by("pk").values_list("pk"))
+            discrepancies = list(self.discrepancies(books))
+            fixable = [book for book in discrepancies if self.is_fixable(book)]
+            for book in fixable:
+                for counter in COUNTERS:
+                    setattr(book, counter, getattr(book, f"journal_{counter}"))
+            Books.objects.bulk_update(fixable, COUNTERS, batch_size=self.batch_size)
+            if fixable:
+                invalidate_books([book.pk for book in fixable])
+        return discrepancies, len(fixable)
+
+    @staticmethod
+    def discrepancies(books):
+        """Книги, счетчики которых не совпадают с журналом (сравнение в HAVING того же запроса)."""
+        differs = Q()
+        for counter in COUNTERS:
+            differs |= ~Q(**{counter: F(f"journal_{counter}")})
+        return (
+            books.annotate(**journal_counters())
+            .filter(differs)
+            .only("pk", "name", *COUNTERS)
+            .order_by("pk")
+        )
+
+    @staticmethod
+    def is_fixable(book):
+        """Счетчики по журналу допустимы (не отрицательны, выдано не больше, чем есть)."""
+        return (
+            0 <= book.journal_quantity_lending <= book.journal_quantity_all
+            and book.journal_amount_lending >= 0
+        )
+
+    def report(self, book):
+        changes = ", ".join(
+            f"{counter} {getattr(book, counter)} -> {getattr(book, f'journal_{counter}')}"
+            for counter in COUNTERS
+            if getattr(book, counter) != getattr(book, f"journal_{counter}")
+        )
+        line = f"{book.pk} '{book.name}': {changes}"
+        if not self.is_fixable(book):
+            line += " (журнал противоречив, счетчики не исправляются)"
+        self.stdout.write(line)
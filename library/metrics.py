@@ -0,0 +1,435 @@
+# Профилирование запросов к API. RequestMetricsMiddleware замеряет для каждого выбранного запроса общее время,
+# количество и время запросов к БД и время сериализации (Serializer.data) и добавляет их в ответ заголовком
+# Server-Timing (видны в инструментах разработчика браузера). Те же значения накапливаются в гистограммах по
+# маршрутам (имени URL) и отдаются в текстовом формате Prometheus (MetricsApiView).
+# Замеряется доля запросов REQUEST_METRICS_SAMPLE_RATE (0 - профилирование выключено): невыбранный запрос
+# проходит через middleware без замеров, гистограммы строятся по выбранным запросам.
+# Гистограммы хранятся в памяти процесса: при нескольких процессах (воркерах) сервера каждый процесс отдает свои.
+# Задачи Celery из library.tasks замеряются по сигналам Celery (library.signals): время выполнения, время ожидания
+# в очереди, исход, количество обработанных строк и внешних вызовов (record_task_items). Задачи выполняются
+# в процессах воркера, поэтому их счетчики хранятся в общем кеше (Redis) и отдаются тем же MetricsApiView.
+# Запуск дольше интервала задачи в расписании beat (или TASK_SLOW_SECONDS) записывается в журнал предупреждением.
+
+import hmac
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from datetime import timedelta
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from celery import current_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.permissions import BasePermission
+from rest_framework.serializers import BaseSerializer
+
+# границы интервалов гистограмм времени, сек.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# границы интервалов гистограммы количества запросов к БД
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+HISTOGRAMS = {
+    "request_duration_seconds": ("Время обработки запроса", DURATION_BUCKETS),
+    "db_duration_seconds": ("Время запросов к БД за запрос", DURATION_BUCKETS),
+    "db_queries": ("Количество запросов к БД за запрос", QUERIES_BUCKETS),
+    "serializer_duration_seconds": ("Время сериализации за запрос", DURATION_BUCKETS),
+}
+METRICS_PREFIX = "library_http_"
+# границы интервалов гистограмм времени выполнения и ожидания задач, сек.
+TASK_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+TASK_HISTOGRAMS = {
+    "duration_seconds": "Время выполнения задачи",
+    "queue_wait_seconds": "Время ожидания задачи в очереди",
+}
+# обработанные задачей строки и внешние вызовы (record_task_items)
+TASK_ITEMS = (
+    "rows",
+    "subtasks",
+    "emails_sent",
+    "emails_failed",
+    "telegram_sent",
+    "telegram_failed",
+)
+TASK_OUTCOMES = ("success", "failure", "retry")
+TASKS_PREFIX = "library_task_"
+
+logger = logging.getLogger(__name__)
+
+_profile = ContextVar("request_profile", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний интервал - +Inf
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Гистограммы и счетчики ответов по маршрутам (метод и имя URL) процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (метрика, метод, маршрут) -> Histogram
+        self.responses = {}  # (метод, маршрут, код ответа) -> количество
+
+    def observe(self, method, route, status, profile):
+        values = {
+            "request_duration_seconds": profile.duration,
+            "db_duration_seconds": profile.db_duration,
+            "db_queries": profile.db_queries,
+            "serializer_duration_seconds": profile.serializer_duration,
+        }
+        with self.lock:
+            for metric, value in values.items():
+                key = (metric, method, route)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(HISTOGRAMS[metric][1])
+                self.histograms[key].observe(value)
+            key = (method, route, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.responses.clear()
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus (version 0.0.4)."""
+        with self.lock:
+            histograms = {
+                key: (list(histogram.counts), histogram.sum)
+                for key, histogram in self.histograms.items()
+            }
+            responses = dict(self.responses)
+        lines = [
+            f"# HELP {METRICS_PREFIX}responses_total Количество ответов",
+            f"# TYPE {METRICS_PREFIX}responses_total counter",
+        ]
+        for (method, route, status), value in sorted(responses.items()):
+            lines.append(
+                f"{METRICS_PREFIX}responses_total"
+                f'{{method="{method}",route="{escape(route)}",status="{status}"}} {value}'
+            )
+        for metric, (description, buckets) in HISTOGRAMS.items():
+            name = METRICS_PREFIX + metric
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            for (key_metric, method, route), (counts, total) in sorted(
+                histograms.items()
+            ):
+                if key_metric != metric:
+                    continue
+                labels = f'method="{method}",route="{escape(route)}"'
+                lines += histogram_lines(name, labels, buckets, counts, total)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def histogram_lines(name, labels, buckets, counts, total):
+    """Строки гистограммы в формате Prometheus: накопленные количества по интервалам, сумма и количество."""
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*buckets, "+Inf"), counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {total}")
+    lines.append(f"{name}_count{{{labels}}} {cumulative}")
+    return lines
+
+
+class RequestProfile:
+    """Замеры одного запроса. Запросы к БД учитываются по всем соединениям (execute_wrapper)."""
+
+    def __init__(self):
+        self.duration = 0
+        self.db_queries = 0
+        self.db_duration = 0
+        self.serializer_duration = 0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_duration += time.perf_counter() - started
+
+    def wrap_connections(self):
+        """Замер запросов к БД по всем соединениям текущего потока до закрытия возвращаемого ExitStack."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    def server_timing(self):
+        return (
+            f"total;dur={self.duration * 1000:.1f}, "
+            f'db;dur={self.db_duration * 1000:.1f};desc="{self.db_queries} queries", '
+            f"serializer;dur={self.serializer_duration * 1000:.1f}"
+        )
+
+
+def timed_serializer_data(data):
+    """Обертка свойства BaseSerializer.data: время сериализации добавляется к замерам текущего запроса.
+    Время сериализатора, вызванного из другого сериализатора, отдельно не учитывается.
+    """
+
+    def wrapper(serializer):
+        profile = _profile.get()
+        if profile is None or profile.serializing:
+            return data.fget(serializer)
+        profile.serializing = True
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            profile.serializer_duration += time.perf_counter() - started
+            profile.serializing = False
+
+    wrapper.timed = True
+    return property(wrapper)
+
+
+def install_serializer_timing():
+    if not getattr(BaseSerializer.data.fget, "timed", False):
+        BaseSerializer.data = timed_serializer_data(BaseSerializer.data)
+
+
+class RequestMetricsMiddleware:
+    """Под ASGI middleware работает асинхронно, чтобы асинхронные представления (library.asyncviews)
+    не переводились в отдельный поток. Соединения с БД в асинхронном запросе используются в потоке sync_to_async
+    (одном на запрос), поэтому замер запросов к БД включается в этом потоке."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_serializer_timing()
+
+    @staticmethod
+    def sampled():
+        sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        return bool(sample_rate) and (sample_rate >= 1 or random.random() < sample_rate)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with profile.wrap_connections():
+                response = self.get_response(request)
+        finally:
+            profile.duration = time.perf_counter() - started
+            _profile.reset(token)
+        return self.observe(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        started = time.perf_counter()
+        try:
+            stack = await sync_to_async(profile.wrap_connections)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            profile.duration = time.perf_counter() - started
+            _profile.reset(token)
+        return self.observe(request, response, profile)
+
+    @staticmethod
+    def observe(request, response, profile):
+        match = request.resolver_match
+        route = match.view_name if match is not None else "<unmatched>"
+        registry.observe(request.method, route, response.status_code, profile)
+        response["Server-Timing"] = profile.server_timing()
+        return response
+
+
+class HasMetricsToken(BasePermission):
+    """Доступ к метрикам по токену METRICS_TOKEN (заголовок Authorization: Bearer <токен>), например для Prometheus."""
+
+    def has_permission(self, request, view):
+        header = request.META.get("HTTP_AUTHORIZATION", "")
+        return hmac.compare_digest(header, f"Bearer {settings.METRICS_TOKEN}")
+
+
+def task_key(task, *parts):
+    return ":".join(("tasks", task, *map(str, parts)))
+
+
+def incr(key, delta=1):
+    """Увеличение счетчика в общем кеше (счетчик создается при первом увеличении)."""
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+class TaskRun:
+    """Замеры одного выполнения задачи."""
+
+    def __init__(self, queue_wait):
+        self.started = time.perf_counter()
+        self.queue_wait = queue_wait
+        self.items = {}
+
+
+_task_runs = {}  # id задачи -> TaskRun выполняющихся в процессе задач
+
+
+def start_task_run(task_id, published_at):
+    queue_wait = max(time.time() - published_at, 0) if published_at else None
+    _task_runs[task_id] = TaskRun(queue_wait)
+
+
+def record_task_items(**items):
+    """Учет строк и внешних вызовов, обработанных текущей задачей (имена - из TASK_ITEMS)."""
+    run = _task_runs.get(getattr(current_task and current_task.request, "id", None))
+    if run is None:
+        return  # задача вызвана как функция, без Celery
+    for item, value in items.items():
+        run.items[item] = run.items.get(item, 0) + value
+
+
+def finish_task_run(task_id, task, state):
+    """Запись замеров выполнения задачи в общий кеш и предупреждение о долгом выполнении."""
+    run = _task_runs.pop(task_id, None)
+    if run is None:
+        return
+    duration = time.perf_counter() - run.started
+    outcome = {"SUCCESS": "success", "RETRY": "retry"}.get(state, "failure")
+    incr(task_key(task, "runs", outcome))
+    observe_task(task, "duration_seconds", duration)
+    if run.queue_wait is not None:
+        observe_task(task, "queue_wait_seconds", run.queue_wait)
+    for item, value in run.items.items():
+        if value:
+            incr(task_key(task, "items", item), value)
+    check_slow_run(task, duration)
+
+
+def observe_task(task, metric, value):
+    incr(task_key(task, metric, "bucket", bisect_left(TASK_BUCKETS, value)))
+    incr(task_key(task, metric, "sum_ms"), round(value * 1000))
+
+
+def slow_run_seconds(task):
+    """Допустимое время выполнения задачи: интервал ее запуска по расписанию beat или TASK_SLOW_SECONDS."""
+    for entry in settings.CELERY_BEAT_SCHEDULE.values():
+        schedule = entry["schedule"]
+        if entry["task"] == task and isinstance(schedule, (timedelta, int, float)):
+            if isinstance(schedule, timedelta):
+                return schedule.total_seconds()
+            return schedule
+    return settings.TASK_SLOW_SECONDS
+
+
+def check_slow_run(task, duration):
+    """Предупреждение о выполнении задачи дольше допустимого, например захватившем следующий запуск по расписанию."""
+    limit = slow_run_seconds(task)
+    if duration > limit:
+        incr(task_key(task, "slow"))
+        logger.warning(
+            "Задача %s выполнялась %.1f с, допустимо %.1f с.", task, duration, limit
+        )
+
+
+def task_metrics(tasks):
+    """Метрики задач tasks (по именам) из общего кеша в формате Prometheus."""
+    keys = [
+        task_key(task, metric, "bucket", index)
+        for task in tasks
+        for metric in TASK_HISTOGRAMS
+        for index in range(len(TASK_BUCKETS) + 1)
+    ]
+    keys += [
+        task_key(task, metric, "sum_ms") for task in tasks for metric in TASK_HISTOGRAMS
+    ]
+    keys += [
+        task_key(task, "runs", outcome) for task in tasks for outcome in TASK_OUTCOMES
+    ]
+    keys += [task_key(task, "items", item) for task in tasks for item in TASK_ITEMS]
+    keys += [task_key(task, "slow") for task in tasks]
+    values = cache.get_many(keys)
+
+    lines = []
+    counters = (
+        (
+            "runs_total",
+            "Количество выполнений задачи по исходу",
+            "outcome",
+            TASK_OUTCOMES,
+            "runs",
+        ),
+        (
+            "items_total",
+            "Строки и внешние вызовы, обработанные задачей",
+            "item",
+            TASK_ITEMS,
+            "items",
+        ),
+    )
+    for metric, description, label, names, part in counters:
+        name = TASKS_PREFIX + metric
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+        for task in tasks:
+            for value_name in names:
+                value = values.get(task_key(task, part, value_name))
+                if value:
+                    lines.append(
+                        f'{name}{{task="{task}",{label}="{value_name}"}} {value}'
+                    )
+    name = TASKS_PREFIX + "slow_runs_total"
+    lines += [
+        f"# HELP {name} Выполнения задачи дольше допустимого",
+        f"# TYPE {name} counter",
+    ]
+    for task in tasks:
+        if values.get(task_key(task, "slow")):
+            lines.append(f'{name}{{task="{task}"}} {values[task_key(task, "slow")]}')
+    for metric, description in TASK_HISTOGRAMS.items():
+        name = TASKS_PREFIX + metric
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+        for task in tasks:
+            counts = [
+                values.get(task_key(task, metric, "bucket", index), 0)
+                for index in range(len(TASK_BUCKETS) + 1)
+            ]
+            if any(counts):
+                total = values.get(task_key(task, metric, "sum_ms"), 0) / 1000
+                lines += histogram_lines(
+                    name, f'task="{task}"', TASK_BUCKETS, counts, total
+                )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:05
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # индексы журнала операций строятся без блокировки записи в таблицу (CREATE INDEX CONCURRENTLY)
+    atomic = False
+
+    dependencies = [
+        ("library", "0002_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="books",
+            name="amount_lending",
+            field=models.PositiveIntegerField(
+                default=1, verbose_name="количество выдачи"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="books",
+            name="quantity_all",
+            field=models.PositiveIntegerField(
+                default=1, verbose_name="всего в библиотеке"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="books",
+            name="quantity_lending",
+            field=models.PositiveIntegerField(default=1, verbose_name="выдано всего"),
+        ),
+        AddIndexConcurrently(
+            model_name="lending",
+            index=models.Index(
+                fields=["user", "book", "operation"], name="lending_user_book_op_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="lending",
+            index=models.Index(
+                condition=models.Q(("id_return", 0), ("operation", "issuance")),
+                fields=["user", "book"],
+                name="lending_open_issuance_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="lending",
+            index=models.Index(
+                condition=models.Q(("id_return", 0), ("operation", "issuance")),
+                fields=["date_event"],
+                name="lending_open_issuance_date_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="lending",
+            index=models.Index(
+                condition=models.Q(("id_return__gt", 0)),
+                fields=["id_return"],
+                name="lending_id_return_idx",
+            ),
+        ),
+    ]
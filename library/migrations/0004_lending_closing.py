@@ -0,0 +1,102 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import (
+    AddIndexConcurrently,
+    RemoveIndexConcurrently,
+)
+from django.db import migrations, models, transaction
+from django.db.models import Exists, F, Max, OuterRef
+
+BATCH_SIZE = 50_000
+
+
+def copy_id_return(apps, schema_editor):
+    """Переносим ссылку на операцию возврата или утери из id_return в closing пачками по диапазонам id,
+    каждая пачка - отдельная транзакция. Ссылки на несуществующие операции не переносятся.
+    """
+    Lending = apps.get_model("library", "Lending")
+    last_pk = Lending.objects.aggregate(last_pk=Max("pk"))["last_pk"] or 0
+    for start in range(0, last_pk + 1, BATCH_SIZE):
+        with transaction.atomic():
+            Lending.objects.filter(
+                pk__gte=start,
+                pk__lt=start + BATCH_SIZE,
+                id_return__gt=0,
+            ).filter(Exists(Lending.objects.filter(pk=OuterRef("id_return")))).update(
+                closing_id=F("id_return")
+            )
+
+
+def copy_closing(apps, schema_editor):
+    """Обратный перенос ссылки из closing в id_return."""
+    Lending = apps.get_model("library", "Lending")
+    last_pk = Lending.objects.aggregate(last_pk=Max("pk"))["last_pk"] or 0
+    for start in range(0, last_pk + 1, BATCH_SIZE):
+        with transaction.atomic():
+            Lending.objects.filter(
+                pk__gte=start,
+                pk__lt=start + BATCH_SIZE,
+                closing__isnull=False,
+            ).update(id_return=F("closing_id"))
+
+
+class Migration(migrations.Migration):
+    # перенос данных выполняется пачками в отдельных транзакциях, индексы строятся без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ("library", "0003_lending_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lending",
+            name="closing",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="closed_issuance",
+                to="library.lending",
+                verbose_name="операция возврата или утери",
+            ),
+        ),
+        migrations.RunPython(copy_id_return, copy_closing),
+        RemoveIndexConcurrently(
+            model_name="lending",
+            name="lending_open_issuance_idx",
+        ),
+        RemoveIndexConcurrently(
+            model_name="lending",
+            name="lending_open_issuance_date_idx",
+        ),
+        RemoveIndexConcurrently(
+            model_name="lending",
+            name="lending_id_return_idx",
+        ),
+        migrations.RemoveField(
+            model_name="lending",
+            name="id_return",
+        ),
+        AddIndexConcurrently(
+            model_name="lending",
+            index=models.Index(
+                condition=models.Q(
+                    ("closing__isnull", True), ("operation", "issuance")
+                ),
+                fields=["user", "book"],
+                name="lending_open_issuance_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="lending",
+            index=models.Index(
+                condition=models.Q(
+                    ("closing__isnull", True), ("operation", "issuance")
+                ),
+                fields=["date_event"],
+                name="lending_open_issuance_date_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.1 on 2026-10-18 15:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0004_lending_closing"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Reminder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "channel",
+                    models.CharField(
+                        choices=[
+                            ("mail", "электронная почта"),
+                            ("telegram", "Телеграм"),
+                        ],
+                        max_length=20,
+                        verbose_name="канал",
+                    ),
+                ),
+                ("date_event", models.DateField(verbose_name="дата отправки")),
+                (
+                    "lending",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reminders",
+                        to="library.lending",
+                        verbose_name="выдача",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "напоминание",
+                "verbose_name_plural": "напоминания",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("lending", "date_event", "channel"),
+                        name="reminder_lending_date_channel_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
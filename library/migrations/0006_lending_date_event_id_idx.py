@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("library", "0005_reminder"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="lending",
+            index=models.Index(
+                fields=["date_event", "id"], name="lending_date_event_id_idx"
+            ),
+        ),
+    ]
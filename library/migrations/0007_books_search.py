@@ -0,0 +1,68 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:20
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# pg_trgm и триграммные индексы создаются, только если расширение есть в сборке PostgreSQL (library.search)
+CREATE_TRIGRAM = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS books_name_trgm_idx
+            ON library_books USING gin (name gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS authors_author_trgm_idx
+            ON library_authors USING gin (author gin_trgm_ops);
+    END IF;
+END
+$$;
+"""
+
+DROP_TRIGRAM = """
+DROP INDEX IF EXISTS books_name_trgm_idx;
+DROP INDEX IF EXISTS authors_author_trgm_idx;
+"""
+
+
+def fill_search_vectors(apps, schema_editor):
+    """Поисковые векторы существующих книг."""
+    Authors = apps.get_model("library", "Authors")
+    Books = apps.get_model("library", "Books")
+    config = settings.CATALOG_SEARCH_CONFIG
+    author = Subquery(
+        Authors.objects.filter(pk=OuterRef("author_id")).values("author")[:1]
+    )
+    Books.objects.update(
+        search_vector=SearchVector("name", weight="A", config=config)
+        + SearchVector(author, weight="B", config=config)
+        + SearchVector("annotation", weight="C", config=config)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0006_lending_date_event_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="books",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                blank=True, editable=False, null=True, verbose_name="поисковый вектор"
+            ),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="books",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="books_search_vector_idx"
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGRAM, DROP_TRIGRAM),
+    ]
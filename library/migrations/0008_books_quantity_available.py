@@ -0,0 +1,65 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:55
+
+import django.db.models.expressions
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+
+def exclude_lost_copies(apps, schema_editor):
+    """Утерянные книги раньше оставались в количестве выданных (quantity_lending), теперь утеря, как и возврат,
+    уменьшает его. Из quantity_lending вычитается количество утерь книги, результат ограничивается
+    диапазоном [0, quantity_all]."""
+    Books = apps.get_model("library", "Books")
+    Lending = apps.get_model("library", "Lending")
+    losses = (
+        Lending.objects.filter(book_id=OuterRef("pk"), operation="loss")
+        .values("book_id")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Books.objects.update(
+        quantity_lending=Greatest(
+            Least(
+                F("quantity_lending") - Coalesce(Subquery(losses), Value(0)),
+                F("quantity_all"),
+            ),
+            Value(0),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0007_books_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="books",
+            name="quantity_available",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.expressions.CombinedExpression(
+                    models.F("quantity_all"), "-", models.F("quantity_lending")
+                ),
+                output_field=models.IntegerField(),
+                verbose_name="в наличии",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="books",
+            index=models.Index(
+                fields=["quantity_available"], name="books_available_idx"
+            ),
+        ),
+        migrations.RunPython(exclude_lost_copies, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="books",
+            constraint=models.CheckConstraint(
+                condition=models.Q(("quantity_lending__lte", models.F("quantity_all"))),
+                name="books_lending_lte_all",
+            ),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.1.1 on 2026-10-18 19:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# статистика по операциям, проведенным до появления очереди изменений, рассчитывается задачей
+# update_circulation_statistics так же, как по новым операциям
+QUEUE_JOURNAL = """
+INSERT INTO library_circulationchange (date_event, book_id)
+SELECT DISTINCT date_event, book_id FROM library_lending;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0008_books_quantity_available"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CirculationChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date_event", models.DateField(verbose_name="дата")),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="circulation_changes",
+                        to="library.books",
+                        verbose_name="книга",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "изменение статистики",
+                "verbose_name_plural": "изменения статистики",
+            },
+        ),
+        migrations.CreateModel(
+            name="CirculationDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date_event", models.DateField(verbose_name="дата")),
+                (
+                    "issuances",
+                    models.PositiveIntegerField(default=0, verbose_name="выдано"),
+                ),
+                (
+                    "returns",
+                    models.PositiveIntegerField(default=0, verbose_name="возвращено"),
+                ),
+                (
+                    "losses",
+                    models.PositiveIntegerField(default=0, verbose_name="утеряно"),
+                ),
+                (
+                    "write_offs",
+                    models.PositiveIntegerField(default=0, verbose_name="списано"),
+                ),
+                (
+                    "arrivals",
+                    models.PositiveIntegerField(default=0, verbose_name="поступило"),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="circulation",
+                        to="library.books",
+                        verbose_name="книга",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "статистика за день",
+                "verbose_name_plural": "статистика по дням",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date_event", "book"), name="circulation_date_book_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(QUEUE_JOURNAL, migrations.RunSQL.noop),
+    ]
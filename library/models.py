@@ -8,6 +8,8 @@
 
 from datetime import date
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 from config import settings
@@ -64,12 +66,22 @@ class Books(models.Model):
     amount_lending = models.PositiveIntegerField(
         verbose_name="количество выдачи", default=1
     )
+    # вычисляется PostgreSQL при каждом изменении счетчиков (хранимый генерируемый столбец)
+    quantity_available = models.GeneratedField(
+        expression=models.F("quantity_all") - models.F("quantity_lending"),
+        output_field=models.IntegerField(),
+        db_persist=True,
+        verbose_name="в наличии",
+    )
     image = models.ImageField(
         upload_to="books/media",
         verbose_name="обложка",
         help_text="загрузите обложку",
         **NULLABLE,
     )
+    search_vector = SearchVectorField(
+        verbose_name="поисковый вектор", editable=False, **NULLABLE
+    )
 
     def str(self):
         return f"Книга: {self.name}"
@@ -77,6 +89,19 @@ class Books(models.Model):
     class Meta:
         verbose_name = "Книга"
         verbose_name_plural = "Книги"
+        indexes = [
+            # полнотекстовый поиск по каталогу (library.search)
+            GinIndex(fields=["search_vector"], name="books_search_vector_idx"),
+            # книги в наличии
+            models.Index(fields=["quantity_available"], name="books_available_idx"),
+        ]
+        constraints = [
+            # выдано не больше, чем есть в библиотеке
+            models.CheckConstraint(
+                condition=models.Q(quantity_lending__lte=models.F("quantity_all")),
+                name="books_lending_lte_all",
+            ),
+        ]
 
 
 class Lending(models.Model):
@@ -106,14 +131,20 @@ class Lending(models.Model):
     )
     date_event = models.DateField(verbose_name="дата", default=date.today)
 
-    id_return = models.IntegerField(verbose_name="id возврата или утери", default=0)
+    closing = models.OneToOneField(
+        "self",
+        on_delete=models.SET_NULL,
+        verbose_name="операция возврата или утери",
+        related_name="closed_issuance",
+        **NULLABLE,
+    )
     is_return = models.BooleanField(verbose_name="пометка о возврате", default=False)
     is_loss = models.BooleanField(verbose_name="пометка об утере", default=False)
     is_write_off = models.BooleanField(verbose_name="пометка о списании", default=False)
     arrival_quantity = models.IntegerField(
         verbose_name="Количество поступивших книг.", default=0
     )
-    issued_quantity = models.IntegerField(verbose_name="выдано читателям",default=0)
+    issued_quantity = models.IntegerField(verbose_name="выдано читателям", default=0)
 
     def __str__(self):
         return f"{self.user} : {self.book} - {self.operation}"
@@ -121,3 +152,106 @@ class Lending(models.Model):
     class Meta:
         verbose_name = "выдача"
         verbose_name_plural = "выдачи"
+        indexes = [
+            # история операций читателя по книге
+            models.Index(
+                fields=["user", "book", "operation"], name="lending_user_book_op_idx"
+            ),
+            # невозвращенные выдачи: проверка повторной выдачи, поиск выдачи при возврате и утере
+            models.Index(
+                fields=["user", "book"],
+                condition=models.Q(operation="issuance", closing__isnull=True),
+                name="lending_open_issuance_idx",
+            ),
+            # постраничный вывод журнала по ключу (date_event, id)
+            models.Index(fields=["date_event", "id"], name="lending_date_event_id_idx"),
+            # невозвращенные выдачи по дате выдачи для напоминаний о возврате
+            models.Index(
+                fields=["date_event"],
+                condition=models.Q(operation="issuance", closing__isnull=True),
+                name="lending_open_issuance_date_idx",
+            ),
+        ]
+
+
+class Reminder(models.Model):
+    """Журнал отправленных напоминаний о возврате книги: по выдаче, каналу и дню отправки.
+    Напоминание, уже отправленное сегодня по каналу, повторно не отправляется."""
+
+    CHANNEL = [
+        ("mail", "электронная почта"),
+        ("telegram", "Телеграм"),
+    ]
+
+    lending = models.ForeignKey(
+        Lending,
+        on_delete=models.CASCADE,
+        verbose_name="выдача",
+        related_name="reminders",
+    )
+    channel = models.CharField(max_length=20, choices=CHANNEL, verbose_name="канал")
+    date_event = models.DateField(verbose_name="дата отправки")
+
+    def __str__(self):
+        return f"{self.lending_id} : {self.channel} - {self.date_event}"
+
+    class Meta:
+        verbose_name = "напоминание"
+        verbose_name_plural = "напоминания"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["lending", "date_event", "channel"],
+                name="reminder_lending_date_channel_uniq",
+            ),
+        ]
+
+
+class CirculationDaily(models.Model):
+    """Суточная статистика движения книги по журналу операций (library.statistics).
+    Отчеты по месяцам, годам, жанрам и авторам строятся по этой таблице, а не по журналу.
+    """
+
+    date_event = models.DateField(verbose_name="дата")
+    book = models.ForeignKey(
+        Books,
+        on_delete=models.CASCADE,
+        verbose_name="книга",
+        related_name="circulation",
+    )
+    issuances = models.PositiveIntegerField(verbose_name="выдано", default=0)
+    returns = models.PositiveIntegerField(verbose_name="возвращено", default=0)
+    losses = models.PositiveIntegerField(verbose_name="утеряно", default=0)
+    write_offs = models.PositiveIntegerField(verbose_name="списано", default=0)
+    arrivals = models.PositiveIntegerField(verbose_name="поступило", default=0)
+
+    def __str__(self):
+        return f"{self.book_id} : {self.date_event}"
+
+    class Meta:
+        verbose_name = "статистика за день"
+        verbose_name_plural = "статистика по дням"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date_event", "book"], name="circulation_date_book_uniq"
+            ),
+        ]
+
+
+class CirculationChange(models.Model):
+    """Очередь изменений журнала операций: день и книга, статистика по которым еще не пересчитана.
+    Запись добавляется в той же транзакции, что и операция (или ее удаление)."""
+
+    date_event = models.DateField(verbose_name="дата")
+    book = models.ForeignKey(
+        Books,
+        on_delete=models.CASCADE,
+        verbose_name="книга",
+        related_name="circulation_changes",
+    )
+
+    def __str__(self):
+        return f"{self.book_id} : {self.date_event}"
+
+    class Meta:
+        verbose_name = "изменение статистики"
+        verbose_name_plural = "изменения статистики"
@@ -1,19 +1,173 @@
-from rest_framework.pagination import PageNumberPagination
+import json
 
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
 
-class AuthorsPaginator(PageNumberPagination):
+
+class CountedPaginator(Paginator):
+    """Paginator с заранее подсчитанным количеством объектов (в асинхронном представлении - запросом acount)."""
+
+    def __init__(self, object_list, per_page, count):
+        super().__init__(object_list, per_page)
+        self.count = count
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """Постраничный вывод по номерам страниц, который можно выполнить и в асинхронном представлении
+    (library.asyncviews): apaginate_queryset выбирает страницу асинхронными запросами ORM и формирует те же
+    страницы и ошибки, что и paginate_queryset."""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = CountedPaginator(queryset, page_size, await queryset.acount())
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            )
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        return self.page.object_list
+
+
+class AuthorsPaginator(AsyncPageNumberPagination):
+    page_size = 5
+    page_size_query_param = "page_size"
+    max_page_size = 10
+
+
+class BooksPaginator(AsyncPageNumberPagination):
     page_size = 5
-    page_query_param = "page_size"
+    page_size_query_param = "page_size"
     max_page_size = 10
 
 
-class BooksPaginator(PageNumberPagination):
+class LendingPaginator(AsyncPageNumberPagination):
     page_size = 5
-    page_query_param = "page_size"
+    page_size_query_param = "page_size"
     max_page_size = 10
 
 
-class LendingPaginator(PageNumberPagination):
+class LendingCursorPaginator(CursorPagination):
+    """Постраничный вывод журнала операций по ключу (keyset): страница выбирается условием
+    (поле, id) > (значение, id последней записи) без COUNT(*) и OFFSET, поэтому время выборки не зависит от номера
+    страницы, а вставка новых операций не сдвигает страницы.
+    Ключ - поле сортировки из ordering_fields (первое поле параметра ordering) и id, без сортировки - только id.
+    Курсор содержит значения ключа последней (первой - для предыдущей страницы) записи страницы.
+    """
+
     page_size = 5
-    page_query_param = "page_size"
+    page_size_query_param = "page_size"
     max_page_size = 10
+    ordering_fields = ("date_event", "book", "user")
+
+    def get_key(self, queryset):
+        """Поле ключа (или None - ключ только id) и направление сортировки по первому полю сортировки запроса."""
+        ordering = queryset.query.order_by
+        if ordering:
+            field = ordering[0].lstrip("-")
+            if field in self.ordering_fields:
+                return field, ordering[0].startswith("-")
+            if field in ("id", "pk"):
+                return None, ordering[0].startswith("-")
+        return None, False
+
+    def get_position(self, instance):
+        """Значения ключа записи для курсора."""
+        if self.field is None:
+            return json.dumps([instance.pk])
+        value = getattr(instance, instance._meta.get_field(self.field).attname)
+        return json.dumps([str(value), instance.pk])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page(
+            [obj async for obj in self.page_queryset(queryset, request)]
+        )
+
+    def page_queryset(self, queryset, request):
+        """Запрос страницы (на одну запись больше страницы, чтобы узнать, есть ли следующая)."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            self.cursor = Cursor(offset=0, reverse=False, position=None)
+        self.field, descending = self.get_key(queryset)
+
+        # для предыдущей страницы записи выбираются в обратном порядке от первой записи текущей страницы
+        descending = descending != self.cursor.reverse
+        key = ("id",) if self.field is None else (self.field, "id")
+        queryset = queryset.order_by(
+            *[f"-{field}" if descending else field for field in key]
+        )
+        if self.cursor.position is not None:
+            try:
+                position = json.loads(self.cursor.position)
+            except ValueError:
+                position = None
+            if not isinstance(position, list) or len(position) != len(key):
+                raise NotFound(self.invalid_cursor_message)
+            # позиция задается клиентом: значения приводятся к типам полей ключа до построения условия
+            try:
+                position = [
+                    queryset.model._meta.get_field(field).to_python(value)
+                    for field, value in zip(key, position)
+                ]
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            if None in position:
+                raise NotFound(self.invalid_cursor_message)
+            after = "lt" if descending else "gt"
+            if self.field is None:
+                queryset = queryset.filter(**{f"id__{after}": position[0]})
+            else:
+                value, pk = position
+                # первое условие ограничивает диапазон индекса по полю ключа, второе отсекает уже выведенные записи
+                queryset = queryset.filter(
+                    Q(**{f"{self.field}__{after}e": value}),
+                    Q(**{f"{self.field}__{after}": value}) | Q(**{f"id__{after}": pk}),
+                )
+
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if self.cursor.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = (
+                has_more,
+                self.cursor.position is not None,
+            )
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.get_position(self.page[-1]))
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.get_position(self.page[0]))
+        )
@@ -0,0 +1,140 @@
+# Распределение запросов к БД между основной базой (default) и репликами для чтения (REPLICA_DATABASES).
+# Реплики читаются только в запросах к API на чтение (GET, HEAD, OPTIONS): каталог, журнал, выгрузка журнала,
+# отчеты. ReplicaRoutingMiddleware отмечает такой запрос в контексте, а ReplicaRouter выбирает для чтения случайную
+# реплику. Изменяющие запросы, задачи Celery и команды читают и пишут только основную базу; в другом коде чтение
+# из реплик можно включить контекстом replica_reads().
+# Реплика отстает от основной базы, поэтому после записи клиент REPLICA_STICKY_SECONDS читает основную базу
+# (библиотекарь сразу видит проведенную операцию). Клиент определяется по заголовку Authorization или cookie
+# сессии, метка хранится в общем кеше и видна всем процессам сервера. В пределах одного запроса чтение после
+# записи и чтение внутри транзакции также выполняются в основной базе.
+
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+_routing = ContextVar("replica_routing", default=None)
+
+
+class ReadRouting:
+    """Маршрутизация чтения в текущем контексте: primary - читать основную базу, wrote - была запись."""
+
+    def __init__(self, primary=False):
+        self.primary = primary
+        self.wrote = False
+
+
+@contextmanager
+def replica_reads(primary=False):
+    """Чтение из реплик в блоке with (до первой записи или при primary=True - из основной базы)."""
+    routing = ReadRouting(primary)
+    token = _routing.set(routing)
+    try:
+        yield routing
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if (
+            routing is None
+            or routing.primary
+            or not settings.REPLICA_DATABASES
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.primary = routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная база
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def sticky_key(request):
+    """Ключ метки клиента в кеше или None, если клиента определить нельзя."""
+    client = request.META.get("HTTP_AUTHORIZATION") or request.COOKIES.get(
+        settings.SESSION_COOKIE_NAME
+    )
+    if not client:
+        return None
+    return f"replica:sticky:{hashlib.md5(client.encode()).hexdigest()}"
+
+
+def routed_content(content, routing):
+    """Потоковый ответ читается после выхода из middleware, маршрутизация запроса включается на каждую часть."""
+    iterator = iter(content)
+    while True:
+        token = _routing.set(routing)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _routing.reset(token)
+        yield chunk
+
+
+class ReplicaRoutingMiddleware:
+    """Чтение из реплик в запросах на чтение клиентов, которые недавно не изменяли данные."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+
+        key = sticky_key(request)
+        primary = request.method not in SAFE_METHODS or bool(key and cache.get(key))
+        with replica_reads(primary) as routing:
+            response = self.get_response(request)
+        if routing.wrote and key:
+            cache.set(key, True, timeout=settings.REPLICA_STICKY_SECONDS)
+        return self.stream(response, routing)
+
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+
+        key = sticky_key(request)
+        primary = request.method not in SAFE_METHODS or bool(
+            key and await cache.aget(key)
+        )
+        with replica_reads(primary) as routing:
+            response = await self.get_response(request)
+        if routing.wrote and key:
+            await cache.aset(key, True, timeout=settings.REPLICA_STICKY_SECONDS)
+        return self.stream(response, routing)
+
+    @staticmethod
+    def stream(response, routing):
+        if response.streaming and not response.is_async:
+            response.streaming_content = routed_content(
+                response.streaming_content, routing
+            )
+        return response
@@ -0,0 +1,70 @@
+# Поиск по каталогу книг: полнотекстовый поиск PostgreSQL по названию, автору и аннотации с ранжированием
+# и поиск по сходству триграмм (pg_trgm) для запросов с опечатками.
+# Поисковый вектор книги хранится в Books.search_vector (GIN-индекс) и пересчитывается при изменении книги
+# или ее автора (library.signals). Веса: название - A, автор - B, аннотация - C.
+# pg_trgm - расширение из contrib, в сборках PostgreSQL без contrib его нет: тогда поиск выполняется только
+# по полнотекстовому вектору.
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector,
+                                            TrigramWordSimilarity)
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+from rest_framework.filters import SearchFilter
+
+from library.models import Authors
+
+_trigram_enabled = None
+
+
+def trigram_enabled():
+    """Установлено ли расширение pg_trgm (проверяется один раз за время жизни процесса)."""
+    global _trigram_enabled
+    if _trigram_enabled is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_enabled = cursor.fetchone() is not None
+    return _trigram_enabled
+
+
+def update_search_vectors(books):
+    """Пересчет поискового вектора книг queryset books одним UPDATE."""
+    config = settings.CATALOG_SEARCH_CONFIG
+    author = Subquery(
+        Authors.objects.filter(pk=OuterRef("author_id")).values("author")[:1]
+    )
+    books.update(
+        search_vector=SearchVector("name", weight="A", config=config)
+        + SearchVector(author, weight="B", config=config)
+        + SearchVector("annotation", weight="C", config=config)
+    )
+
+
+def search_books(books, text):
+    """Книги queryset books, найденные по тексту запроса, в порядке релевантности."""
+    query = SearchQuery(
+        text, config=settings.CATALOG_SEARCH_CONFIG, search_type="websearch"
+    )
+    condition = Q(search_vector=query)
+    rank = SearchRank(F("search_vector"), query)
+    if trigram_enabled():
+        condition |= Q(name__trigram_word_similar=text) | Q(
+            author__author__trigram_word_similar=text
+        )
+        rank = rank + Greatest(
+            TrigramWordSimilarity(text, "name"),
+            TrigramWordSimilarity(text, "author__author"),
+        )
+    return books.filter(condition).annotate(rank=rank).order_by("-rank", "id")
+
+
+class BooksSearchFilter(SearchFilter):
+    """Поиск по каталогу (параметр search): строка запроса целиком передается в search_books."""
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, "").strip()
+        if not text:
+            return queryset
+        return search_books(queryset, text)
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
 from library.models import Authors, Books, Lending
+from library.statistics import REPORT_GROUPS
 from library.validators import LibraryValidators
 from users.serializer import UserSerializerReadOnly
 
@@ -34,6 +35,7 @@ class BooksSerializerReadOnly(serializers.ModelSerializer):
             "genre",
             "quantity_all",
             "quantity_lending",
+            "quantity_available",
             "amount_lending",
         )
 
@@ -70,3 +72,26 @@ class LendingSerializerWriteOff(ModelSerializer):
     class Meta:
         model = Lending
         fields = ("is_write_off",)
+
+
+class LendingBulkSerializer(serializers.Serializer):
+    """Сериализатор операции пакетной загрузки. Читатель и книга передаются идентификаторами и проверяются
+    одним запросом на весь пакет."""
+
+    user = serializers.IntegerField()
+    book = serializers.IntegerField()
+    operation = serializers.ChoiceField(choices=Lending.OPERATION)
+    date_event = serializers.DateField(required=False)
+    arrival_quantity = serializers.IntegerField(default=0)
+    issued_quantity = serializers.IntegerField(default=0)
+
+
+class CirculationReportSerializer(serializers.Serializer):
+    """Параметры отчета о движении книг: год, необязательно месяц и жанр, группировка строк отчета."""
+
+    year = serializers.IntegerField(min_value=1900, max_value=2100)
+    month = serializers.IntegerField(min_value=1, max_value=12, required=False)
+    genre = serializers.ChoiceField(choices=Books.GENRE, required=False)
+    group = serializers.ChoiceField(
+        choices=list(REPORT_GROUPS), required=False, default="genre"
+    )
@@ -1,15 +1,381 @@
+import csv
+import json
+import logging
+import smtplib
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
+from django.contrib.auth import get_user_model
+from django.core.mail import get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from requests.adapters import HTTPAdapter
 
 from config import settings
+from library.cache import invalidate_books
+from library.models import Books, Lending
+from library.statistics import record_circulation_changes
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramClient:
+    """Клиент Telegram Bot API для рассылки сообщений.
+    Соединения с сервером держатся открытыми и переиспользуются (requests.Session с пулом соединений),
+    у каждого запроса ограничено время подключения и ответа. Сообщения отправляются параллельно не более чем
+    max_workers потоками с соблюдением ограничений Телеграма: не более rate_limit сообщений в секунду всего
+    и не чаще одного сообщения в chat_interval секунд в один чат. Ответ 429 (слишком много запросов)
+    приостанавливает всю рассылку на указанное сервером время, ответы 5xx и сетевые ошибки повторяются
+    с нарастающей паузой не более retries раз."""
+
+    backoff = 0.5  # пауза перед первым повтором после ошибки, сек.
+
+    def __init__(
+        self,
+        base_url=None,
+        token=None,
+        max_workers=None,
+        timeout=None,
+        rate_limit=None,
+        chat_interval=None,
+        retries=None,
+    ):
+        base_url = base_url or settings.TELEGRAM_URL
+        token = token or settings.TELEGRAM_BOT_TOKEN
+        self.url = f"{base_url}{token}/sendMessage"
+        self.max_workers = max_workers or settings.TELEGRAM_MAX_WORKERS
+        self.timeout = timeout or (
+            settings.TELEGRAM_CONNECT_TIMEOUT,
+            settings.TELEGRAM_READ_TIMEOUT,
+        )
+        rate_limit = rate_limit or settings.TELEGRAM_RATE_LIMIT
+        self.interval = 1 / rate_limit
+        self.chat_interval = (
+            settings.TELEGRAM_CHAT_INTERVAL if chat_interval is None else chat_interval
+        )
+        self.retries = settings.TELEGRAM_RETRIES if retries is None else retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.lock = threading.Lock()
+        self.next_send = (
+            0.0  # время, раньше которого нельзя отправить следующее сообщение
+        )
+        self.next_chat_send = {}  # то же время для каждого чата
+
+    def wait_turn(self, chat_id):
+        """Ожидание очереди на отправку сообщения в чат."""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_send, self.next_chat_send.get(chat_id, 0.0))
+            self.next_send = start + self.interval
+            if len(self.next_chat_send) > 10_000:
+                self.next_chat_send = {
+                    chat: moment
+                    for chat, moment in self.next_chat_send.items()
+                    if moment > now
+                }
+            self.next_chat_send[chat_id] = start + self.chat_interval
+        time.sleep(start - now)
+
+    def pause(self, seconds):
+        """Приостановка всей рассылки (ответ 429)."""
+        with self.lock:
+            self.next_send = max(self.next_send, time.monotonic() + seconds)
+
+    def send_message(self, chat_id, message):
+        """Отправка одного сообщения с повторами. При неудаче после всех повторов - исключение."""
+        params = {
+            "text": message,
+            "chat_id": chat_id,
+        }
+        for attempt in range(self.retries + 1):
+            self.wait_turn(chat_id)
+            try:
+                response = self.session.get(
+                    self.url, params=params, timeout=self.timeout
+                )
+            except requests.RequestException:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2**attempt)
+                continue
+            if response.status_code == 429 and attempt < self.retries:
+                retry_after = (
+                    response.json().get("parameters", {}).get("retry_after", 1)
+                )
+                self.pause(retry_after)
+                continue
+            if response.status_code >= 500 and attempt < self.retries:
+                time.sleep(self.backoff * 2**attempt)
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def send_messages(self, messages):
+        """Параллельная отправка сообщений. messages - пары (chat_id, текст).
+        Возвращает количество отправленных сообщений и список пар ((chat_id, текст), ошибка) неотправленных.
+        """
+        sent = 0
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.send_message, chat_id, message): (chat_id, message)
+                for chat_id, message in messages
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except requests.RequestException as error:
+                    failed.append((futures[future], error))
+                else:
+                    sent += 1
+        return sent, failed
+
+
+telegram_client = None
+
+
+def get_telegram_client():
+    """Общий для процесса клиент Телеграма (один пул соединений на процесс)."""
+    global telegram_client
+    if telegram_client is None:
+        telegram_client = TelegramClient()
+    return telegram_client
 
 
 def telegram_message(chat_id, message):
     """Функция предназначена для отправки сообщений в Телеграм."""
-    params = {
-        "text": message,
-        "chat_id": chat_id,
-    }
-    requests.get(
-        f"{settings.TELEGRAM_URL}{settings.TELEGRAM_BOT_TOKEN}/sendMessage",
-        params=params,
+    get_telegram_client().send_message(chat_id, message)
+
+
+def send_mail_messages(messages):
+    """Функция отправляет письма (EmailMessage) через одно SMTP-соединение, открытое на всю рассылку.
+    Ошибка отправки письма не прерывает рассылку: соединение переоткрывается, а письмо попадает в список ошибок.
+    Если соединение не открывается (сервер недоступен), оставшиеся письма не отправляются и тоже попадают
+    в список ошибок.
+    Возвращает количество отправленных писем и список пар (письмо, ошибка) неотправленных.
+    """
+    sent = 0
+    failed = []
+    messages = iter(messages)
+    connection = get_connection()
+    try:
+        connection.open()
+        for message in messages:
+            message.connection = connection
+            try:
+                message.send()
+            except (smtplib.SMTPException, OSError) as error:
+                failed.append((message, error))
+                connection.close()
+                connection.open()
+            else:
+                sent += 1
+    except (smtplib.SMTPException, OSError) as error:
+        failed.extend((message, error) for message in messages)
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def change_book_counters(book_pk, condition=None, **deltas):
+    """Функция изменяет счетчики книги (quantity_all, quantity_lending, amount_lending) одним UPDATE на стороне БД.
+    Строка книги не читается в Python, поэтому параллельные операции не затирают изменения друг друга.
+    condition - дополнительное условие (Q) на строку книги, при его невыполнении счетчики не меняются.
+    Возвращает True, если строка книги была изменена."""
+    books = Books.objects.filter(pk=book_pk)
+    if condition is not None:
+        books = books.filter(condition)
+    changed = (
+        books.update(**{field: F(field) + delta for field, delta in deltas.items()}) > 0
     )
+    if changed:
+        # UPDATE не вызывает сигналы модели, кеш каталога сбрасывается явно
+        invalidate_books([book_pk])
+    return changed
+
+
+def create_lendings_bulk(operations, librarian_id):
+    """Функция проводит пакет операций по библиотеке в одной транзакции.
+    Проверки LibraryValidators и LendingCreateApiView выполняются над данными, загруженными несколькими запросами
+    на весь пакет (книги, читатели, невозвращенные выдачи), операции записываются одним bulk_create,
+    а счетчики книг и пометки в операциях выдачи - одним bulk_update.
+    operations - список словарей с ключами user, book, operation и, необязательно, date_event, arrival_quantity,
+    issued_quantity. Операции проводятся в порядке следования, поэтому в одном пакете книгу можно выдать и вернуть.
+    Возвращает список результатов в порядке операций: {"id": ...} для проведенной операции или {"errors": [...]}.
+    """
+    user_model = get_user_model()
+    results = []
+    with transaction.atomic():
+        books = {
+            book.pk: book
+            for book in Books.objects.select_for_update()
+            .filter(pk__in={operation["book"] for operation in operations})
+            .order_by("pk")
+        }  # книги пакета заблокированы до конца транзакции
+        users = set(
+            user_model.objects.filter(
+                pk__in={operation["user"] for operation in operations}
+            ).values_list("pk", flat=True)
+        )
+        open_issuances = defaultdict(
+            list
+        )  # невозвращенные выдачи по парам (читатель, книга)
+        readers = {
+            operation["user"]
+            for operation in operations
+            if operation["operation"] in ("issuance", "return", "loss")
+        }
+        if readers:
+            for lending in (
+                Lending.objects.select_for_update()
+                .filter(
+                    operation="issuance",
+                    closing__isnull=True,
+                    user_id__in=readers,
+                    book_id__in=books,
+                )
+                .order_by("id")
+            ):
+                open_issuances[(lending.user_id, lending.book_id)].append(lending)
+
+        lendings = []  # новые операции
+        closings = []  # операции выдачи, закрываемые возвратом или утерей
+        changed_books = {}
+        for operation in operations:
+            kind = operation["operation"]
+            book = books.get(operation["book"])
+            if book is None:
+                results.append(
+                    {"errors": ["Такая книга не зарегистрирована в библиотеке !"]}
+                )
+                continue
+            if operation["user"] not in users:
+                results.append(
+                    {"errors": ["Такой читатель не зарегистрирован в библиотеке !"]}
+                )
+                continue
+            issuances = open_issuances[(operation["user"], book.pk)]
+            error = None
+            if kind == "issuance" and issuances:
+                error = "Вы уже получили эту книгу в библиотеке !"
+            elif kind in ("issuance", "write_off") and book.quantity_all == 0:
+                error = f"Книги '{book.name}' еще не поступили в библиотеку !"
+            elif (
+                kind in ("issuance", "write_off")
+                and book.quantity_all <= book.quantity_lending
+            ):
+                error = f"Все книги '{book.name}' выданы читателям !"
+            elif kind == "inventory" and book.quantity_all + operation.get(
+                "arrival_quantity", 0
+            ) < book.quantity_lending + operation.get("issued_quantity", 0):
+                error = f"Количество выданных книг '{book.name}' превысит их общее количество в библиотеке !"
+            elif kind == "return" and not issuances:
+                error = f"Книга '{book.name}' уже возвращена !"
+            elif kind == "loss" and not issuances:
+                error = f"Книга '{book.name}' возвращена !"
+            if error:
+                results.append({"errors": [error]})
+                continue
+
+            lending = Lending(
+                user_id=operation["user"],
+                book_id=book.pk,
+                operation=kind,
+                arrival_quantity=operation.get("arrival_quantity", 0),
+                issued_quantity=operation.get("issued_quantity", 0),
+            )
+            if "date_event" in operation:
+                lending.date_event = operation["date_event"]
+            if kind in ("inventory", "arrival", "write_off", "loss"):
+                # пользователем (хозяином) этих операций автоматически является библиотекарь
+                lending.user_id = librarian_id
+            if kind == "inventory":
+                book.quantity_all += lending.arrival_quantity
+                book.quantity_lending += lending.issued_quantity
+            elif kind == "arrival":
+                book.quantity_all += lending.arrival_quantity
+            elif kind == "issuance":
+                book.quantity_lending += 1
+                book.amount_lending += 1
+                issuances.append(lending)
+            elif kind == "return":
+                book.quantity_lending -= 1
+                closings.append((issuances.pop(0), lending))
+            elif kind == "write_off":
+                book.quantity_all -= 1
+            elif kind == "loss":
+                logger.info(
+                    "Книга %s утеряна, необходимо провести списание книги.", book.name
+                )
+                book.quantity_all -= 1
+                book.quantity_lending -= 1
+                book.amount_lending -= 1
+                closings.append((issuances.pop(0), lending))
+            changed_books[book.pk] = book
+            lendings.append(lending)
+            results.append(lending)
+
+        Lending.objects.bulk_create(lendings)
+        record_circulation_changes(lendings)  # bulk_create не вызывает сигналы модели
+        for issuance, lending in closings:
+            # пометка о возврате или утере книги в операции выдачи книги
+            issuance.closing = lending
+            issuance.is_return = lending.operation == "return"
+            issuance.is_loss = lending.operation == "loss"
+        Lending.objects.bulk_update(
+            [issuance for issuance, _ in closings],
+            ["closing", "is_return", "is_loss"],
+        )
+        Books.objects.bulk_update(
+            changed_books.values(),
+            ["quantity_all", "quantity_lending", "amount_lending"],
+        )
+        if changed_books:
+            invalidate_books(changed_books)
+    return [
+        {"id": result.pk} if isinstance(result, Lending) else result
+        for result in results
+    ]
+
+
+class Echo:
+    """Буфер для csv.writer, который возвращает записанную строку, а не накапливает ее."""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(columns, rows):
+    """Строки CSV (заголовок и строки rows) по одной, по мере чтения rows."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_stream(columns, rows):
+    """Строки NDJSON (по объекту JSON на строку rows) по одной, по мере чтения rows."""
+    for row in rows:
+        yield json.dumps(
+            dict(zip(columns, row)), ensure_ascii=False, default=str
+        ) + "\n"
+
+
+def reserve_ids(model, count):
+    """Следующие count значений последовательности id таблицы модели (PostgreSQL).
+    Объекты с такими id можно связать между собой до записи и записать bulk_create или COPY,
+    последовательность при этом остается согласованной с таблицей."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [model._meta.db_table, count],
+        )
+        return [pk for (pk,) in cursor.fetchall()]
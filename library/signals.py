@@ -0,0 +1,72 @@
+import time
+
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from library.cache import invalidate_authors, invalidate_books
+from library.metrics import finish_task_run, start_task_run
+from library.models import Authors, Books, Lending
+from library.search import update_search_vectors
+from library.statistics import record_circulation_changes
+
+SEARCH_FIELDS = {"name", "annotation", "author"}
+TASKS_MODULE = "library.tasks."
+
+
+@receiver([post_save, post_delete], sender=Books)
+def reset_book_cache(sender, instance, **kwargs):
+    """Сброс кеша каталога при изменении или удалении книги."""
+    invalidate_books([instance.pk])
+
+
+@receiver(post_save, sender=Books)
+def update_book_search_vector(sender, instance, update_fields=None, **kwargs):
+    """Пересчет поискового вектора книги при изменении названия, автора или аннотации."""
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        update_search_vectors(Books.objects.filter(pk=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Authors)
+def reset_author_cache(sender, instance, **kwargs):
+    """Сброс кеша каталога при изменении или удалении автора (вместе с его книгами)."""
+    invalidate_authors(
+        [instance.pk],
+        Books.objects.filter(author_id=instance.pk).values_list("pk", flat=True),
+    )
+
+
+@receiver(post_save, sender=Authors)
+def update_author_search_vectors(sender, instance, created, **kwargs):
+    """Пересчет поисковых векторов книг автора при изменении имени автора."""
+    if not created:
+        update_search_vectors(Books.objects.filter(author_id=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Lending)
+def record_lending_change(sender, instance, **kwargs):
+    """Пересчет статистики дня и книги операции при ее проведении, изменении или удалении."""
+    record_circulation_changes([instance])
+
+
+@before_task_publish.connect
+def stamp_task_published(sender=None, headers=None, **kwargs):
+    """Время постановки задачи в очередь (заголовок published_at) для замера ожидания в очереди."""
+    if headers is not None and str(sender).startswith(TASKS_MODULE):
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def start_task_metrics(task_id=None, task=None, **kwargs):
+    if task.name.startswith(TASKS_MODULE):
+        request = task.request
+        published_at = getattr(request, "published_at", None) or (
+            request.headers or {}
+        ).get("published_at")
+        start_task_run(task_id, published_at)
+
+
+@task_postrun.connect
+def finish_task_metrics(task_id=None, task=None, state=None, **kwargs):
+    if task.name.startswith(TASKS_MODULE):
+        finish_task_run(task_id, task.name, state)
@@ -0,0 +1,93 @@
+# Статистика движения книг для отчетов. Журнал операций (Lending) сворачивается в суточную статистику по книгам
+# (CirculationDaily). Каждая операция и удаление операции добавляет в очередь CirculationChange пару (день, книга),
+# задача update_circulation_statistics пересчитывает по журналу статистику только этих пар. Пересчет пары целиком
+# (а не прибавление) делает обработку повторяемой: одна пара может попасть в очередь несколько раз.
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from library.models import CirculationChange, CirculationDaily, Lending
+
+COUNTERS = {
+    "issuances": Count("id", filter=Q(operation="issuance")),
+    "returns": Count("id", filter=Q(operation="return")),
+    "losses": Count("id", filter=Q(operation="loss")),
+    "write_offs": Count("id", filter=Q(operation="write_off")),
+    "arrivals": Coalesce(
+        Sum("arrival_quantity", filter=Q(operation__in=("arrival", "inventory"))), 0
+    ),
+}
+
+# группировки отчета: имя поля отчета и выражение
+REPORT_GROUPS = {
+    "day": ("day", F("date_event")),
+    "month": ("month", TruncMonth("date_event")),
+    "book": ("book_name", F("book__name")),
+    "genre": ("genre", F("book__genre")),
+    "author": ("author", F("book__author__author")),
+}
+
+
+def record_circulation_changes(lendings):
+    """Постановка в очередь пересчета статистики дней и книг операций lendings."""
+    CirculationChange.objects.bulk_create(
+        CirculationChange(date_event=lending.date_event, book_id=lending.book_id)
+        for lending in lendings
+    )
+
+
+def update_circulation(batch_size):
+    """Пересчет статистики по одной пачке очереди изменений в одной транзакции.
+    Строки очереди, обрабатываемые параллельной задачей, пропускаются (SKIP LOCKED).
+    Возвращает количество обработанных строк очереди."""
+    with transaction.atomic():
+        changes = list(
+            CirculationChange.objects.select_for_update(skip_locked=True)
+            .order_by("pk")
+            .values_list("pk", "date_event", "book_id")[:batch_size]
+        )
+        if not changes:
+            return 0
+        keys = {(date_event, book_id) for _, date_event, book_id in changes}
+        condition = Q()
+        for date_event, book_id in keys:
+            condition |= Q(date_event=date_event, book_id=book_id)
+        rows = [
+            CirculationDaily(**row)
+            for row in Lending.objects.filter(condition)
+            .values("date_event", "book_id")
+            .annotate(**COUNTERS)
+            .order_by()
+        ]
+        # пары, все операции которых удалены
+        empty = keys - {(row.date_event, row.book_id) for row in rows}
+        if empty:
+            condition = Q()
+            for date_event, book_id in empty:
+                condition |= Q(date_event=date_event, book_id=book_id)
+            CirculationDaily.objects.filter(condition).delete()
+        CirculationDaily.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["date_event", "book"],
+            update_fields=list(COUNTERS),
+        )
+        CirculationChange.objects.filter(pk__in=[pk for pk, _, _ in changes]).delete()
+    return len(changes)
+
+
+def circulation_report(year, month=None, group="genre", genre=None):
+    """Отчет о движении книг за год (или месяц года) по статистике, сгруппированный по дням, месяцам, книгам,
+    жанрам или авторам (group). genre - отчет только по книгам жанра."""
+    rows = CirculationDaily.objects.filter(date_event__year=year)
+    if month is not None:
+        rows = rows.filter(date_event__month=month)
+    if genre is not None:
+        rows = rows.filter(book__genre=genre)
+    name, expression = REPORT_GROUPS[group]
+    return list(
+        rows.values(**{name: expression})
+        .annotate(**{counter: Sum(counter) for counter in COUNTERS})
+        .order_by(name)
+    )
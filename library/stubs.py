@@ -0,0 +1,81 @@
+# Локальная заглушка Telegram Bot API для тестов и замеров клиента Телеграма (library.services.TelegramClient).
+# Сервер запоминает полученные сообщения, отвечает с заданной задержкой и может отвечать 429 (слишком много
+# запросов) на первое сообщение в указанные чаты.
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class TelegramStub(ThreadingHTTPServer):
+    """Заглушка Telegram Bot API: GET /bot<token>/sendMessage?chat_id=...&text=..."""
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, flood_chats=(), retry_after=1):
+        super().__init__(("127.0.0.1", 0), TelegramStubHandler)
+        self.latency = latency
+        self.flood_chats = set(flood_chats)
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.messages = []  # (время получения, chat_id, текст)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = set()  # адреса клиентских соединений
+
+    @property
+    def url(self):
+        """Значение для TELEGRAM_URL."""
+        return f"http://127.0.0.1:{self.server_address[1]}/bot"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # соединения держатся открытыми (keep-alive)
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        chat_id = query["chat_id"][0]
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            flood = chat_id in server.flood_chats
+            server.flood_chats.discard(chat_id)
+        time.sleep(server.latency)
+        with server.lock:
+            server.in_flight -= 1
+            if not flood:
+                server.messages.append((time.monotonic(), chat_id, query["text"][0]))
+        if flood:
+            self.reply(
+                429,
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "parameters": {"retry_after": server.retry_after},
+                },
+            )
+        else:
+            self.reply(200, {"ok": True, "result": {"chat": {"id": chat_id}}})
+
+    def reply(self, status, body):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
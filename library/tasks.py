@@ -1,56 +1,302 @@
-from datetime import datetime, timedelta
+import logging
+import time
+from datetime import date, datetime, timedelta
+from itertools import groupby, islice
 
 import pytz
-from celery import shared_task
-from django.core.mail import send_mail
+from celery import chord, shared_task
+from django.core.mail import EmailMessage
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 
 from config import settings
 from config.settings import EMAIL_HOST_USER
-from library.models import Lending
-from library.services import telegram_message
+from library.metrics import check_slow_run, record_task_items
+from library.models import Lending, Reminder
+from library.services import get_telegram_client, send_mail_messages
+from library.statistics import update_circulation
+
+logger = logging.getLogger(__name__)
+
+RETURN_DAYS = 10  # срок возврата книги
+REMINDER_DAYS = 7  # день первого напоминания о возврате
+CHUNK_SIZE = 2000  # размер пачки строк, читаемых из БД за один раз
+READERS_PER_TASK = 500  # количество читателей в одной подзадаче рассылки
+# количество изменений журнала, пересчитываемых в одной транзакции
+STATISTICS_BATCH = 500
+
+
+def books_for_return(today):
+    """Невозвращенные выдачи, по которым сегодня нужно отправить напоминание: срок возврата наступил или прошел,
+    либо до него осталось три дня. Выдачи, по которым сегодня уже отправлены напоминания по всем каналам читателя
+    (журнал Reminder), пропускаются. Книга и читатель загружаются тем же запросом, выдачи упорядочены по читателям.
+    """
+    return (
+        Lending.objects.filter(operation="issuance", closing__isnull=True)
+        .filter(
+            Q(date_event__lte=today - timedelta(days=RETURN_DAYS))
+            | Q(date_event=today - timedelta(days=REMINDER_DAYS))
+        )
+        .annotate(
+            mail_sent=reminder_sent(today, "mail"),
+            telegram_sent=reminder_sent(today, "telegram"),
+        )
+        .filter(
+            Q(mail_sent=False)
+            | Q(telegram_sent=False)
+            & Q(user__tg_chat_id__isnull=False)
+            & ~Q(user__tg_chat_id="")
+        )
+        .select_related("book", "user")
+        .only("date_event", "book__name", "user__email", "user__tg_chat_id")
+        .order_by("user_id", "date_event", "id")
+    )
+
+
+def reminder_sent(today, channel):
+    """Условие: напоминание по выдаче сегодня уже отправлено по каналу."""
+    return Exists(
+        Reminder.objects.filter(
+            lending=OuterRef("pk"), date_event=today, channel=channel
+        )
+    )
+
+
+def claim_reminders(lendings, channel, today):
+    """Запись напоминаний по выдачам lendings в журнал до отправки. Выдачу, по которой напоминание сегодня уже
+    записано (в том числе параллельным запуском рассылки), занять нельзя. Возвращает занятые выдачи - только
+    по ним отправляется напоминание."""
+    if not lendings:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {Reminder._meta.db_table} (lending_id, channel, date_event) "
+            "SELECT unnest(%s::bigint[]), %s, %s ON CONFLICT DO NOTHING RETURNING lending_id",
+            [[lending.pk for lending in lendings], channel, today],
+        )
+        claimed = {lending_id for lending_id, in cursor.fetchall()}
+    return [lending for lending in lendings if lending.pk in claimed]
+
+
+def release_reminders(lendings, channel, today):
+    """Удаление записей журнала по неотправленным напоминаниям: они будут отправлены при следующем запуске."""
+    if lendings:
+        Reminder.objects.filter(
+            lending__in=lendings, channel=channel, date_event=today
+        ).delete()
+
+
+def return_message(book_for_return, today):
+    """Текст напоминания о возврате книги."""
+    return_date = book_for_return.date_event + timedelta(days=RETURN_DAYS)
+    if today > return_date:
+        return f"Вы должны немедленно вернуть книгу {book_for_return.book.name}"
+    elif today == return_date:
+        return f"Вы сегодня должны вернуть книгу {book_for_return.book.name}"
+    return f"Вы должны вернуть книгу {book_for_return.book.name} {return_date}"
+
+
+def reader_messages(today, first_user_id, last_user_id):
+    """Напоминания читателям с id от first_user_id до last_user_id: одно письмо и одно сообщение в Телеграм
+    на читателя со всеми книгами, о которых по этому каналу сегодня еще не напоминали.
+    Возвращает тройки (читатель, выдачи для письма, выдачи для Телеграма)."""
+    books = (
+        books_for_return(today)
+        .filter(user_id__gte=first_user_id, user_id__lte=last_user_id)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for _, reader_books in groupby(books, key=lambda lending: lending.user_id):
+        reader_books = list(reader_books)
+        user = reader_books[0].user
+        mail_books = [lending for lending in reader_books if not lending.mail_sent]
+        telegram_books = []
+        if user.tg_chat_id:
+            telegram_books = [
+                lending for lending in reader_books if not lending.telegram_sent
+            ]
+        yield user, mail_books, telegram_books
+
+
+def books_message(books, today):
+    """Текст напоминания со всеми книгами читателя."""
+    return "\n".join(
+        return_message(book_for_return, today) for book_for_return in books
+    )
+
+
+def reader_ranges(today):
+    """Диапазоны id читателей (первый, последний), которым сегодня нужны напоминания,
+    по READERS_PER_TASK читателей в диапазоне."""
+    user_ids = (
+        books_for_return(today)
+        .order_by("user_id")
+        .values_list("user_id", flat=True)
+        .distinct()
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    while chunk := list(islice(user_ids, READERS_PER_TASK)):
+        yield chunk[0], chunk[-1]
 
 
 @shared_task
 def send_mail_return_books():
     """Функция отправки уведомлений читателям о небходимости возвата книг. Сообщение отправляется на электронну почту и,
     если есть telegram chat_bot, соотвественно и туда. Сообщения отправляеются один раз в день. Первое сообщение
-    отправляется за три дня, а по достижению срока возврата каждый день."""
+    отправляется за три дня, а по достижению срока возврата каждый день.
+    Читатели, которым нужны напоминания, делятся на диапазоны id, и каждый диапазон обрабатывается отдельной
+    подзадачей send_return_reminders на любом свободном воркере. Итог рассылки собирает collect_return_reminders.
+    """
     timezone.activate(pytz.timezone(settings.CELERY_TIMEZONE))
     zone = pytz.timezone(settings.CELERY_TIMEZONE)
     today = datetime.now(zone).date()  # текущее дата_время
-    # books_for_return - список книг не возвращненых читателями
-    books_for_return = Lending.objects.filter(operation="issuance", id_return=0)
-    if books_for_return:
-        for book_for_return in books_for_return:
-            if today > book_for_return.date_event + timedelta(days=10):
-                message = (
-                    f"Вы должны немедленно вернуть книгу {book_for_return.book.name}"
-                )
-                print(message)
-            elif today == book_for_return.date_event + timedelta(days=10):
-                message = f"Вы сегодня должны вернуть книгу {book_for_return.book.name}"
-                print(message)
-            else:
-                if today == book_for_return.date_event + timedelta(days=7):
-                    message = f"Вы должны вернуть книгу {book_for_return.book.name} {book_for_return.date_event + timedelta(days=10)}"
-                print(message)
-
-            if message:
-                user_tg = (
-                    book_for_return.user.tg_chat_id
-                )  # telegram chat_bott_id читателя
-                if user_tg:
-                    telegram_message(user_tg, message)
-
-                to_email = (
-                    book_for_return.user.email
-                )  # адрес электронной почты читателя
-                subject = "Возврат книги"
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    recipient_list=[to_email],
+    started = time.time()
+    subtasks = [
+        send_return_reminders.s(today.isoformat(), first_user_id, last_user_id)
+        for first_user_id, last_user_id in reader_ranges(today)
+    ]
+    record_task_items(subtasks=len(subtasks))
+    if not subtasks:
+        return collect_return_reminders([], started)
+    return chord(subtasks)(collect_return_reminders.s(started)).id
+
+
+@shared_task
+def send_return_reminders(today, first_user_id, last_user_id):
+    """Рассылка напоминаний читателям с id от first_user_id до last_user_id.
+    Из БД выбираются только выдачи, по которым сегодня нужно напоминание, строки читаются пачками. Читатель получает
+    одно письмо со всеми книгами, письма отправляются через одно SMTP-соединение, сообщения в Телеграм - параллельно
+    общим клиентом Телеграма. Напоминания записываются в журнал Reminder перед отправкой (claim_reminders), записи
+    неотправленных удаляются после отправки."""
+    started = time.time()
+    today = date.fromisoformat(today)
+    rows = 0  # прочитанные выдачи
+    telegram_readers = []  # (читатель, выдачи для Телеграма)
+    pending = []  # выдачи письма, которое отправляется (до продолжения генератора)
+
+    def mail_messages():
+        nonlocal rows, pending
+        for user, mail_books, telegram_books in reader_messages(
+            today, first_user_id, last_user_id
+        ):
+            rows += len({lending.pk for lending in mail_books + telegram_books})
+            if telegram_books:
+                telegram_readers.append((user, telegram_books))
+            # напоминание записывается в журнал до отправки, чтобы его не отправил и параллельный или следующий
+            # запуск, если этот прервется
+            mail_books = claim_reminders(mail_books, "mail", today)
+            if mail_books:
+                email = EmailMessage(
+                    subject="Возврат книги",
+                    body=books_message(mail_books, today),
                     from_email=EMAIL_HOST_USER,
-                    fail_silently=True,
+                    to=[user.email],  # адрес электронной почты читателя
                 )
+                # выдачи письма: при ошибке отправки их записи удаляются из журнала
+                email.lendings = mail_books
+                pending = mail_books
+                yield email
+                pending = []
+
+    try:
+        sent, failed = send_mail_messages(mail_messages())
+    except Exception:
+        # письмо, на отправке которого прервалась рассылка, будет отправлено при следующем запуске
+        release_reminders(pending, "mail", today)
+        raise
+    for message, error in failed:
+        logger.warning(
+            "Напоминание о возврате для %s не отправлено: %s", message.to, error
+        )
+
+    claimed = {
+        lending.pk
+        for lending in claim_reminders(
+            [lending for _, books in telegram_readers for lending in books],
+            "telegram",
+            today,
+        )
+    }
+    telegram_messages = {}  # (chat_id, текст): выдачи
+    for user, books in telegram_readers:
+        books = [lending for lending in books if lending.pk in claimed]
+        if books:
+            # telegram chat_bott_id читателя
+            message = (user.tg_chat_id, books_message(books, today))
+            telegram_messages[message] = books
+    telegram_sent, telegram_failed = get_telegram_client().send_messages(
+        list(telegram_messages)
+    )
+    for (chat_id, _), error in telegram_failed:
+        logger.warning(
+            "Напоминание о возврате в Телеграм %s не отправлено: %s", chat_id, error
+        )
+
+    # неотправленные напоминания удаляются из журнала и будут отправлены при следующем запуске
+    release_reminders(
+        [lending for message, _ in failed for lending in message.lendings],
+        "mail",
+        today,
+    )
+    release_reminders(
+        [
+            lending
+            for message, _ in telegram_failed
+            for lending in telegram_messages[message]
+        ],
+        "telegram",
+        today,
+    )
+    record_task_items(
+        rows=rows,
+        emails_sent=sent,
+        emails_failed=len(failed),
+        telegram_sent=telegram_sent,
+        telegram_failed=len(telegram_failed),
+    )
+    return {
+        "sent": sent,
+        "failed": len(failed),
+        "telegram_sent": telegram_sent,
+        "telegram_failed": len(telegram_failed),
+        "duration": round(time.time() - started, 3),
+    }
+
+
+@shared_task
+def collect_return_reminders(results, started):
+    """Итог рассылки напоминаний: сумма результатов подзадач и общее время рассылки."""
+    summary = {
+        key: sum(result[key] for result in results)
+        for key in ("sent", "failed", "telegram_sent", "telegram_failed")
+    }
+    summary["tasks"] = len(results)
+    summary["duration"] = round(time.time() - started, 3)
+    logger.info("Рассылка напоминаний о возврате завершена: %s", summary)
+    # рассылка целиком (с подзадачами) не должна захватывать следующий запуск по расписанию
+    check_slow_run("library.tasks.send_mail_return_books", summary["duration"])
+    return summary
+
+
+@shared_task
+def prune_reminders():
+    """Удаление записей журнала напоминаний за прошедшие дни. Рассылка проверяет только записи за сегодня,
+    без очистки журнал рос бы на запись в день по каждой просроченной выдаче и каналу.
+    """
+    today = datetime.now(pytz.timezone(settings.CELERY_TIMEZONE)).date()
+    deleted, _ = Reminder.objects.filter(date_event__lt=today).delete()
+    record_task_items(rows=deleted)
+    return deleted
+
+
+@shared_task
+def update_circulation_statistics():
+    """Пересчет суточной статистики движения книг по изменениям журнала операций, накопленным с прошлого запуска."""
+    processed = 0
+    while True:
+        count = update_circulation(STATISTICS_BATCH)
+        if not count:
+            break
+        processed += count
+    record_task_items(rows=processed)
+    return processed
@@ -1,9 +1,48 @@
+import csv
+import json
+import os
+import smtplib
+import tempfile
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+from urllib.parse import urlencode
+
+import pytz
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, router, transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (AsyncClient, RequestFactory, SimpleTestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-from library.models import Authors, Books, Lending
+from config import celery_app, settings
+from library.cache import detail_key
+from library.metrics import registry
+from library.models import (Authors, Books, CirculationChange,
+                            CirculationDaily, Lending, Reminder)
+from library.routers import ReplicaRoutingMiddleware, replica_reads
+from library.search import trigram_enabled
+from library.services import TelegramClient, send_mail_messages
+from library.signals import stamp_task_published
+from library.stubs import TelegramStub
+from library.tasks import (books_for_return, claim_reminders, prune_reminders,
+                           send_mail_return_books, send_return_reminders,
+                           update_circulation_statistics)
 from users.models import Users
 
 
@@ -11,6 +50,7 @@ class AuthorsTestCase(APITestCase):
     """Тестирование CRUD авторов."""
 
     def setUp(self):
+        cache.clear()
         self.user = Users.objects.create(
             email="ivc@yandex.ru",
             password="123qwe",
@@ -63,6 +103,7 @@ class BooksTestCase(APITestCase):
     """Тестирование CRUD книг."""
 
     def setUp(self):
+        cache.clear()
         self.user = Users.objects.create(
             email="ivc@yandex.ru",
             password="123qwe",
@@ -268,6 +309,50 @@ class LibraryCreateTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Lending.objects.all().count(), 3)
 
+    def test_lending_create_issuance_unavailable(self):
+        """Тест выдачи книги, все экземпляры которой на руках у читателей."""
+        url = reverse("library:lending_create")
+        data = {
+            "user": self.user.pk,
+            "book": self.book.pk,
+            "operation": "issuance",
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity_lending, 1)
+        self.assertEqual(self.book.amount_lending, 1)
+
+    def test_lending_return_delete(self):
+        """Тест отмены возврата книги: операция выдачи снова становится невозвращенной."""
+        url = reverse("library:lending_create")
+        data = {
+            "user": self.user.pk,
+            "book": self.book.pk,
+            "operation": "arrival",
+            "arrival_quantity": 1,
+        }
+        self.client.post(url, data)
+        data = {
+            "user": self.user.pk,
+            "book": self.book.pk,
+            "operation": "issuance",
+        }
+        issuance_pk = self.client.post(url, data).json()["id"]
+        data["operation"] = "return"
+        return_pk = self.client.post(url, data).json()["id"]
+        issuance = Lending.objects.get(pk=issuance_pk)
+        self.assertEqual(issuance.closing_id, return_pk)
+
+        url = reverse("library:lending_delete", args=(return_pk,))
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        issuance.refresh_from_db()
+        self.assertIsNone(issuance.closing_id)
+        self.assertFalse(issuance.is_return)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity_lending, 2)
+
     class LibraryDeleteTestCase(APITestCase):
         """Тестирование работы библиотеки (отмена операций)."""
 
@@ -414,3 +499,1771 @@ class LibraryCreateTestCase(APITestCase):
             response = self.client.patch(url, data)
             self.assertEqual(response.status_code, status.HTTP_200_OK)
             self.assertEqual(data.get("is_write_off"), "true")
+
+
+class LibraryBulkCreateTestCase(APITestCase):
+    """Тестирование пакетного проведения операций."""
+
+    def setUp(self):
+        self.user = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        self.reader = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        self.author = Authors.objects.create(author="Джек Лондон")
+        self.book = Books.objects.create(
+            name="Любовь к жизни",
+            genre="story",
+            author=self.author,
+            quantity_all=0,
+            quantity_lending=0,
+            amount_lending=0,
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_lending_bulk(self):
+        """Тест пакета из разных операций с ошибочными операциями внутри."""
+        url = reverse("library:lending_bulk")
+        data = [
+            {"user": self.user.pk, "book": self.book.pk, "operation": "issuance"},
+            {
+                "user": self.user.pk,
+                "book": self.book.pk,
+                "operation": "arrival",
+                "arrival_quantity": 2,
+            },
+            {"user": self.reader.pk, "book": self.book.pk, "operation": "issuance"},
+            {"user": self.reader.pk, "book": self.book.pk, "operation": "issuance"},
+            {"user": self.user.pk, "book": self.book.pk, "operation": "issuance"},
+            {"user": self.reader.pk, "book": self.book.pk, "operation": "return"},
+            {"user": self.reader.pk, "book": self.book.pk, "operation": "return"},
+            {"user": self.user.pk, "book": self.book.pk, "operation": "loss"},
+            {"user": self.user.pk, "book": 0, "operation": "arrival"},
+            {"user": self.user.pk, "book": self.book.pk, "operation": "unknown"},
+        ]
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.json()
+        self.assertEqual(
+            [("id" in result) for result in results],
+            [False, True, True, False, True, True, False, True, False, False],
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity_all, 1)
+        self.assertEqual(self.book.quantity_lending, 0)
+        self.assertEqual(self.book.amount_lending, 1)
+        self.assertEqual(Lending.objects.count(), 5)
+        issuance = Lending.objects.get(user=self.reader, operation="issuance")
+        self.assertEqual(issuance.closing_id, results[5]["id"])
+        self.assertTrue(issuance.is_return)
+        issuance = Lending.objects.get(user=self.user, operation="issuance")
+        self.assertEqual(issuance.closing_id, results[7]["id"])
+        self.assertTrue(issuance.is_loss)
+
+    def test_lending_bulk_queries(self):
+        """Количество запросов не зависит от размера пакета."""
+        url = reverse("library:lending_bulk")
+        readers = Users.objects.bulk_create(
+            Users(email=f"reader{number}@yandex.ru", password="123qwe")
+            for number in range(50)
+        )
+        data = [
+            {
+                "user": self.user.pk,
+                "book": self.book.pk,
+                "operation": "arrival",
+                "arrival_quantity": 50,
+            }
+        ]
+        data += [
+            {"user": reader.pk, "book": self.book.pk, "operation": "issuance"}
+            for reader in readers[:5]
+        ]
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, data, format="json")
+        data = [
+            {"user": reader.pk, "book": self.book.pk, "operation": "issuance"}
+            for reader in readers[5:]
+        ]
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(url, data, format="json")
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Lending.objects.filter(operation="issuance").count(), 50)
+
+
+class CatalogCacheTestCase(APITestCase):
+    """Тестирование кеша каталога и его сброса при операциях по библиотеке и изменении книг и авторов."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        self.author = Authors.objects.create(author="Джек Лондон")
+        self.book = Books.objects.create(
+            name="Любовь к жизни",
+            author=self.author,
+            quantity_all=2,
+            quantity_lending=0,
+            amount_lending=0,
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def get(self, url):
+        """Ответ API и количество запросов к каталогу."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        catalog = [
+            query
+            for query in queries
+            if '"library_books"' in query["sql"] or '"library_authors"' in query["sql"]
+        ]
+        return response, len(catalog)
+
+    def test_catalog_hit(self):
+        urls = [
+            reverse("books-list"),
+            reverse("books-list") + "?genre=story&ordering=name",
+            reverse("books-detail", args=(self.book.pk,)),
+            reverse("authors-list"),
+            reverse("authors-detail", args=(self.author.pk,)),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response, queries = self.get(url)
+                self.assertEqual(response["X-Cache"], "MISS")
+                self.assertGreater(queries, 0)
+                response, queries = self.get(url)
+                self.assertEqual(response["X-Cache"], "HIT")
+                self.assertEqual(queries, 0)
+        response = self.client.get(reverse("library:catalog_cache_stats"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json()["books"], {"hit": 3, "miss": 3, "hit_ratio": 0.5}
+        )
+        self.assertEqual(response.json()["authors"]["hit"], 2)
+
+    def test_lending_invalidates_book(self):
+        detail = reverse("books-detail", args=(self.book.pk,))
+        books = reverse("books-list")
+        self.get(detail)
+        self.get(books)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("library:lending_create"),
+                {"user": self.user.pk, "book": self.book.pk, "operation": "issuance"},
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response, _ = self.get(detail)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["quantity_lending"], 1)
+        response, _ = self.get(books)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["results"][0]["quantity_lending"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("library:lending_bulk"),
+                [{"user": self.user.pk, "book": self.book.pk, "operation": "return"}],
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response, _ = self.get(detail)
+        self.assertEqual(response.json()["quantity_lending"], 0)
+
+    def test_stale_detail_after_invalidation(self):
+        """Ответ, прочитанный до фиксации изменения и сохраненный в кеш после сброса, больше не выдается."""
+        detail = reverse("books-detail", args=(self.book.pk,))
+        # параллельный запрос определил ключ ответа и прочитал книгу до фиксации выдачи
+        key = detail_key("books", self.book.pk)
+        stale, _ = self.get(detail)
+        cache.delete(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("library:lending_create"),
+                {"user": self.user.pk, "book": self.book.pk, "operation": "issuance"},
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # и сохранил старый ответ уже после сброса кеша
+        cache.set(key, stale.json())
+        response, _ = self.get(detail)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["quantity_lending"], 1)
+        response, _ = self.get(detail)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.json()["quantity_lending"], 1)
+
+    def test_author_invalidates_books(self):
+        detail = reverse("books-detail", args=(self.book.pk,))
+        self.get(detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse("authors-detail", args=(self.author.pk,)),
+                {"author": "Марк Твен"},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response, _ = self.get(detail)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["author"]["author"], "Марк Твен")
+
+
+class LendingCursorTestCase(APITestCase):
+    """Тестирование постраничного вывода журнала операций по ключу."""
+
+    def setUp(self):
+        self.user = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        author = Authors.objects.create(author="Джек Лондон")
+        book = Books.objects.create(name="Любовь к жизни", author=author)
+        today = datetime.now().date()
+        Lending.objects.bulk_create(
+            Lending(
+                user=self.user,
+                book=book,
+                operation="issuance" if number % 2 else "arrival",
+                date_event=today - timedelta(days=number % 4),
+            )
+            for number in range(13)
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def get_pages(self, query):
+        """Обход журнала по ссылкам next, возвращает id записей по страницам и последний ответ."""
+        url = reverse("library:lending_list") + query
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(
+                [query for query in queries if "COUNT(" in query["sql"].upper()]
+            )
+            pages.append([lending["id"] for lending in response.json()["results"]])
+            url = response.json()["next"]
+        return pages, response
+
+    def test_cursor_pages(self):
+        orderings = {
+            "": ["id"],
+            "-date_event": ["-date_event", "-id"],
+            "date_event": ["date_event", "id"],
+            "book": ["book", "id"],
+        }
+        for ordering, key in orderings.items():
+            with self.subTest(ordering=ordering):
+                pages, response = self.get_pages(
+                    f"?cursor=&page_size=5&ordering={ordering}"
+                )
+                lendings = Lending.objects.order_by(*key)
+                expected = list(lendings.values_list("id", flat=True))
+                self.assertEqual([len(page) for page in pages], [5, 5, 3])
+                self.assertEqual(sum(pages, []), expected)
+                # предыдущая страница от последней
+                response = self.client.get(response.json()["previous"])
+                self.assertEqual(
+                    [lending["id"] for lending in response.json()["results"]],
+                    pages[1],
+                )
+
+    def test_cursor_filter(self):
+        pages, _ = self.get_pages("?cursor=&operation=issuance&ordering=-date_event")
+        expected = Lending.objects.filter(operation="issuance").order_by(
+            "-date_event", "-id"
+        )
+        self.assertEqual(sum(pages, []), list(expected.values_list("id", flat=True)))
+
+    def test_cursor_invalid(self):
+        response = self.client.get(reverse("library:lending_list") + "?cursor=xyz")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_malformed_position(self):
+        """Позиция курсора, не приводимая к типам полей ключа, - 404, а не ошибка сервера."""
+        positions = {
+            "": ["abc"],
+            "date_event": ["x", "y"],
+            "book": [{"id": 1}, 1],
+            "-date_event": ["2024-01-01", None],
+        }
+        for ordering, position in positions.items():
+            cursor = b64encode(urlencode({"p": json.dumps(position)}).encode()).decode()
+            query = "?" + urlencode({"cursor": cursor, "ordering": ordering})
+            for url in ("library:lending_list", "library:async_lending_list"):
+                with self.subTest(url=url, ordering=ordering):
+                    response = self.client.get(reverse(url) + query)
+                    self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_size(self):
+        response = self.client.get(
+            reverse("library:lending_list") + "?page_size=2&page=2"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 13)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+
+class ListQueriesTestCase(APITestCase):
+    """Тестирование количества запросов при выводе списков: оно не должно зависеть от количества записей."""
+
+    def setUp(self):
+        self.user = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        self.reader = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        self.number = 0
+        self.add_rows()
+
+    def add_rows(self, count=1):
+        """Книги разных авторов и их выдачи разным читателям и читателю self.reader."""
+        for _ in range(count):
+            self.number += 1
+            author = Authors.objects.create(author=f"Автор {self.number}")
+            self.book = Books.objects.create(name=f"Книга {self.number}", author=author)
+            reader = Users.objects.create(email=f"reader{self.number}@yandex.ru")
+            Lending.objects.create(user=reader, book=self.book, operation="issuance")
+            self.lending = Lending.objects.create(
+                user=self.reader, book=self.book, operation="issuance"
+            )
+
+    def queries(self, user, url):
+        cache.clear()
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_list_queries(self):
+        endpoints = [
+            (self.user, reverse("library:lending_list")),
+            (self.user, reverse("library:lending_list") + "?cursor="),
+            (self.reader, reverse("library:lending_list")),
+            (self.reader, reverse("library:lending_list") + "?cursor="),
+            (self.user, reverse("books-list")),
+            (self.user, reverse("authors-list")),
+        ]
+        expected = [self.queries(user, url) for user, url in endpoints]
+        self.add_rows(4)
+        for (user, url), count in zip(endpoints, expected):
+            with self.subTest(user=user.email, url=url):
+                self.assertEqual(self.queries(user, url), count)
+
+    def test_retrieve_queries(self):
+        endpoints = [
+            (self.user, "library:lending_retrieve", self.lending.pk, 2),
+            (self.reader, "library:lending_retrieve", self.lending.pk, 2),
+            (self.user, "books-detail", self.book.pk, 1),
+        ]
+        for user, name, pk, count in endpoints:
+            with self.subTest(user=user.email, name=name):
+                self.assertEqual(self.queries(user, reverse(name, args=(pk,))), count)
+
+
+class BooksSearchTestCase(APITestCase):
+    """Тестирование поиска по каталогу книг."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        self.london = Authors.objects.create(author="Джек Лондон")
+        twain = Authors.objects.create(author="Марк Твен")
+        self.life = Books.objects.create(
+            name="Любовь к жизни",
+            author=self.london,
+            annotation="Рассказ о борьбе за жизнь на Севере.",
+        )
+        self.fang = Books.objects.create(
+            name="Белый клык",
+            author=self.london,
+            annotation="Повесть о волке и его жизни среди людей.",
+        )
+        self.tom = Books.objects.create(
+            name="Приключения Тома Сойера",
+            author=twain,
+            annotation="Повесть о детстве на Миссисипи.",
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def search(self, text):
+        response = self.client.get(reverse("books-list"), {"search": text})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book["id"] for book in response.json()["results"]]
+
+    def test_search(self):
+        # по автору, по аннотации и по названию в другой словоформе
+        self.assertEqual(self.search("Лондон"), [self.life.pk, self.fang.pk])
+        self.assertEqual(self.search("Миссисипи"), [self.tom.pk])
+        self.assertEqual(self.search("приключение"), [self.tom.pk])
+        # совпадение в названии выше совпадения в аннотации
+        self.assertEqual(self.search("жизнь"), [self.life.pk, self.fang.pk])
+        self.assertEqual(self.search("Лондон клык"), [self.fang.pk])
+
+    def test_search_vector_update(self):
+        self.london.author = "Джон Гриффит Чейни"
+        self.london.save()
+        self.assertEqual(self.search("Лондон"), [])
+        self.assertEqual(self.search("Чейни"), [self.life.pk, self.fang.pk])
+        self.tom.annotation = "Повесть о мальчике с берегов Миссури."
+        self.tom.save()
+        self.assertEqual(self.search("Миссисипи"), [])
+
+    def test_search_typo(self):
+        if not trigram_enabled():
+            self.skipTest("нет расширения pg_trgm")
+        self.assertEqual(self.search("Лондан"), [self.life.pk, self.fang.pk])
+
+
+class BooksAvailabilityTestCase(APITestCase):
+    """Тестирование количества книг в наличии и фильтра по наличию."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        self.reader = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        author = Authors.objects.create(author="Джек Лондон")
+        self.book = Books.objects.create(
+            name="Любовь к жизни", author=author, quantity_all=1, quantity_lending=0
+        )
+        self.books = [
+            Books.objects.create(
+                name=f"Книга {number}",
+                author=author,
+                quantity_all=3,
+                quantity_lending=number,
+            )
+            for number in range(4)
+        ]
+        self.client.force_authenticate(user=self.user)
+
+    def lending(self, user, operation):
+        response = self.client.post(
+            reverse("library:lending_create"),
+            {"user": user.pk, "book": self.book.pk, "operation": operation},
+        )
+        self.book.refresh_from_db()
+        return response
+
+    def test_available_filter(self):
+        url = reverse("books-list")
+        response = self.client.get(
+            url, {"available": "true", "ordering": "-quantity_available"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [book["quantity_available"] for book in response.json()["results"]],
+            [3, 2, 1, 1],
+        )
+        response = self.client.get(url, {"available": "false"})
+        self.assertEqual(
+            [book["id"] for book in response.json()["results"]], [self.books[3].pk]
+        )
+
+    def test_available_operations(self):
+        self.assertEqual(self.lending(self.reader, "issuance").status_code, 201)
+        self.assertEqual(self.book.quantity_available, 0)
+        self.assertEqual(self.lending(self.user, "issuance").status_code, 400)
+        # утерянная книга не возвращается в наличие
+        loss = self.lending(self.reader, "loss")
+        self.assertEqual(loss.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((self.book.quantity_all, self.book.quantity_available), (0, 0))
+        response = self.client.delete(
+            reverse("library:lending_delete", args=(loss.json()["id"],))
+        )
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.quantity_all, self.book.quantity_available), (1, 0))
+
+    def test_available_delete_return(self):
+        self.lending(self.reader, "issuance")
+        issuance_return = self.lending(self.reader, "return").json()
+        self.assertEqual(self.book.quantity_available, 1)
+        self.lending(self.user, "issuance")
+        # возвращенная книга уже выдана другому читателю
+        response = self.client.delete(
+            reverse("library:lending_delete", args=(issuance_return["id"],))
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity_lending, 1)
+
+    def test_available_constraint(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Books.objects.filter(pk=self.book.pk).update(quantity_lending=2)
+
+
+class CirculationStatisticsTestCase(APITestCase):
+    """Тестирование статистики движения книг и отчетов по ней."""
+
+    def setUp(self):
+        self.user = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        self.reader = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        london = Authors.objects.create(author="Джек Лондон")
+        twain = Authors.objects.create(author="Марк Твен")
+        self.story = Books.objects.create(
+            name="Любовь к жизни", author=london, genre="story"
+        )
+        self.novel = Books.objects.create(
+            name="Белый клык", author=london, genre="novel"
+        )
+        self.adventures = Books.objects.create(
+            name="Приключения Тома Сойера", author=twain, genre="adventures"
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def lending(self, book, operation, date_event, **quantity):
+        return Lending.objects.create(
+            user=self.reader,
+            book=book,
+            operation=operation,
+            date_event=date_event,
+            **quantity,
+        )
+
+    def report(self, **params):
+        response = self.client.get(reverse("library:circulation_report"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_circulation_report(self):
+        for book in (self.story, self.novel, self.adventures):
+            self.lending(book, "arrival", "2026-09-01", arrival_quantity=3)
+        self.lending(self.story, "issuance", "2026-09-10")
+        self.lending(self.story, "issuance", "2026-10-02")
+        self.lending(self.story, "return", "2026-10-05")
+        self.lending(self.novel, "issuance", "2026-10-05")
+        self.lending(self.adventures, "loss", "2026-10-07")
+        self.lending(self.adventures, "write_off", "2026-10-07")
+        self.lending(self.adventures, "issuance", "2025-10-07")
+        update_circulation_statistics()
+        self.assertFalse(CirculationChange.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            report = self.report(year=2026, month=10)
+        # роли пользователя и отчет
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(
+            report,
+            [
+                {
+                    "genre": "adventures",
+                    "issuances": 0,
+                    "returns": 0,
+                    "losses": 1,
+                    "write_offs": 1,
+                    "arrivals": 0,
+                },
+                {
+                    "genre": "novel",
+                    "issuances": 1,
+                    "returns": 0,
+                    "losses": 0,
+                    "write_offs": 0,
+                    "arrivals": 0,
+                },
+                {
+                    "genre": "story",
+                    "issuances": 1,
+                    "returns": 1,
+                    "losses": 0,
+                    "write_offs": 0,
+                    "arrivals": 0,
+                },
+            ],
+        )
+        report = self.report(year=2026, group="month", genre="story")
+        self.assertEqual(
+            [(row["month"], row["issuances"], row["arrivals"]) for row in report],
+            [("2026-09-01", 1, 3), ("2026-10-01", 1, 0)],
+        )
+        report = self.report(year=2026, group="author")
+        self.assertEqual(
+            [(row["author"], row["issuances"], row["arrivals"]) for row in report],
+            [("Джек Лондон", 3, 6), ("Марк Твен", 0, 3)],
+        )
+        response = self.client.get(
+            reverse("library:circulation_report"), {"year": 2026, "group": "reader"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_circulation_incremental(self):
+        issuance = self.lending(self.story, "issuance", "2026-10-02")
+        update_circulation_statistics()
+        self.assertEqual(self.report(year=2026)[0]["issuances"], 1)
+        # новые операции (в том числе пакетные) и удаление операции
+        self.lending(self.story, "issuance", "2026-10-02")
+        response = self.client.post(
+            reverse("library:lending_bulk"),
+            [
+                {
+                    "user": self.user.pk,
+                    "book": self.story.pk,
+                    "operation": "arrival",
+                    "arrival_quantity": 2,
+                    "date_event": "2026-10-03",
+                }
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        issuance.delete()
+        self.assertEqual(update_circulation_statistics(), 3)
+        self.assertEqual(update_circulation_statistics(), 0)
+        row = CirculationDaily.objects.get(book=self.story, date_event="2026-10-02")
+        self.assertEqual(row.issuances, 1)
+        self.assertEqual(self.report(year=2026)[0]["arrivals"], 2)
+        Lending.objects.filter(book=self.story, date_event="2026-10-02").delete()
+        update_circulation_statistics()
+        self.assertFalse(
+            CirculationDaily.objects.filter(date_event="2026-10-02").exists()
+        )
+
+
+class ReconcileBooksTestCase(APITestCase):
+    """Тестирование сверки счетчиков книг с журналом операций."""
+
+    def setUp(self):
+        self.user = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        self.reader = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        author = Authors.objects.create(author="Джек Лондон")
+        self.books = [
+            Books.objects.create(
+                name=f"Книга {number}",
+                author=author,
+                quantity_all=0,
+                quantity_lending=0,
+                amount_lending=0,
+            )
+            for number in range(5)
+        ]
+        self.client.force_authenticate(user=self.user)
+        url = reverse("library:lending_create")
+        for book in self.books:
+            operations = [
+                (self.user, "arrival"),
+                (self.reader, "issuance"),
+                (self.user, "issuance"),
+                (self.reader, "return"),
+                (self.user, "loss"),
+                (self.user, "write_off"),
+            ]
+            for user, operation in operations:
+                response = self.client.post(
+                    url,
+                    {
+                        "user": user.pk,
+                        "book": book.pk,
+                        "operation": operation,
+                        "arrival_quantity": 4,
+                    },
+                )
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command(
+            "reconcile_books", "--workers=1", "--chunk-size=2", *args, stdout=out
+        )
+        return out.getvalue()
+
+    def test_reconcile(self):
+        self.assertEqual(self.reconcile(), "Книг с расхождениями: 0.\n")
+        Books.objects.filter(pk=self.books[1].pk).update(
+            quantity_all=F("quantity_all") + 1
+        )
+        Books.objects.filter(pk=self.books[3].pk).update(amount_lending=5)
+        output = self.reconcile()
+        self.assertIn(f"{self.books[1].pk} 'Книга 1': quantity_all 3 -> 2", output)
+        self.assertIn(f"{self.books[3].pk} 'Книга 3': amount_lending 5 -> 1", output)
+        self.assertTrue(output.endswith("Книг с расхождениями: 2.\n"))
+
+        output = self.reconcile("--fix")
+        self.assertTrue(output.endswith("Книг с расхождениями: 2. Исправлено: 2.\n"))
+        self.assertEqual(self.reconcile(), "Книг с расхождениями: 0.\n")
+        self.assertEqual(
+            list(
+                Books.objects.values_list(
+                    "quantity_all", "quantity_lending", "amount_lending"
+                ).distinct()
+            ),
+            [(2, 0, 1)],
+        )
+
+
+class LendingExportTestCase(APITestCase):
+    """Тестирование выгрузки журнала операций."""
+
+    def setUp(self):
+        self.user = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        self.reader = Users.objects.create(
+            email="reader@yandex.ru", password="123qwe", reader_name="Лукин В.М."
+        )
+        author = Authors.objects.create(author="Джек Лондон")
+        self.book = Books.objects.create(name="Любовь к жизни", author=author)
+        Lending.objects.bulk_create(
+            Lending(
+                user=self.reader if number % 3 else self.user,
+                book=self.book,
+                operation="issuance" if number % 3 else "arrival",
+                date_event=date(2026, 10, 1) + timedelta(days=number % 5),
+            )
+            for number in range(30)
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse("library:lending_export"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response
+
+    def test_export_csv(self):
+        response = self.export(operation="issuance", ordering="-date_event")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(
+            csv.reader(StringIO(b"".join(response.streaming_content).decode("utf-8")))
+        )
+        self.assertEqual(rows[0][:3], ["id", "date_event", "operation"])
+        expected = Lending.objects.filter(operation="issuance").order_by(
+            "-date_event", "id"
+        )
+        self.assertEqual(
+            [int(row[0]) for row in rows[1:]],
+            list(expected.values_list("id", flat=True)),
+        )
+        self.assertEqual(
+            rows[1][4:7], ["Любовь к жизни", str(self.reader.pk), "Лукин В.М."]
+        )
+
+    def test_export_ndjson(self):
+        response = self.export(output="ndjson", date_event="2026-10-02")
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content)
+            .decode("utf-8")
+            .splitlines()
+        ]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]["date_event"], "2026-10-02")
+        response = self.client.get(reverse("library:lending_export"), {"output": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_reader(self):
+        self.client.force_authenticate(user=self.reader)
+        response = self.export(output="ndjson")
+        rows = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(len(rows), 20)
+
+
+class ImportCatalogTestCase(APITestCase):
+    """Тестирование загрузки каталога из файлов CSV и NDJSON."""
+
+    def setUp(self):
+        self.user = Users.objects.create(email="ivc@yandex.ru", password="123qwe")
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        Books.objects.create(
+            name="Белый клык",
+            author=Authors.objects.create(author="Джек Лондон"),
+            quantity_all=0,
+            quantity_lending=0,
+            amount_lending=0,
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def load(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command(
+            "import_catalog", path, "--batch-size=2", *args, stdout=out, stderr=err
+        )
+        return out.getvalue(), err.getvalue()
+
+    def check_catalog(self):
+        book = Books.objects.get(name="Морской волк")
+        self.assertEqual(book.author.author, "Джек Лондон")
+        self.assertEqual(
+            (book.quantity_all, book.quantity_lending, book.amount_lending), (3, 1, 0)
+        )
+        self.assertEqual(Authors.objects.filter(author="Джек Лондон").count(), 1)
+        self.assertEqual(Authors.objects.filter(author="Жюль Верн").count(), 1)
+        inventory = Lending.objects.get(book=book)
+        self.assertEqual(
+            (inventory.operation, inventory.user, inventory.arrival_quantity),
+            ("inventory", self.user, 3),
+        )
+        self.assertFalse(Lending.objects.filter(book__name="Таинственный остров"))
+        self.assertEqual(CirculationChange.objects.count(), 2)
+        out = StringIO()
+        call_command("reconcile_books", "--workers=1", stdout=out)
+        self.assertEqual(out.getvalue(), "Книг с расхождениями: 0.\n")
+        # id новых книг взяты из последовательности таблицы
+        Books.objects.create(name="Мартин Иден", author=book.author)
+        response = self.client.get(reverse("books-list"), {"search": "волк"})
+        self.assertEqual(response.json()["results"][0]["name"], "Морской волк")
+
+    def test_import_csv(self):
+        path = self.write(
+            "catalog.csv",
+            "name,author,genre,annotation,barcode,quantity,issued\n"
+            "Морской волк,Джек Лондон,novel,,101,3,1\n"
+            "Белый клык,Джек Лондон,story,,,1,0\n"
+            "Таинственный остров,Жюль Верн,adventures,Остров,,0,0\n"
+            "Дети капитана Гранта,Жюль Верн,adventures,,,2,0\n"
+            "Морской волк,Джек Лондон,novel,,,1,0\n"
+            "Сказки,Андерсен,tale,,,1,0\n"
+            "Сказки,Андерсен,story,,,1,2\n",
+        )
+        self.client.force_authenticate(user=self.user)
+        output, errors = self.load(path)
+        self.assertIn(
+            "Загружено книг: 3, авторов: 1, операций инвентаризации: 2, пропущено строк: 4.",
+            output,
+        )
+        self.assertIn(
+            "Строка 3 пропущена: книга 'Белый клык' уже зарегистрирована", errors
+        )
+        self.assertIn("Строка 7 пропущена: неизвестный жанр 'tale'", errors)
+        self.check_catalog()
+
+    def test_import_ndjson_without_copy(self):
+        rows = [
+            {
+                "name": "Морской волк",
+                "author": "Джек Лондон",
+                "quantity": 3,
+                "issued": 1,
+            },
+            {"name": "Таинственный остров", "author": "Жюль Верн"},
+            {"name": "Дети капитана Гранта", "author": "Жюль Верн", "quantity": 2},
+        ]
+        path = self.write(
+            "catalog.ndjson",
+            "\n".join(json.dumps(row, ensure_ascii=False) for row in rows) + "\n[]\n",
+        )
+        self.client.force_authenticate(user=self.user)
+        output, errors = self.load(path, "--no-copy")
+        self.assertIn("Загружено книг: 3, авторов: 1", output)
+        self.assertIn("Строка 4 пропущена: строка не является объектом JSON", errors)
+        self.check_catalog()
+
+    def test_import_without_librarian(self):
+        self.user.groups.clear()
+        path = self.write(
+            "catalog.csv", "name,author,quantity\nМорской волк,Джек Лондон,3\n"
+        )
+        with self.assertRaises(CommandError):
+            self.load(path)
+        self.assertFalse(Books.objects.filter(name="Морской волк"))
+
+
+class LoadBenchmarkTestCase(APITestCase):
+    """Тестирование генератора синтетических данных и нагрузочного замера API."""
+
+    def setUp(self):
+        cache.clear()
+        call_command(
+            "generate_library",
+            "--readers=20",
+            "--authors=3",
+            "--books=5",
+            "--years=1",
+            "--issuances=0.02",
+            "--batch-size=2",
+            stdout=StringIO(),
+        )
+
+    def test_generate_library(self):
+        self.assertEqual(Users.objects.count(), 21)
+        self.assertEqual(Authors.objects.count(), 3)
+        self.assertEqual(Books.objects.count(), 5)
+        self.assertEqual(
+            Lending.objects.filter(operation="inventory").count(), Books.objects.count()
+        )
+        self.assertTrue(Lending.objects.filter(operation="return").exists())
+        self.assertEqual(
+            Lending.objects.filter(operation="issuance", closing__isnull=False).count(),
+            Lending.objects.filter(operation__in=("return", "loss")).count(),
+        )
+        self.assertEqual(CirculationChange.objects.count(), Lending.objects.count())
+        out = StringIO()
+        call_command("reconcile_books", "--workers=1", stdout=out)
+        self.assertEqual(out.getvalue(), "Книг с расхождениями: 0.\n")
+
+    def test_bench_api(self):
+        lendings = Lending.objects.count()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "report.json")
+        out = StringIO()
+        call_command("bench_api", "--iterations=3", f"--output={path}", stdout=out)
+        with open(path, encoding="utf-8") as file:
+            report = json.load(file)
+        self.assertEqual(report["dataset"]["books"], 5)
+        endpoints = report["endpoints"]
+        self.assertEqual(
+            set(endpoints),
+            {"login", "lending_list", "books_list"}
+            | {
+                f"lending_create:{operation}"
+                for operation in (
+                    "issuance",
+                    "return",
+                    "loss",
+                    "write_off",
+                    "arrival",
+                    "inventory",
+                )
+            },
+        )
+        for name, result in endpoints.items():
+            self.assertEqual(result["errors"], 0, name)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertGreater(result["queries_per_request"], 0)
+        self.assertEqual(endpoints["lending_create:issuance"]["requests"], 6)
+        self.assertIn("lending_create:issuance", out.getvalue())
+        # замер выполняется в отменяемой транзакции
+        self.assertEqual(Lending.objects.count(), lendings)
+
+        call_command("bench_api", "--iterations=2", f"--compare={path}", stdout=out)
+        self.assertIn("p95 было", out.getvalue())
+
+
+class AsyncBenchmarkTestCase(TransactionTestCase):
+    """Тестирование сравнения асинхронных и синхронных представлений чтения. Запросы выполняются в других
+    потоках, поэтому данные должны быть зафиксированы."""
+
+    def setUp(self):
+        cache.clear()
+        call_command(
+            "generate_library",
+            "--readers=5",
+            "--authors=3",
+            "--books=12",
+            "--years=1",
+            "--issuances=0.02",
+            stdout=StringIO(),
+        )
+
+    def test_bench_async(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "report.json")
+        out = StringIO()
+        call_command(
+            "bench_async",
+            "--requests=24",
+            "--concurrency=6",
+            "--threads=2",
+            "--delay=100",
+            f"--output={path}",
+            stdout=out,
+        )
+        with open(path, encoding="utf-8") as file:
+            report = json.load(file)
+        self.assertEqual(set(report["paths"]), {"wsgi", "asgi"})
+        for path, result in report["paths"].items():
+            for name, endpoint in result["endpoints"].items():
+                self.assertEqual(endpoint["requests"], 4, (path, name))
+                self.assertEqual(endpoint["errors"], 0, (path, name))
+        # пропускная способность пути WSGI ограничена потоками, занятыми медленными клиентами
+        self.assertGreater(
+            report["paths"]["asgi"]["throughput_rps"],
+            report["paths"]["wsgi"]["throughput_rps"],
+        )
+        self.assertIn("asgi  всего", out.getvalue())
+
+
+class RequestMetricsTestCase(APITestCase):
+    """Тестирование профилирования запросов и метрик в формате Prometheus."""
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+        self.user = Users.objects.create(email="ivc@yandex.ru", password="123qwe")
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        self.reader = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        Authors.objects.create(author="Джек Лондон")
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing(self):
+        response = self.client.get(reverse("authors-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timing = response["Server-Timing"]
+        self.assertRegex(
+            timing,
+            r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", serializer;dur=[\d.]+$',
+        )
+        self.assertNotIn('desc="0 queries"', timing)
+
+    def test_metrics(self):
+        self.client.get(reverse("authors-list"))
+        self.client.get(reverse("authors-list"))
+        self.client.get(reverse("authors-detail", args=[0]))
+        response = self.client.get(reverse("library:metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            response["Content-Type"].startswith("text/plain; version=0.0.4")
+        )
+        metrics = response.content.decode()
+        self.assertIn(
+            'library_http_responses_total{method="GET",route="authors-list",status="200"} 2',
+            metrics,
+        )
+        self.assertIn(
+            'library_http_responses_total{method="GET",route="authors-detail",status="404"} 1',
+            metrics,
+        )
+        self.assertIn(
+            'library_http_request_duration_seconds_bucket{method="GET",route="authors-list",le="+Inf"} 2',
+            metrics,
+        )
+        self.assertIn(
+            'library_http_db_queries_count{method="GET",route="authors-list"} 2',
+            metrics,
+        )
+        self.assertIn(
+            "# TYPE library_http_serializer_duration_seconds histogram", metrics
+        )
+
+        self.client.force_authenticate(user=self.reader)
+        response = self.client.get(reverse("library:metrics"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        self.client.force_authenticate(user=None)
+        url = reverse("library:metrics")
+        self.assertEqual(
+            self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("library_http_responses_total", response.content.decode())
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_sampling_off(self):
+        response = self.client.get(reverse("authors-list"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(registry.responses, {})
+
+
+class TaskMetricsTestCase(APITestCase):
+    """Тестирование замеров задач Celery."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create(email="ivc@yandex.ru", password="123qwe")
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        book = Books.objects.create(
+            name="Белый клык", author=Authors.objects.create(author="Джек Лондон")
+        )
+        for operation in ("arrival", "issuance", "return"):
+            Lending.objects.create(user=self.user, book=book, operation=operation)
+        self.client.force_authenticate(user=self.user)
+
+    def metrics(self):
+        return self.client.get(reverse("library:metrics")).content.decode()
+
+    def test_task_metrics(self):
+        task = "library.tasks.update_circulation_statistics"
+        result = update_circulation_statistics.apply(
+            headers={"published_at": time.time() - 2}
+        )
+        self.assertEqual(result.get(), 3)
+        metrics = self.metrics()
+        self.assertIn(
+            f'library_task_runs_total{{task="{task}",outcome="success"}} 1', metrics
+        )
+        self.assertIn(
+            f'library_task_items_total{{task="{task}",item="rows"}} 3', metrics
+        )
+        self.assertIn(
+            f'library_task_duration_seconds_count{{task="{task}"}} 1', metrics
+        )
+        self.assertIn(
+            f'library_task_queue_wait_seconds_bucket{{task="{task}",le="1"}} 0', metrics
+        )
+        self.assertIn(
+            f'library_task_queue_wait_seconds_bucket{{task="{task}",le="5"}} 1', metrics
+        )
+        self.assertNotIn("library_task_slow_runs_total{", metrics)
+
+    def test_task_failure(self):
+        with patch("library.tasks.update_circulation", side_effect=RuntimeError):
+            update_circulation_statistics.apply()
+        self.assertIn(
+            'library_task_runs_total{task="library.tasks.update_circulation_statistics",'
+            'outcome="failure"} 1',
+            self.metrics(),
+        )
+
+    @override_settings(CELERY_BEAT_SCHEDULE={}, TASK_SLOW_SECONDS=0)
+    def test_slow_run(self):
+        with self.assertLogs("library.metrics", "WARNING") as logs:
+            update_circulation_statistics.apply()
+        self.assertIn("update_circulation_statistics выполнялась", logs.output[0])
+        self.assertIn(
+            'library_task_slow_runs_total{task="library.tasks.update_circulation_statistics"} 1',
+            self.metrics(),
+        )
+
+    def test_published_at_header(self):
+        headers = {}
+        stamp_task_published(
+            sender="library.tasks.send_return_reminders", headers=headers
+        )
+        self.assertAlmostEqual(headers["published_at"], time.time(), delta=5)
+        headers = {}
+        stamp_task_published(sender="celery.chord_unlock", headers=headers)
+        self.assertEqual(headers, {})
+
+    @patch("library.tasks.get_telegram_client")
+    def test_reminder_metrics(self, get_telegram_client):
+        get_telegram_client().send_messages.return_value = (0, [])
+        reader = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        Lending.objects.create(
+            user=reader,
+            book=Books.objects.get(),
+            operation="issuance",
+            date_event=datetime.now(pytz.timezone(settings.CELERY_TIMEZONE)).date()
+            - timedelta(days=15),
+        )
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+        send_mail_return_books.apply()
+        metrics = self.metrics()
+        for task, item, value in (
+            ("send_mail_return_books", "subtasks", 1),
+            ("send_return_reminders", "rows", 1),
+            ("send_return_reminders", "emails_sent", 1),
+        ):
+            self.assertIn(
+                f'library_task_items_total{{task="library.tasks.{task}",item="{item}"}} {value}',
+                metrics,
+            )
+        self.assertIn(
+            'library_task_runs_total{task="library.tasks.collect_return_reminders",'
+            'outcome="success"} 1',
+            metrics,
+        )
+
+
+class AsyncReadTestCase(APITestCase):
+    """Тестирование асинхронных представлений чтения: ответы совпадают с синхронными представлениями."""
+
+    def setUp(self):
+        cache.clear()
+        self.librarian = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.librarian)
+        self.reader = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        self.author = Authors.objects.create(author="Джек Лондон")
+        self.book = Books.objects.create(
+            name="Любовь к жизни", author=self.author, genre="story"
+        )
+        Books.objects.create(name="Белый клык", author=self.author, genre="novel")
+        Authors.objects.create(author="Марк Твен")
+        for number in range(7):
+            Lending.objects.create(
+                user=self.reader if number % 2 else self.librarian,
+                book=self.book,
+                operation="arrival",
+                arrival_quantity=1,
+            )
+        self.async_client = AsyncClient()
+
+    async def aget(self, url, user=None):
+        """Запрос к асинхронному представлению (заголовки AsyncClient задаются в каждом запросе)."""
+        token = AccessToken.for_user(user or self.librarian)
+        return await self.async_client.get(
+            url, headers={"Authorization": f"Bearer {token}"}
+        )
+
+    async def compare(self, async_url, sync_url):
+        """Ответ асинхронного представления (без ссылок на страницы) равен ответу синхронного."""
+        response = await self.aget(async_url)
+        expected = await sync_to_async(self.client.get)(sync_url)
+        self.assertEqual(response.status_code, expected.status_code)
+        data, expected = response.json(), expected.json()
+        for page in (data, expected):
+            if isinstance(page, dict) and "results" in page:
+                page.pop("next"), page.pop("previous")
+        self.assertEqual(data, expected)
+        return response
+
+    async def test_catalog(self):
+        await sync_to_async(self.client.force_authenticate)(user=self.librarian)
+        queries = ("", "?page_size=1&page=2", "?genre=story", "?ordering=-name")
+        for query in queries:
+            with self.subTest(query=query):
+                response = await self.compare(
+                    reverse("library:async_books_list") + query,
+                    reverse("books-list") + query,
+                )
+                self.assertIn("Server-Timing", response)
+        await self.compare(
+            reverse("library:async_books_retrieve", args=(self.book.pk,)),
+            reverse("books-detail", args=(self.book.pk,)),
+        )
+        await self.compare(
+            reverse("library:async_authors_list") + "?search=Твен",
+            reverse("authors-list") + "?search=Твен",
+        )
+        await self.compare(
+            reverse("library:async_authors_retrieve", args=(self.author.pk,)),
+            reverse("authors-detail", args=(self.author.pk,)),
+        )
+        response = await self.aget(reverse("library:async_books_list"))
+        self.assertEqual(response["X-Cache"], "HIT")
+        response = await self.aget(reverse("library:async_books_list") + "?page=9")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.aget(reverse("library:async_books_retrieve", args=(0,)))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_lending(self):
+        await sync_to_async(self.client.force_authenticate)(user=self.librarian)
+        for query in ("", "?page=2&operation=arrival", "?ordering=-date_event"):
+            with self.subTest(query=query):
+                await self.compare(
+                    reverse("library:async_lending_list") + query,
+                    reverse("library:lending_list") + query,
+                )
+        # страницы по ключу: обход по ссылкам next
+        url = reverse("library:async_lending_list") + "?cursor=&page_size=3"
+        pages = []
+        while url:
+            response = await self.aget(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([lending["id"] for lending in response.json()["results"]])
+            url = response.json()["next"]
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        lending = await Lending.objects.filter(user=self.librarian).afirst()
+        await self.compare(
+            reverse("library:async_lending_retrieve", args=(lending.pk,)),
+            reverse("library:lending_retrieve", args=(lending.pk,)),
+        )
+
+    async def test_permissions(self):
+        response = await self.async_client.get(reverse("library:async_books_list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.aget(reverse("library:async_lending_list"), self.reader)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 3)
+        lending = await Lending.objects.filter(user=self.librarian).afirst()
+        response = await self.aget(
+            reverse("library:async_lending_retrieve", args=(lending.pk,)), self.reader
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ReplicaRoutingTestCase(SimpleTestCase):
+    """Тестирование выбора базы данных для чтения: реплики в запросах на чтение, основная база после записи."""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.reads = []
+
+    def view(self, write=False):
+        """Представление, которое читает (и изменяет) данные и запоминает базы для чтения."""
+
+        def get_response(request):
+            self.reads.append(router.db_for_read(Books))
+            if write:
+                router.db_for_write(Lending)
+                self.reads.append(router.db_for_read(Books))
+            return HttpResponse()
+
+        return ReplicaRoutingMiddleware(get_response)
+
+    def request(self, method="get", token="reader", write=False):
+        self.reads.clear()
+        request = getattr(self.factory, method)("/", HTTP_AUTHORIZATION=token)
+        self.view(write)(request)
+        return self.reads
+
+    def test_without_replicas(self):
+        self.assertEqual(self.request(), ["default"])
+        self.assertEqual(router.db_for_read(Books), "default")
+
+    @override_settings(REPLICA_DATABASES=["replica1", "replica2"])
+    def test_replica_reads(self):
+        self.assertIn(self.request()[0], ("replica1", "replica2"))
+        self.assertEqual(self.request("post"), ["default"])
+        # вне запроса (задачи, команды) - основная база
+        self.assertEqual(router.db_for_read(Books), "default")
+        with replica_reads():
+            self.assertIn(router.db_for_read(Books), ("replica1", "replica2"))
+            with patch.object(connection, "in_atomic_block", True):
+                self.assertEqual(router.db_for_read(Books), "default")
+
+    @override_settings(REPLICA_DATABASES=["replica1"], REPLICA_STICKY_SECONDS=60)
+    def test_read_your_writes(self):
+        reads = self.request(write=True)
+        self.assertEqual(reads, ["replica1", "default"])
+        # после записи клиент читает основную базу, другие клиенты - реплику
+        self.assertEqual(self.request(), ["default"])
+        self.assertEqual(self.request(token="librarian"), ["replica1"])
+        self.request("post", write=True)
+        cache.clear()
+        self.assertEqual(self.request(), ["replica1"])
+
+    @override_settings(REPLICA_DATABASES=["replica1"])
+    def test_streaming(self):
+        def get_response(request):
+            return StreamingHttpResponse(router.db_for_read(Lending) for _ in range(2))
+
+        response = ReplicaRoutingMiddleware(get_response)(self.factory.get("/"))
+        self.assertEqual(b"".join(response), b"replica1replica1")
+
+
+class RefusingEmailBackend(locmem.EmailBackend):
+    """Почтовый бэкенд, отклоняющий письма на адреса refused@..."""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0].startswith("refused@"):
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b"refused")})
+        return super().send_messages(messages)
+
+
+class CrashingEmailBackend(locmem.EmailBackend):
+    """Почтовый бэкенд, на письме на адрес crash@... прерывающий рассылку непредвиденной ошибкой."""
+
+    crash = True
+
+    def send_messages(self, messages):
+        if self.crash and messages[0].to[0].startswith("crash@"):
+            raise RuntimeError("worker killed")
+        return super().send_messages(messages)
+
+
+class UnavailableEmailBackend(locmem.EmailBackend):
+    """Почтовый бэкенд, сервер которого становится недоступен при отправке письма на адрес down@...:
+    письмо не отправляется, и соединение больше не открывается."""
+
+    down = False
+
+    def open(self):
+        if self.down:
+            raise ConnectionRefusedError("connection refused")
+        return super().open()
+
+    def send_messages(self, messages):
+        if self.down or messages[0].to[0].startswith("down@"):
+            self.down = True
+            raise smtplib.SMTPServerDisconnected("connection closed")
+        return super().send_messages(messages)
+
+
+class SendMailMessagesTestCase(SimpleTestCase):
+    """Тестирование отправки писем через одно SMTP-соединение."""
+
+    @staticmethod
+    def messages(*addresses):
+        return [
+            EmailMessage(subject="Возврат книги", body="текст", to=[address])
+            for address in addresses
+        ]
+
+    @override_settings(EMAIL_BACKEND="library.tests.RefusingEmailBackend")
+    def test_failed_message(self):
+        messages = self.messages("a@yandex.ru", "refused@yandex.ru", "b@yandex.ru")
+        sent, failed = send_mail_messages(messages)
+        self.assertEqual(sent, 2)
+        self.assertEqual([message for message, _ in failed], [messages[1]])
+
+    @override_settings(EMAIL_BACKEND="library.tests.UnavailableEmailBackend")
+    def test_server_unavailable(self):
+        """Соединение не переоткрывается: остальные письма учитываются как неотправленные."""
+        messages = self.messages(
+            "a@yandex.ru", "down@yandex.ru", "b@yandex.ru", "c@yandex.ru"
+        )
+        sent, failed = send_mail_messages(iter(messages))
+        self.assertEqual(sent, 1)
+        self.assertEqual([message for message, _ in failed], messages[1:])
+        self.assertIsInstance(failed[-1][1], ConnectionRefusedError)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class ReturnReminderTestCase(APITestCase):
+    """Тестирование напоминаний о возврате книг."""
+
+    def setUp(self):
+        self.reader = Users.objects.create(
+            email="reader@yandex.ru", password="123qwe", tg_chat_id="743470706"
+        )
+        self.author = Authors.objects.create(author="Джек Лондон")
+        today = datetime.now(pytz.timezone(settings.CELERY_TIMEZONE)).date()
+        for days in (3, 7, 10, 15, 20):
+            book = Books.objects.create(name=f"Книга {days}", author=self.author)
+            Lending.objects.create(
+                user=self.reader,
+                book=book,
+                operation="issuance",
+                date_event=today - timedelta(days=days),
+            )
+        issuance = Lending.objects.get(book__name="Книга 20")
+        issuance.closing = Lending.objects.create(
+            user=self.reader, book=issuance.book, operation="return"
+        )
+        issuance.save()
+        # задачи Celery выполняются сразу в процессе теста
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager", False)
+
+    @staticmethod
+    def send_mail_return_books():
+        """Запуск рассылки, возвращает итог, собранный collect_return_reminders."""
+        with patch("library.tasks.logger") as logger:
+            send_mail_return_books()
+        return logger.info.call_args.args[1]
+
+    @patch("library.tasks.get_telegram_client")
+    def test_send_mail_return_books(self, get_telegram_client):
+        """Одно напоминание на читателя по выдачам с наступающим и наступившим сроком возврата,
+        запрос диапазонов читателей, запрос выдач и запись журнала напоминаний перед отправкой письма
+        и сообщений в Телеграм.
+        """
+        get_telegram_client().send_messages.return_value = (1, [])
+        with self.assertNumQueries(4):
+            summary = self.send_mail_return_books()
+        self.assertEqual(summary["sent"], 1)
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual(summary["telegram_sent"], 1)
+        self.assertEqual(summary["tasks"], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.reader.email])
+        return_date = Lending.objects.get(book__name="Книга 7").date_event + timedelta(
+            days=10
+        )
+        self.assertEqual(
+            mail.outbox[0].body,
+            "Вы должны немедленно вернуть книгу Книга 15\n"
+            "Вы сегодня должны вернуть книгу Книга 10\n"
+            f"Вы должны вернуть книгу Книга 7 {return_date}",
+        )
+        get_telegram_client().send_messages.assert_called_once_with(
+            [(self.reader.tg_chat_id, mail.outbox[0].body)]
+        )
+
+    @override_settings(EMAIL_BACKEND="library.tests.RefusingEmailBackend")
+    @patch("library.tasks.get_telegram_client")
+    def test_send_mail_return_books_failed(self, get_telegram_client):
+        """Ошибка отправки одного письма не прерывает рассылку."""
+        reader = Users.objects.create(email="refused@yandex.ru", password="123qwe")
+        Lending.objects.create(
+            user=reader,
+            book=Books.objects.get(name="Книга 15"),
+            operation="issuance",
+            date_event=Lending.objects.get(book__name="Книга 15").date_event,
+        )
+        get_telegram_client().send_messages.return_value = (1, [])
+        summary = self.send_mail_return_books()
+        self.assertEqual(summary["sent"], 1)
+        self.assertEqual(summary["failed"], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.reader.email])
+
+    @patch("library.tasks.get_telegram_client")
+    def test_send_mail_return_books_once_a_day(self, get_telegram_client):
+        """Повторный запуск в тот же день ничего не отправляет и делает один запрос к БД,
+        неотправленные в Телеграм напоминания отправляются повторно."""
+        get_telegram_client().send_messages.side_effect = lambda messages: (
+            0,
+            [(message, Exception("timeout")) for message in messages],
+        )
+        self.send_mail_return_books()
+        self.assertEqual(Reminder.objects.filter(channel="mail").count(), 3)
+        self.assertEqual(Reminder.objects.filter(channel="telegram").count(), 0)
+
+        get_telegram_client().send_messages.side_effect = lambda messages: (
+            len(messages),
+            [],
+        )
+        summary = self.send_mail_return_books()
+        self.assertEqual(summary["sent"], 0)
+        self.assertEqual(summary["telegram_sent"], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Reminder.objects.filter(channel="telegram").count(), 3)
+
+        with self.assertNumQueries(1):
+            summary = self.send_mail_return_books()
+        self.assertEqual(summary["tasks"], 0)
+
+    @override_settings(EMAIL_BACKEND="library.tests.CrashingEmailBackend")
+    @patch("library.tasks.get_telegram_client")
+    def test_send_mail_return_books_interrupted(self, get_telegram_client):
+        """Напоминания, отправленные до прерывания подзадачи, следующий запуск не повторяет,
+        а письмо, на котором подзадача прервалась, отправляет."""
+        get_telegram_client().send_messages.return_value = (0, [])
+        reader = Users.objects.create(email="crash@yandex.ru", password="123qwe")
+        Lending.objects.create(
+            user=reader,
+            book=Books.objects.get(name="Книга 15"),
+            operation="issuance",
+            date_event=Lending.objects.get(book__name="Книга 15").date_event,
+        )
+        today = datetime.now(pytz.timezone(settings.CELERY_TIMEZONE)).date()
+        with self.assertRaises(RuntimeError):
+            send_return_reminders(today.isoformat(), self.reader.pk, reader.pk)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Reminder.objects.filter(channel="mail").count(), 3)
+        self.assertFalse(Reminder.objects.filter(lending__user=reader).exists())
+
+        mail.outbox.clear()
+        CrashingEmailBackend.crash = False
+        self.addCleanup(setattr, CrashingEmailBackend, "crash", True)
+        summary = self.send_mail_return_books()
+        self.assertEqual(summary["sent"], 1)
+        self.assertEqual(mail.outbox[0].to, [reader.email])
+
+    @patch("library.tasks.get_telegram_client")
+    def test_send_mail_return_books_claimed(self, get_telegram_client):
+        """Напоминания, уже занятые параллельным запуском, не отправляются повторно."""
+        get_telegram_client().send_messages.return_value = (0, [])
+        today = datetime.now(pytz.timezone(settings.CELERY_TIMEZONE)).date()
+        lendings = list(books_for_return(today))
+        self.assertEqual(claim_reminders(lendings, "mail", today), lendings)
+        self.assertEqual(claim_reminders(lendings, "mail", today), [])
+        summary = self.send_mail_return_books()
+        self.assertEqual(summary["sent"], 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(get_telegram_client().send_messages.call_count, 1)
+
+    @patch("library.tasks.READERS_PER_TASK", 2)
+    @patch("library.tasks.get_telegram_client")
+    def test_send_mail_return_books_fan_out(self, get_telegram_client):
+        """Читатели делятся между подзадачами, итог суммируется."""
+        get_telegram_client().send_messages.return_value = (0, [])
+        book = Books.objects.get(name="Книга 15")
+        for number in range(4):
+            reader = Users.objects.create(
+                email=f"reader{number}@yandex.ru", password="123qwe"
+            )
+            Lending.objects.create(
+                user=reader,
+                book=book,
+                operation="issuance",
+                date_event=Lending.objects.get(book=book, user=self.reader).date_event,
+            )
+        summary = self.send_mail_return_books()
+        self.assertEqual(summary["tasks"], 3)
+        self.assertEqual(summary["sent"], 5)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_prune_reminders(self):
+        """Записи журнала напоминаний за прошедшие дни удаляются, записи за сегодня остаются."""
+        today = datetime.now(pytz.timezone(settings.CELERY_TIMEZONE)).date()
+        lendings = list(books_for_return(today))
+        claim_reminders(lendings, "mail", today - timedelta(days=1))
+        claim_reminders(lendings, "telegram", today - timedelta(days=2))
+        claim_reminders(lendings, "mail", today)
+        self.assertEqual(prune_reminders(), 6)
+        self.assertEqual(
+            list(Reminder.objects.values_list("date_event", flat=True).distinct()),
+            [today],
+        )
+
+
+class TelegramClientTestCase(SimpleTestCase):
+    """Тестирование клиента Телеграма на локальной заглушке Telegram Bot API."""
+
+    def test_send_messages(self):
+        """Параллельная отправка по переиспользуемым соединениям с ограничением числа потоков."""
+        with TelegramStub(latency=0.05) as stub:
+            client = TelegramClient(
+                base_url=stub.url, token="TOKEN", max_workers=4, rate_limit=1000
+            )
+            messages = [(str(chat), f"Сообщение {chat}") for chat in range(20)]
+            sent, failed = client.send_messages(messages)
+        self.assertEqual((sent, failed), (20, []))
+        self.assertEqual(len(stub.messages), 20)
+        self.assertEqual(stub.max_in_flight, 4)
+        self.assertLessEqual(len(stub.connections), 4)
+
+    def test_rate_limits(self):
+        """Ответ 429 повторяется после паузы, сообщения в один чат не чаще chat_interval."""
+        with TelegramStub(flood_chats=["1"], retry_after=0.2) as stub:
+            client = TelegramClient(
+                base_url=stub.url,
+                token="TOKEN",
+                max_workers=4,
+                rate_limit=1000,
+                chat_interval=0.1,
+            )
+            messages = [("1", "первое"), ("2", "второе"), ("2", "третье")]
+            sent, failed = client.send_messages(messages)
+        self.assertEqual((sent, failed), (3, []))
+        moments = [moment for moment, chat_id, _ in stub.messages if chat_id == "2"]
+        self.assertGreaterEqual(moments[1] - moments[0], 0.08)
+
+    def test_failed_message(self):
+        """После всех повторов сообщение попадает в список ошибок, остальные отправляются."""
+        with TelegramStub(flood_chats=["1"]) as stub:
+            client = TelegramClient(
+                base_url=stub.url, token="TOKEN", rate_limit=1000, retries=0
+            )
+            sent, failed = client.send_messages([("1", "первое"), ("2", "второе")])
+        self.assertEqual(sent, 1)
+        self.assertEqual([message for message, _ in failed], [("1", "первое")])
+
+
+class LendingConcurrencyTestCase(TransactionTestCase):
+    """Тестирование параллельных операций по одной книге (несколько пунктов выдачи одновременно)."""
+
+    readers_count = 200
+    copies = 150
+
+    def setUp(self):
+        self.user = Users.objects.create(
+            email="ivc@yandex.ru",
+            password="123qwe",
+            is_superuser=True,
+        )
+        group = Group.objects.create(name="librarian")
+        group.user_set.add(self.user)
+        self.author = Authors.objects.create(author="Джек Лондон")
+        self.book = Books.objects.create(
+            name="Любовь к жизни",
+            genre="story",
+            author=self.author,
+            quantity_all=self.copies,
+            quantity_lending=0,
+            amount_lending=0,
+        )
+        self.readers = Users.objects.bulk_create(
+            Users(email=f"reader{number}@yandex.ru", password="123qwe")
+            for number in range(self.readers_count)
+        )
+
+    def post_lending(self, data):
+        """Отправка операции из отдельного потока (у каждого потока свое соединение с БД)."""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        try:
+            return client.post(reverse("library:lending_create"), data).status_code
+        finally:
+            connection.close()
+
+    def test_parallel_issuance(self):
+        """Тест параллельной выдачи одной книги сотням читателей."""
+        data = [
+            {"user": reader.pk, "book": self.book.pk, "operation": "issuance"}
+            for reader in self.readers
+        ]
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            codes = list(executor.map(self.post_lending, data))
+        self.book.refresh_from_db()
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), self.copies)
+        self.assertEqual(
+            codes.count(status.HTTP_400_BAD_REQUEST), self.readers_count - self.copies
+        )
+        self.assertEqual(self.book.quantity_all, self.copies)
+        self.assertEqual(self.book.quantity_lending, self.copies)
+        self.assertEqual(self.book.amount_lending, self.copies)
+        self.assertEqual(
+            Lending.objects.filter(book=self.book, operation="issuance").count(),
+            self.copies,
+        )
+
+    def test_parallel_return(self):
+        """Тест одновременного возврата одной и той же выдачи с нескольких пунктов."""
+        reader = self.readers[0]
+        data = {"user": reader.pk, "book": self.book.pk, "operation": "issuance"}
+        self.assertEqual(self.post_lending(data), status.HTTP_201_CREATED)
+        data = {"user": reader.pk, "book": self.book.pk, "operation": "return"}
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            codes = list(executor.map(self.post_lending, [data] * 10))
+        self.book.refresh_from_db()
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), 1)
+        self.assertEqual(self.book.quantity_lending, 0)
+        self.assertEqual(Lending.objects.filter(operation="return").count(), 1)
+
+    def test_reconcile_during_issuance(self):
+        """Тест исправления счетчиков параллельно с выдачей книги."""
+        Lending.objects.create(
+            user=self.user,
+            book=self.book,
+            operation="arrival",
+            arrival_quantity=self.copies,
+        )
+        # счетчики расходятся с журналом, исправление идет одновременно с выдачей
+        Books.objects.filter(pk=self.book.pk).update(amount_lending=10)
+        data = [
+            {"user": reader.pk, "book": self.book.pk, "operation": "issuance"}
+            for reader in self.readers[:50]
+        ]
+
+        def reconcile():
+            out = StringIO()
+            try:
+                call_command("reconcile_books", "--fix", "--workers=2", stdout=out)
+            finally:
+                connection.close()
+            return out.getvalue()
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            fixed = executor.submit(reconcile)
+            codes = list(executor.map(self.post_lending, data))
+        self.assertTrue(fixed.result().endswith("Исправлено: 1.\n"))
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), 50)
+        out = StringIO()
+        call_command("reconcile_books", "--workers=4", "--chunk-size=1", stdout=out)
+        self.assertEqual(out.getvalue(), "Книг с расхождениями: 0.\n")
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.amount_lending, 50)
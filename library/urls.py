@@ -5,9 +5,15 @@ from rest_framework import permissions
 from rest_framework.routers import SimpleRouter
 
 from library.apps import LibraryConfig
-from library.views import (AuthorsViewSet, BooksViewSet, LendingCreateApiView,
-                           LendingDestroyApiView, LendingListApiView,
-                           LendingRetrieveApiView, LendingUpdateApiView)
+from library.views import (AsyncAuthorsApiView, AsyncBooksApiView,
+                           AsyncLendingListApiView,
+                           AsyncLendingRetrieveApiView, AuthorsViewSet,
+                           BooksViewSet, CatalogCacheStatsApiView,
+                           CirculationReportApiView, LendingBulkCreateApiView,
+                           LendingCreateApiView, LendingDestroyApiView,
+                           LendingExportApiView, LendingListApiView,
+                           LendingRetrieveApiView, LendingUpdateApiView,
+                           MetricsApiView)
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -32,6 +38,8 @@ app_name = LibraryConfig.name
 urlpatterns = [
     path("lending/", LendingListApiView.as_view(), name="lending_list"),
     path("lending/create/", LendingCreateApiView.as_view(), name="lending_create"),
+    path("lending/bulk/", LendingBulkCreateApiView.as_view(), name="lending_bulk"),
+    path("lending/export/", LendingExportApiView.as_view(), name="lending_export"),
     path(
         "lending/<int:pk>/", LendingRetrieveApiView.as_view(), name="lending_retrieve"
     ),
@@ -45,6 +53,38 @@ urlpatterns = [
         LendingDestroyApiView.as_view(),
         name="lending_delete",
     ),
+    # асинхронные представления чтения, обслуживаются без отдельного потока при запуске под ASGI (config.asgi)
+    path("async/books/", AsyncBooksApiView.as_view(), name="async_books_list"),
+    path(
+        "async/books/<int:pk>/",
+        AsyncBooksApiView.as_view(),
+        name="async_books_retrieve",
+    ),
+    path("async/authors/", AsyncAuthorsApiView.as_view(), name="async_authors_list"),
+    path(
+        "async/authors/<int:pk>/",
+        AsyncAuthorsApiView.as_view(),
+        name="async_authors_retrieve",
+    ),
+    path(
+        "async/lending/", AsyncLendingListApiView.as_view(), name="async_lending_list"
+    ),
+    path(
+        "async/lending/<int:pk>/",
+        AsyncLendingRetrieveApiView.as_view(),
+        name="async_lending_retrieve",
+    ),
+    path(
+        "catalog/cache/stats/",
+        CatalogCacheStatsApiView.as_view(),
+        name="catalog_cache_stats",
+    ),
+    path("metrics/", MetricsApiView.as_view(), name="metrics"),
+    path(
+        "statistics/circulation/",
+        CirculationReportApiView.as_view(),
+        name="circulation_report",
+    ),
 ]
 # urlpatterns += router_books.urls
 # urlpatterns += router_authors.urls
@@ -12,7 +12,10 @@ class LibraryValidators:
             # срабатывает при попытке повторно получить книгу с тем же названием если предыдущая не сдана.
             lending_objects_list = list(
                 Lending.objects.filter(
-                    user_id=user_pk, operation="issuance", book_id=book_pk, id_return=0
+                    user_id=user_pk,
+                    operation="issuance",
+                    book_id=book_pk,
+                    closing__isnull=True,
                 )
             )
             if len(lending_objects_list) == 1:
@@ -28,7 +31,7 @@ class LibraryValidators:
                 raise ValidationError(
                     f"Книги '{book_object.name}' еще не поступили в библиотеку !"
                 )
-            elif book_object.quantity_all == book_object.quantity_lending:
+            elif book_object.quantity_available <= 0:
                 # срабатывает при попытке выдать книгу, которых нет в библиотеке (на руках у читателей)
                 raise ValidationError(
                     f"Все книги '{book_object.name}' выданы читателям !"
@@ -10,28 +10,55 @@
 # (вышестоящие органы, в статистику и так далее)
 
 
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
 from rest_framework.exceptions import ValidationError
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.generics import (CreateAPIView, DestroyAPIView,
-                                     ListAPIView, RetrieveAPIView,
-                                     UpdateAPIView)
+                                     GenericAPIView, ListAPIView,
+                                     RetrieveAPIView, UpdateAPIView)
 from rest_framework.permissions import IsAuthenticated
-
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+import library.tasks  # noqa: F401 регистрация задач в приложении Celery
+from config import celery_app
+from library.asyncviews import AsyncReadMixin
+from library.cache import (AsyncCatalogCacheMixin, CatalogCacheMixin,
+                           catalog_cache_stats)
+from library.filters import BooksFilter
+from library.metrics import HasMetricsToken, registry, task_metrics
 from library.models import Authors, Books, Lending
 from library.paginations import (AuthorsPaginator, BooksPaginator,
-                                 LendingPaginator)
+                                 LendingCursorPaginator, LendingPaginator)
+from library.search import BooksSearchFilter
 from library.serializer import (AuthorsSerializer, BooksSerializer,
-                                BooksSerializerReadOnly, LendingSerializer,
+                                BooksSerializerReadOnly,
+                                CirculationReportSerializer,
+                                LendingBulkSerializer, LendingSerializer,
                                 LendingSerializerReadOnly,
                                 LendingSerializerWriteOff)
+from library.services import (change_book_counters, create_lendings_bulk,
+                              csv_stream, ndjson_stream)
+from library.statistics import circulation_report
 from users.permissions import IsLibrarian
 
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 2000  # количество строк журнала, читаемых из курсора БД за один раз
 
-class AuthorsViewSet(viewsets.ModelViewSet):
+
+class AuthorsViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     """Представление для авторов книг"""
 
+    cache_resource = "authors"
+
     queryset = Authors.objects.all().order_by("id")
     serializer_class = AuthorsSerializer
     pagination_class = AuthorsPaginator
@@ -51,10 +78,13 @@ class AuthorsViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
-class BooksViewSet(viewsets.ModelViewSet):
+class BooksViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     """Представление для книг."""
 
-    queryset = Books.objects.all().order_by("id")
+    cache_resource = "books"
+
+    # автор выводится в BooksSerializerReadOnly, загружается в том же запросе
+    queryset = Books.objects.select_related("author").order_by("id")
     pagination_class = BooksPaginator
 
     def get_serializer_class(self):
@@ -63,17 +93,20 @@ class BooksViewSet(viewsets.ModelViewSet):
         else:
             return BooksSerializerReadOnly
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # поиск (параметр search) - полнотекстовый по названию, автору и аннотации, результаты по релевантности
+    filter_backends = [DjangoFilterBackend, BooksSearchFilter, OrderingFilter]
     ordering_fields = (
         "author",
         "genre",
         "name",
+        "quantity_available",
     )
     search_fields = (
-        "author",
         "name",
+        "author__author",
+        "annotation",
     )
-    filterset_fields = ("author", "genre", "name", "barcode")
+    filterset_class = BooksFilter
 
     def get_permissions(self):
         if self.action not in ["list", "retrieve"]:
@@ -86,16 +119,109 @@ class BooksViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
 
 
+class AsyncAuthorsApiView(AsyncCatalogCacheMixin, AsyncReadMixin, GenericAPIView):
+    """Асинхронные список и просмотр авторов (под ASGI) с теми же фильтрами, страницами и кешем,
+    что и в AuthorsViewSet."""
+
+    cache_resource = AuthorsViewSet.cache_resource
+    queryset = AuthorsViewSet.queryset
+    serializer_class = AuthorsSerializer
+    pagination_class = AuthorsViewSet.pagination_class
+    filter_backends = AuthorsViewSet.filter_backends
+    ordering_fields = AuthorsViewSet.ordering_fields
+    search_fields = AuthorsViewSet.search_fields
+    permission_classes = (IsAuthenticated,)
+
+
+class AsyncBooksApiView(AsyncCatalogCacheMixin, AsyncReadMixin, GenericAPIView):
+    """Асинхронные список и просмотр книг (под ASGI) с теми же фильтрами, поиском, страницами и кешем,
+    что и в BooksViewSet."""
+
+    cache_resource = BooksViewSet.cache_resource
+    queryset = BooksViewSet.queryset
+    serializer_class = BooksSerializerReadOnly
+    pagination_class = BooksViewSet.pagination_class
+    filter_backends = BooksViewSet.filter_backends
+    ordering_fields = BooksViewSet.ordering_fields
+    search_fields = BooksViewSet.search_fields
+    filterset_class = BooksViewSet.filterset_class
+    permission_classes = (IsAuthenticated,)
+
+
+class CatalogCacheStatsApiView(APIView):
+    """Счетчики попаданий и промахов кеша каталога (книги и авторы). Доступно только библиотекарю."""
+
+    permission_classes = [IsLibrarian]
+
+    def get(self, request):
+        return Response(catalog_cache_stats())
+
+
+class MetricsApiView(APIView):
+    """Гистограммы времени обработки запросов по маршрутам и метрики задач Celery в формате Prometheus
+    (library.metrics).
+    Если задан METRICS_TOKEN, доступ только по этому токену, иначе - библиотекарю."""
+
+    def get_authenticators(self):
+        if settings.METRICS_TOKEN:
+            return []
+        return super().get_authenticators()
+
+    def get_permissions(self):
+        if settings.METRICS_TOKEN:
+            return [HasMetricsToken()]
+        return [IsLibrarian()]
+
+    def get(self, request):
+        tasks = sorted(
+            name for name in celery_app.tasks if name.startswith("library.tasks.")
+        )
+        return HttpResponse(
+            registry.render() + task_metrics(tasks),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+
+class CirculationReportApiView(APIView):
+    """Отчет о движении книг (выдано, возвращено, утеряно, списано, поступило) за год или месяц по жанрам,
+    авторам, книгам, дням или месяцам. Строится по суточной статистике (library.statistics), а не по журналу.
+    Доступно только библиотекарю."""
+
+    permission_classes = [IsLibrarian]
+
+    def get(self, request):
+        serializer = CirculationReportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(circulation_report(**serializer.validated_data))
+
+
 class LendingListApiView(ListAPIView):
+    """Журнал операций. С параметром cursor (первая страница - cursor=) журнал выводится постранично по ключу
+    (LendingCursorPaginator), без него - по номерам страниц (page, page_size)."""
+
     def get_queryset(self):
+        # читатель выводится в LendingSerializerReadOnly, загружается в том же запросе
         if IsLibrarian().has_permission(self.request, self):
-            return Lending.objects.all().order_by("id")
+            return Lending.objects.select_related("user").order_by("id")
         else:
-            return Lending.objects.filter(user=self.request.user)
+            return (
+                Lending.objects.select_related("user")
+                .filter(user_id=self.request.user.pk)
+                .order_by("id")
+            )
 
     serializer_class = LendingSerializerReadOnly
     pagination_class = LendingPaginator
 
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if "cursor" in self.request.query_params:
+                self._paginator = LendingCursorPaginator()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     filter_backends = [
         OrderingFilter,
         DjangoFilterBackend,
@@ -112,6 +238,54 @@ class LendingListApiView(ListAPIView):
     )
 
 
+class AsyncLendingListApiView(AsyncReadMixin, LendingListApiView):
+    """Асинхронный журнал операций (под ASGI), страницы по номерам или по ключу, как в LendingListApiView."""
+
+
+class LendingExportApiView(LendingListApiView):
+    """Выгрузка журнала операций целиком (для проверок) в CSV (output=csv) или NDJSON (output=ndjson) с теми же
+    фильтрами и сортировкой, что и у журнала. Строки читаются курсором на стороне сервера БД пачками по
+    EXPORT_CHUNK_SIZE и отдаются клиенту по мере чтения, поэтому память не зависит от размера выгрузки.
+    """
+
+    columns = (
+        "id",
+        "date_event",
+        "operation",
+        "book_id",
+        "book__name",
+        "user_id",
+        "user__reader_name",
+        "arrival_quantity",
+        "issued_quantity",
+        "closing_id",
+        "is_return",
+        "is_loss",
+        "is_write_off",
+    )
+    formats = {
+        "csv": (csv_stream, "text/csv; charset=utf-8"),
+        "ndjson": (ndjson_stream, "application/x-ndjson; charset=utf-8"),
+    }
+
+    def list(self, request, *args, **kwargs):
+        output = request.query_params.get("output", "csv")
+        if output not in self.formats:
+            raise ValidationError(f"Неизвестный формат выгрузки '{output}' !")
+        stream, content_type = self.formats[output]
+        queryset = self.filter_queryset(self.get_queryset())
+        # строки с одинаковым значением поля сортировки выводятся в порядке id
+        queryset = queryset.order_by(*queryset.query.order_by, "id")
+        rows = queryset.values_list(*self.columns).iterator(
+            chunk_size=EXPORT_CHUNK_SIZE
+        )
+        response = StreamingHttpResponse(
+            stream(self.columns, rows), content_type=content_type
+        )
+        response["Content-Disposition"] = f'attachment; filename="lending.{output}"'
+        return response
+
+
 class LendingCreateApiView(CreateAPIView):
     """Создавать операции в библиотеке могут только пользователи с правами библиоткаря.
     Результаты каждой операции по библиотеке, помимо модели Lendings, отражажаются в модели Books.
@@ -121,104 +295,165 @@ class LendingCreateApiView(CreateAPIView):
     serializer_class = LendingSerializer
 
     def perform_create(self, serializer):
+        # все изменения операции (запись в журнале, счетчики книги, пометка в операции выдачи) выполняются в одной
+        # транзакции, а счетчики книги изменяются на стороне БД (F-выражения) без чтения и сохранения всей строки книги.
         operation = serializer.validated_data["operation"]
         book_return_id = serializer.validated_data["book"].pk
         book_user_id = serializer.validated_data["user"].pk
         book_name = serializer.validated_data["book"].name
-        book_object = Books.objects.get(pk=book_return_id)
-        if operation == "inventory":
-            # при поступлении партии книг увеличивается общее количество книг с таким названием (quantity_all)
-            # пользователем (хозяином) операции в этом случае автоматически является библиотекарь
-            serializer.validated_data["user"].pk = self.request.user.id
-            quantity = serializer.validated_data["arrival_quantity"]
-            issued = serializer.validated_data["issued_quantity"]
-            book_object.quantity_all += quantity
-            book_object.quantity_lending += issued
-        if operation == "arrival":
-            # при поступлении партии книг увеличивается общее количество книг с таким названием (quantity_all)
-            # пользователем (хозяином) операции в этом случае автоматически является библиотекарь
-            serializer.validated_data["user"].pk = self.request.user.id
-            quantity = serializer.validated_data["arrival_quantity"]
-            book_object.quantity_all += quantity
-        elif operation == "issuance":
-            # при получениии книг увеличивается количество выданных с данным названием книг (quantity_lending)
-            # и общее количество выдачи (amount_lending)
-            book_object.quantity_lending += 1
-            book_object.amount_lending += 1
-        elif operation == "return":
-            # при возврате книги уменьшается количество выданных с данным названием книг (quantity_lending)
-            # далее в БД ищется операция выдачи книги пользователю и делается пометка о возврате (is_return = True)
-            # при попытке повторного возврата появляется исключение
-            lending_object_list = list(
-                Lending.objects.filter(
-                    user_id=book_user_id,
-                    operation="issuance",
-                    book_id=book_return_id,
-                    id_return=0,
+        with transaction.atomic():
+            if operation == "inventory":
+                # при поступлении партии книг увеличивается общее количество книг с таким названием (quantity_all)
+                # пользователем (хозяином) операции в этом случае автоматически является библиотекарь
+                serializer.validated_data["user"].pk = self.request.user.id
+                quantity = serializer.validated_data["arrival_quantity"]
+                issued = serializer.validated_data["issued_quantity"]
+                if not change_book_counters(
+                    book_return_id,
+                    Q(quantity_available__gte=issued - quantity),
+                    quantity_all=quantity,
+                    quantity_lending=issued,
+                ):
+                    raise ValidationError(
+                        f"Количество выданных книг '{book_name}' превысит их общее количество в библиотеке !"
+                    )
+            if operation == "arrival":
+                # при поступлении партии книг увеличивается общее количество книг с таким названием (quantity_all)
+                # пользователем (хозяином) операции в этом случае автоматически является библиотекарь
+                serializer.validated_data["user"].pk = self.request.user.id
+                quantity = serializer.validated_data["arrival_quantity"]
+                change_book_counters(book_return_id, quantity_all=quantity)
+            elif operation == "issuance":
+                # при получениии книг увеличивается количество выданных с данным названием книг (quantity_lending)
+                # и общее количество выдачи (amount_lending). Счетчики меняются только если в библиотеке
+                # есть невыданная книга - это условие проверяется тем же UPDATE, поэтому параллельные выдачи
+                # не могут выдать больше книг, чем есть в библиотеке.
+                if not change_book_counters(
+                    book_return_id,
+                    Q(quantity_available__gt=0),
+                    quantity_lending=1,
+                    amount_lending=1,
+                ):
+                    raise ValidationError(f"Все книги '{book_name}' выданы читателям !")
+            elif operation == "return":
+                # при возврате книги уменьшается количество выданных с данным названием книг (quantity_lending)
+                # далее в БД ищется операция выдачи книги пользователю и делается пометка о возврате (is_return = True)
+                # при попытке повторного возврата появляется исключение
+                lending_object = self.get_issuance(book_user_id, book_return_id)
+                if lending_object is None:
+                    raise ValidationError(f"Книга '{book_name}' уже возвращена !")
+                change_book_counters(book_return_id, quantity_lending=-1)
+            elif operation == "write_off":
+                # при списании физически изношенной книги уменьшается общее количество данных книг (quantity_all)
+                # пользователем (хозяином) операции в этом случае автоматически является библиотекарь
+                serializer.validated_data["user"].pk = self.request.user.id
+                if not change_book_counters(
+                    book_return_id,
+                    Q(quantity_available__gt=0),
+                    quantity_all=-1,
+                ):
+                    raise ValidationError(f"Все книги '{book_name}' выданы читателям !")
+            elif operation == "loss":
+                # при утере книги отправляется сообщение библиотекарю о необходимости списания книги
+                # пользователем (хозяином) операции в этом случае автоматически является библиотекарь
+                # БД ищется операция выдачи книги пользователю и делается пометка о возврате
+                # Общее количество книги в библиотеке и количество выданных книг уменьшаются на 1
+                serializer.validated_data["user"].pk = self.request.user.id
+                logger.info(
+                    "Книга %s утеряна, необходимо провести списание книги.", book_name
                 )
-            )  # поиск операции выдачи книги
-            if len(lending_object_list) == 0:
-                raise ValidationError(f"Книга '{book_object.name}' уже возвращена !")
-            lending_object_id = lending_object_list[0].pk  # id операции выдачи книги
-            lending_object = Lending.objects.get(
-                pk=lending_object_id
-            )  # найденная операция выдачи
-            book_object.quantity_lending -= 1
-        elif operation == "write_off":
-            # при списании физически изношенной книги уменьшается общее количество данных книг (quantity_all)
-            # пользователем (хозяином) операции в этом случае автоматически является библиотекарь
-            serializer.validated_data["user"].pk = self.request.user.id
-            book_object.quantity_all -= 1
-        elif operation == "loss":
-            # при утере книги отправляется сообщение библиотекарю о необходимости списания книги
-            # пользователем (хозяином) операции в этом случае автоматически является библиотекарь
-            # БД ищется операция выдачи книги пользователю и делается пометка о возврате
-            # Общее количество книги в библиотеке уменьшатеся на 1
-            serializer.validated_data["user"].pk = self.request.user.id
-            print(f"Книга {book_name} утеряна, необходимо провести списание книги.")
-            lending_object_list = list(
-                Lending.objects.filter(
-                    user_id=book_user_id,
-                    operation="issuance",
-                    book_id=book_return_id,
-                    id_return=0,
+                lending_object = self.get_issuance(book_user_id, book_return_id)
+                if lending_object is None:
+                    raise ValidationError(f"Книга '{book_name}' возвращена !")
+                change_book_counters(
+                    book_return_id,
+                    quantity_all=-1,
+                    quantity_lending=-1,
+                    amount_lending=-1,
                 )
-            )  # поиск операции выдачи книги
-            if len(lending_object_list) == 0:
-                raise ValidationError(f"Книга '{book_object.name}' возвращена !")
-            lending_object_id = lending_object_list[0].pk  # id операции выдачи книги
-            lending_object = Lending.objects.get(
-                pk=lending_object_id
-            )  # найденная операция выдачи
-            book_object.quantity_all -= 1
-            book_object.amount_lending -= 1
-
-        lending = serializer.save()
-        book_object.save()
-        lending.save()
-        if operation == "return":
-            # пометка о возврате книги в операции выдачи книги
-            lending_object.id_return = lending.id
-            lending_object.is_return = True
-            lending_object.save()
-
-        if operation == "loss":
-            # пометка об утере книги в операции выдачи книги
-            lending_object.id_return = lending.id
-            lending_object.is_loss = True
-            lending_object.save()
+
+            lending = serializer.save()
+            if operation == "return":
+                # пометка о возврате книги в операции выдачи книги
+                Lending.objects.filter(pk=lending_object.pk).update(
+                    closing=lending, is_return=True
+                )
+
+            if operation == "loss":
+                # пометка об утере книги в операции выдачи книги
+                Lending.objects.filter(pk=lending_object.pk).update(
+                    closing=lending, is_loss=True
+                )
+
+    @staticmethod
+    def get_issuance(user_id, book_id):
+        """Поиск невозвращенной операции выдачи книги читателю. Найденная строка блокируется до конца транзакции,
+        поэтому одновременные возврат и утеря одной выдачи не могут закрыть ее дважды.
+        """
+        return (
+            Lending.objects.select_for_update()
+            .filter(
+                user_id=user_id,
+                operation="issuance",
+                book_id=book_id,
+                closing__isnull=True,
+            )
+            .order_by("id")
+            .first()
+        )
+
+    permission_classes = [IsLibrarian]
+
+
+class LendingBulkCreateApiView(APIView):
+    """Пакетное проведение операций по библиотеке (выдачи на пунктах выдачи, ночная приемка поступлений).
+    Принимает список операций в формате LendingCreateApiView и возвращает результат по каждой операции в том же
+    порядке. Ошибочные операции не мешают проведению остальных, все проведенные операции записываются в одной
+    транзакции."""
 
     permission_classes = [IsLibrarian]
+    max_operations = 1000
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError("Ожидается список операций !")
+        if len(request.data) > self.max_operations:
+            raise ValidationError(
+                f"В одном пакете можно передать не более {self.max_operations} операций !"
+            )
+        results = []
+        operations = []  # (позиция в пакете, проверенная операция)
+        for item in request.data:
+            serializer = LendingBulkSerializer(data=item)
+            if serializer.is_valid():
+                operations.append((len(results), serializer.validated_data))
+                results.append(None)
+            else:
+                results.append({"errors": serializer.errors})
+        created = create_lendings_bulk(
+            [operation for _, operation in operations], request.user.id
+        )
+        for (position, _), result in zip(operations, created):
+            results[position] = result
+        return Response(results)
 
 
 class LendingDestroyApiView(DestroyAPIView):
     """Удалять операции по библиотеке могут только пользователи с правами библиотекаря."""
 
+    @transaction.atomic
+    def delete(self, request, *args, **kwargs):
+        # изменение счетчиков книги, снятие пометок в операции выдачи и удаление операции - одна транзакция
+        return super().delete(request, *args, **kwargs)
+
     def get_queryset(self):
-        lending_object = Lending.objects.get(pk=self.kwargs["pk"])  # удаляемая операция
-        book_object = Books.objects.get(
+        lending_object = Lending.objects.select_related("closed_issuance").get(
+            pk=self.kwargs["pk"]
+        )  # удаляемая операция вместе с закрытой ею операцией выдачи (один запрос)
+        book_object = Books.objects.select_for_update().get(
             pk=lending_object.book_id
-        )  # книга связанная с удаляемой операцией
+        )  # книга связанная с удаляемой операцией (заблокирована до конца транзакции)
+        counters = {}  # изменения счетчиков книги
         if lending_object.operation == "arrival":
             # удаление партии поступивших книг
             if (
@@ -229,10 +464,10 @@ class LendingDestroyApiView(DestroyAPIView):
                     f"Количество выданных книг '{book_object.name}' превысит их общее количество в библиотеке!"
                     f" Удаление поступления невозможно !"
                 )
-            book_object.quantity_all -= lending_object.arrival_quantity
+            counters["quantity_all"] = -lending_object.arrival_quantity
         elif lending_object.operation == "issuance":
-            # удаление выдачи книги удаление невозможно если операция помечена возвратом (id_return > 0).
-            if lending_object.id_return > 0:
+            # удаление выдачи книги удаление невозможно если операция закрыта возвратом или утерей (closing).
+            if lending_object.closing_id is not None:
                 if lending_object.is_return > 0:
                     raise ValidationError(
                         f"Невоможно удалить выдачу книги '{book_object.name}' - она возвращена или утеряна!"
@@ -244,33 +479,47 @@ class LendingDestroyApiView(DestroyAPIView):
 
             # при возврате книг уменьшается количество выданных книг читателям (quantity_lending)
             # и общее количество выдачи (amount_lending)
-            book_object.quantity_lending -= 1
-            book_object.amount_lending -= 1
+            counters["quantity_lending"] = -1
+            counters["amount_lending"] = -1
         elif lending_object.operation == "write_off":
             # при удалении списании книг увеличивается общее количество книг с данным названием (quantity_all)
-            book_object.quantity_all += 1
+            counters["quantity_all"] = 1
         if lending_object.operation == "return":
             # при удалении возврата книги увеличивается общее количество выданных книг с данным названием (quantity_all)
-            # далее в БД ищется операция выдачи книги и улаляется пометка о возврате (id_return = 0, is_return = False)
-            lending_issuance_object = Lending.objects.get(id_return=lending_object.pk)
-            lending_issuance_object.id_return = 0
+            # в операции выдачи книги улаляется пометка о возврате (closing = None, is_return = False)
+            lending_issuance_object = lending_object.closed_issuance
+            lending_issuance_object.closing = None
             lending_issuance_object.is_return = False
-            lending_issuance_object.save()
-            book_object.quantity_lending += 1
+            lending_issuance_object.save(update_fields=["closing", "is_return"])
+            counters["quantity_lending"] = 1
         if lending_object.operation == "loss":
-            # в БД ищется операция выдачи книги и удаляется пометка об утере (id_return = 0, is_loss = False)
+            # в операции выдачи книги удаляется пометка об утере (closing = None, is_loss = False)
             # невозможно выполнить эту операцию если книга после утери списана.
-            # при удалении операции потери общее количество книги в библиотеке увеличивается на 1 (quantity_all += 1)
-            lending_issuance_object = Lending.objects.get(id_return=lending_object.pk)
+            # при удалении операции потери общее количество книги в библиотеке и количество выданных книг
+            # увеличиваются на 1 (quantity_all += 1, quantity_lending += 1)
+            lending_issuance_object = lending_object.closed_issuance
             if lending_issuance_object.is_write_off:
                 raise ValidationError(
                     f"Невоможно удалить утерю - книга '{book_object.name}' списана !"
                 )
-            lending_issuance_object.id_return = 0
+            lending_issuance_object.closing = None
             lending_issuance_object.is_loss = False
-            lending_issuance_object.save()
-            book_object.quantity_all += 1
-        book_object.save()
+            lending_issuance_object.save(update_fields=["closing", "is_loss"])
+            counters["quantity_all"] = 1
+            counters["quantity_lending"] = 1
+        if (
+            book_object.quantity_available
+            + counters.get("quantity_all", 0)
+            - counters.get("quantity_lending", 0)
+            < 0
+        ):
+            # например, после удаляемого возврата книга выдана другому читателю
+            raise ValidationError(
+                f"Количество выданных книг '{book_object.name}' превысит их общее количество в библиотеке!"
+                f" Удаление операции невозможно !"
+            )
+        if counters:
+            change_book_counters(book_object.pk, **counters)
         return Lending.objects.all()
 
     permission_classes = [IsLibrarian]
@@ -282,9 +531,11 @@ class LendingRetrieveApiView(RetrieveAPIView):
 
     def get_queryset(self):
         if IsLibrarian().has_permission(self.request, self):
-            return Lending.objects.all()
+            return Lending.objects.select_related("user")
         else:
-            return Lending.objects.filter(user=self.request.user)
+            return Lending.objects.select_related("user").filter(
+                user_id=self.request.user.pk
+            )
 
     queryset = Lending.objects.all()
     serializer_class = LendingSerializerReadOnly
@@ -309,3 +560,7 @@ class LendingUpdateApiView(UpdateAPIView):
             raise ValidationError(f"Можно списать только утерянную книгу.")
 
     permission_classes = [IsLibrarian]
+
+
+class AsyncLendingRetrieveApiView(AsyncReadMixin, LendingRetrieveApiView):
+    """Асинхронный просмотр операции (под ASGI), права - как в LendingRetrieveApiView."""
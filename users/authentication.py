@@ -0,0 +1,42 @@
+from django.utils.functional import cached_property
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+from users.permissions import LIBRARIAN_GROUP
+
+
+class ClaimsUser(TokenUser):
+    """Пользователь, восстановленный из утверждений токена (роль, email, ФИО) без обращения к БД."""
+
+    @cached_property
+    def email(self):
+        return self.token.get("email", "")
+
+    @cached_property
+    def reader_name(self):
+        return self.token.get("reader_name", "")
+
+    @cached_property
+    def roles(self):
+        if self.token.get("role") == "librarian":
+            return frozenset([LIBRARIAN_GROUP])
+        return frozenset()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """Аутентификация по JWT. Для запросов на чтение (GET, HEAD, OPTIONS) пользователь восстанавливается из
+    утверждений токена без обращения к БД, роль берется из утверждения role. Для изменяющих запросов и токенов,
+    выданных до появления утверждения role, пользователь загружается из БД."""
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if request.method in SAFE_METHODS and "role" in validated_token:
+            return ClaimsUser(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
@@ -1,49 +1,42 @@
 import json
 
 from django.core.management import BaseCommand
+from django.core.management.color import no_style
 from django.db import connection
 
-from users.models import Payments
+from users.models import Users
 
 
 class Command(BaseCommand):
+    help = "Загрузка пользователей из users.json (формат dumpdata) с сохранением их id."
 
     @staticmethod
-    def json_read_payments():
-        with open("payments.json", "r", encoding="utf-8") as file:
+    def json_read_users():
+        with open("users.json", "r", encoding="utf-8") as file:
             return json.load(file)
 
     def handle(self, *args, **options):
-
-        payments_for_create = []
-        payments_sequence = 1
-        self.clean_database()
-        self.reset_sequences_payments(payments_sequence)
-
-        for payments in Command.json_read_payments():
-            payments_for_create.append(
-                Payments(
-                    payments["pk"],
-                    payments["fields"]["user"],
-                    payments["fields"]["payment_date"],
-                    payments["fields"]["paid_course"],
-                    payments["fields"]["paid_lesson"],
-                    payments["fields"]["amount"],
-                    payments["fields"]["payment_method"],
+        users_for_create = []
+        for user in Command.json_read_users():
+            users_for_create.append(
+                Users(
+                    pk=user["pk"],
+                    email=user["fields"]["email"],
+                    password=user["fields"].get("password", ""),
+                    reader_name=user["fields"].get("reader_name", ""),
+                    phone=user["fields"].get("phone", ""),
+                    tg_chat_id=user["fields"].get("tg_chat_id"),
+                    is_staff=user["fields"].get("is_staff", False),
+                    is_superuser=user["fields"].get("is_superuser", False),
                 )
             )
-        Payments.objects.bulk_create(payments_for_create)
-        self.reset_sequences_payments(len(payments_for_create))
+        Users.objects.bulk_create(users_for_create, ignore_conflicts=True)
+        self.reset_sequences_users()
+        self.stdout.write(f"Обработано пользователей: {len(users_for_create)}.")
 
     @staticmethod
-    def reset_sequences_payments(payments_sequence):
-        """Сихронизируем автоинкрементные значения таблицы продукты"""
+    def reset_sequences_users():
+        """Синхронизируем автоинкрементные значения таблицы пользователей с максимальным id в таблице"""
         with connection.cursor() as cursor:
-            cursor.execute(
-                f"ALTER SEQUENCE users_payments_id_seq RESTART WITH {payments_sequence};"
-            )
-
-    @staticmethod
-    def clean_database():
-        """Очищаем базу данных"""
-        Payments.objects.all().delete()
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Users]):
+                cursor.execute(sql)
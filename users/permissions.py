@@ -1,6 +1,39 @@
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework.permissions import BasePermission
 
+LIBRARIAN_GROUP = "librarian"
+
+
+def roles_cache_key(user_pk):
+    return f"users:roles:{user_pk}"
+
+
+def user_roles(request):
+    """Роли (группы) пользователя запроса. Вычисляются один раз за запрос и запоминаются в нем, поэтому повторные
+    проверки прав в представлении не обращаются к БД. Если задан ROLES_CACHE_TIMEOUT, роли дополнительно хранятся
+    в общем кеше на это время (сек.) и сбрасываются при изменении групп пользователя."""
+    http_request = getattr(request, "_request", request)
+    roles = getattr(http_request, "user_roles", None)
+    if roles is None:
+        user = request.user
+        if not user.is_authenticated:
+            roles = frozenset()
+        elif hasattr(user, "roles"):
+            # роли из утверждений токена (users.authentication.ClaimsUser)
+            roles = user.roles
+        elif settings.ROLES_CACHE_TIMEOUT:
+            key = roles_cache_key(user.pk)
+            roles = cache.get(key)
+            if roles is None:
+                roles = frozenset(user.groups.values_list("name", flat=True))
+                cache.set(key, roles, settings.ROLES_CACHE_TIMEOUT)
+        else:
+            roles = frozenset(user.groups.values_list("name", flat=True))
+        http_request.user_roles = roles
+    return roles
+
 
 class IsLibrarian(BasePermission):
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="librarian").exists()
+        return LIBRARIAN_GROUP in user_roles(request)
@@ -1,7 +1,12 @@
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
+                                                  TokenRefreshSerializer)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 
 from users.models import Users
+from users.permissions import LIBRARIAN_GROUP
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -23,9 +28,37 @@ class UserSerializerReadOnly(serializers.ModelSerializer):
         fields = ("reader_name", "phone")
 
 
+def set_user_claims(token, user):
+    """Утверждения токена о пользователе, по которым запросы на чтение обслуживаются без обращения к БД
+    (users.authentication.ClaimsJWTAuthentication)."""
+    token["email"] = user.email
+    token["reader_name"] = user.reader_name
+    is_librarian = user.groups.filter(name=LIBRARIAN_GROUP).exists()
+    token["role"] = "librarian" if is_librarian else "reader"
+
+
 class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
-        token["email"] = user.email
+        set_user_claims(token, user)
         return token
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    """При обновлении токена утверждения о пользователе (в том числе роль) вычисляются заново,
+    поэтому изменение групп пользователя вступает в силу с новым токеном доступа."""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data["access"])
+        user = Users.objects.filter(
+            **{api_settings.USER_ID_FIELD: access[api_settings.USER_ID_CLAIM]}
+        ).first()
+        if user is None or not user.is_active:
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+        set_user_claims(access, user)
+        data["access"] = str(access)
+        return data
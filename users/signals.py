@@ -0,0 +1,26 @@
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from users.models import Users
+from users.permissions import roles_cache_key
+
+
+@receiver(m2m_changed, sender=Users.groups.through)
+def reset_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сброс закешированных ролей при изменении групп пользователя (или пользователей группы)."""
+    if not reverse:
+        # изменены группы пользователя instance
+        if action.startswith("post_"):
+            cache.delete(roles_cache_key(instance.pk))
+    elif action in ("post_add", "post_remove"):
+        # изменен состав группы instance, pk_set - добавленные или удаленные пользователи
+        cache.delete_many([roles_cache_key(user_pk) for user_pk in pk_set])
+    elif action == "pre_clear":
+        # из группы удаляются все пользователи
+        cache.delete_many(
+            [
+                roles_cache_key(user_pk)
+                for user_pk in instance.user_set.values_list("pk", flat=True)
+            ]
+        )
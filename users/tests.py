@@ -1,8 +1,14 @@
 from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
+from library.models import Authors, Books, Lending
 from users.models import Users
 
 
@@ -23,6 +29,23 @@ class UsersTestCase(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_user_list_queries(self):
+        url = reverse("users:users_list")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        expected = len(queries)
+        Users.objects.bulk_create(
+            Users(email=f"reader{number}@yandex.ru") for number in range(5)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()), 6)
+        self.assertEqual(len(queries), expected)
+        url = reverse("users:users_retrieve", args=(self.user.pk,))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertEqual(len(queries), 2)
+
     def test_user_update(self):
         url = reverse("users:users_update", args=(self.user.pk,))
         data = {
@@ -60,3 +83,131 @@ class UsersTestCase(APITestCase):
         data = response.json()
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data.get("tg_chat_id"), self.user.tg_chat_id)
+
+
+class RolesTestCase(APITestCase):
+    """Тестирование проверки ролей пользователя: не более одного запроса групп на запрос к API."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create(
+            email="sv.bojad@gmail.com",
+            password="123qwe",
+        )
+        self.group = Group.objects.create(name="librarian")
+        self.group.user_set.add(self.user)
+        self.reader = Users.objects.create(email="reader@yandex.ru", password="123qwe")
+        self.author = Authors.objects.create(author="Джек Лондон")
+        self.book = Books.objects.create(name="Любовь к жизни", author=self.author)
+        self.lending = Lending.objects.create(
+            user=self.reader, book=self.book, operation="issuance"
+        )
+
+    def role_queries(self, user, url):
+        """Количество запросов групп пользователя при запросе к API."""
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len([query for query in queries if '"auth_group"' in query["sql"]])
+
+    def test_role_check_once(self):
+        urls = [
+            reverse("users:users_list"),
+            reverse("users:users_retrieve", args=(self.reader.pk,)),
+            reverse("library:lending_list"),
+            reverse("library:lending_retrieve", args=(self.lending.pk,)),
+            reverse("books-list"),
+            reverse("books-detail", args=(self.book.pk,)),
+            reverse("authors-list"),
+            reverse("authors-detail", args=(self.author.pk,)),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertLessEqual(self.role_queries(self.user, url), 1)
+        urls = [
+            reverse("users:users_retrieve", args=(self.reader.pk,)),
+            reverse("library:lending_list"),
+            reverse("library:lending_retrieve", args=(self.lending.pk,)),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertLessEqual(self.role_queries(self.reader, url), 1)
+
+    @override_settings(ROLES_CACHE_TIMEOUT=60)
+    def test_roles_shared_cache(self):
+        url = reverse("users:users_list")
+        self.assertEqual(self.role_queries(self.user, url), 1)
+        self.assertEqual(self.role_queries(self.user, url), 0)
+        self.group.user_set.remove(self.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TokenClaimsTestCase(APITestCase):
+    """Тестирование утверждений JWT и аутентификации запросов на чтение без обращения к БД."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create(
+            email="sv.bojad@gmail.com", reader_name="Бояджи С.В."
+        )
+        self.user.set_password("123qwe")
+        self.user.save()
+        self.group = Group.objects.create(name="librarian")
+        self.group.user_set.add(self.user)
+        self.author = Authors.objects.create(author="Джек Лондон")
+        self.book = Books.objects.create(name="Любовь к жизни", author=self.author)
+
+    def get_tokens(self):
+        url = reverse("users:login")
+        response = self.client.post(
+            url, {"email": "sv.bojad@gmail.com", "password": "123qwe"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_token_claims(self):
+        access = AccessToken(self.get_tokens()["access"])
+        self.assertEqual(access["email"], "sv.bojad@gmail.com")
+        self.assertEqual(access["reader_name"], "Бояджи С.В.")
+        self.assertEqual(access["role"], "librarian")
+
+    def test_stateless_read(self):
+        tokens = self.get_tokens()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        for url in (reverse("books-list"), reverse("users:users_list")):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                sql = " ".join(query["sql"] for query in queries)
+                self.assertNotIn('"auth_group"', sql)
+                self.assertNotIn('FROM "users_users" WHERE "users_users"."id"', sql)
+
+    def test_refresh_updates_role(self):
+        tokens = self.get_tokens()
+        self.group.user_set.remove(self.user)
+        response = self.client.post(
+            reverse("users:token_refresh"), {"refresh": tokens["refresh"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        access = response.json()["access"]
+        self.assertEqual(AccessToken(access)["role"], "reader")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = self.client.get(reverse("users:users_list"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_reader_own_profile(self):
+        self.group.user_set.remove(self.user)
+        other = Users.objects.create(email="reader@yandex.ru")
+        access = self.get_tokens()["access"]
+        self.assertEqual(AccessToken(access)["role"], "reader")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = self.client.get(
+            reverse("users:users_retrieve", args=(self.user.pk,))
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["email"], "sv.bojad@gmail.com")
+        response = self.client.get(reverse("users:users_retrieve", args=(other.pk,)))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
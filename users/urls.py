@@ -1,11 +1,11 @@
 from django.urls import path
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.views import TokenRefreshView
 
 from users.apps import UsersConfig
 from users.views import (UserCreateAPIView, UserDestroyAPIView,
                          UserListAPIView, UserRetrieveAPIView,
-                         UserTokenObtainPairView, UserUpdateAPIView)
+                         UserTokenObtainPairView, UserTokenRefreshView,
+                         UserUpdateAPIView)
 
 app_name = UsersConfig.name
 
@@ -22,7 +22,7 @@ urlpatterns = [
     ),
     path(
         "token/refresh/",
-        TokenRefreshView.as_view(permission_classes=(AllowAny,)),
+        UserTokenRefreshView.as_view(permission_classes=(AllowAny,)),
         name="token_refresh",
     ),
 ]
@@ -5,12 +5,14 @@ from rest_framework.generics import (CreateAPIView, DestroyAPIView,
                                      ListAPIView, RetrieveAPIView,
                                      UpdateAPIView)
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import (TokenObtainPairView,
+                                            TokenRefreshView)
 
 from library.models import Lending
 from users.models import Users
 from users.permissions import IsLibrarian
-from users.serializer import UserSerializer, UserTokenObtainPairSerializer
+from users.serializer import (UserSerializer, UserTokenObtainPairSerializer,
+                              UserTokenRefreshSerializer)
 
 
 class UserListAPIView(ListAPIView):
@@ -28,11 +30,12 @@ class UserRetrieveAPIView(RetrieveAPIView):
         else:
             lending_object_list = list(Users.objects.filter(pk=self.kwargs["pk"]))
             if len(lending_object_list) == 1:
-                if self.kwargs["pk"] != self.request.user.id:
+                # у пользователя из утверждений токена (ClaimsUser) id - строка
+                if str(self.kwargs["pk"]) != str(self.request.user.pk):
                     raise ValidationError(
                         "У вас недостаточно прав на просмтр учетных данных читателя !"
                     )
-                return Users.objects.filter(pk=self.request.user.id)
+                return Users.objects.filter(pk=self.request.user.pk)
             else:
                 raise ValidationError(
                     "Такой читатель не зарегистрирован в библиотеке !"
@@ -94,3 +97,7 @@ class UserCreateAPIView(CreateAPIView):
 
 class UserTokenObtainPairView(TokenObtainPairView):
     serializer_class = UserTokenObtainPairSerializer
+
+
+class UserTokenRefreshView(TokenRefreshView):
+    serializer_class = UserTokenRefreshSerializer